@@ -0,0 +1,59 @@
+"""Compare two benchmark result files, e.g. before and after a change.
+
+    python -m benchmarks.compare benchmarks/results/abc1234.json \\
+        benchmarks/results/def5678.json
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ("wall_seconds", "peak_rss_bytes")
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list:
+    """Return (section, name, metric, old, new, change, regressed) rows."""
+    rows = []
+    for section in ("e2e", "micro", "startup"):
+        old_results = baseline.get(section, {})
+        for name, new in current.get(section, {}).items():
+            old = old_results.get(name)
+            if not old or "error" in old or "error" in new:
+                continue
+            for metric in METRICS:
+                if not old.get(metric):
+                    continue
+                change = (new[metric] - old[metric]) / old[metric]
+                row = (section, name, metric, old[metric], new[metric], change)
+                rows.append((*row, change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Slowdown flagged (0.1 = 10%%)"
+    )
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    print(f"{baseline['commit']} -> {current['commit']}")
+
+    regressions = 0
+    for section, name, metric, old, new, change, regressed in compare(
+        baseline, current, args.threshold
+    ):
+        regressions += regressed
+        marker = "  REGRESSION" if regressed else ""
+        print(
+            f"{section:<5} {name:<26} {metric:<15} "
+            f"{old:>14.3f} {new:>14.3f} {change:>+8.1%}{marker}"
+        )
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
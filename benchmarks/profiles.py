@@ -0,0 +1,84 @@
+"""Compare rsync profiles on a real workload.
+
+Each profile copies the source into a fresh destination (cold run), then
+runs again after a share of the files was touched (warm run, the nightly
+case). Point --dest at the NAS mount to measure the real link:
+
+    python -m benchmarks.profiles --source /home/user/photos \\
+        --dest /mnt/nas-backup/bench --profiles default photos-large-files
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from src.backup_manager import BackupManager
+from src.profiles import PRESETS
+from src.utils import format_size
+
+
+def touch_files(source, fraction):
+    """Bump the mtime of every n-th file so rsync has to look at it again."""
+    step = max(1, round(1 / fraction)) if fraction > 0 else 0
+    count = 0
+    for root, _, files in os.walk(source):
+        for name in sorted(files):
+            count += 1
+            if step and count % step == 0:
+                os.utime(os.path.join(root, name))
+
+
+def run_profile(manager, source, dest, profile, touch_fraction):
+    if dest.exists():
+        shutil.rmtree(dest)
+    dir_config = {"profile": profile, "change_index": False}
+
+    results = {}
+    for run in ("cold", "warm"):
+        if run == "warm":
+            touch_files(source, touch_fraction)
+        started = time.monotonic()
+        stats = manager._backup_directory(source, str(dest), dir_config)
+        elapsed = time.monotonic() - started
+        results[run] = {
+            "seconds": round(elapsed, 3),
+            "files": stats.files_transferred,
+            "bytes": stats.size_bytes,
+            "bytes_per_second": stats.size_bytes / elapsed if elapsed else 0.0,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", required=True)
+    parser.add_argument("--dest", required=True, help="Scratch directory, wiped")
+    parser.add_argument("--profiles", nargs="+", default=sorted(PRESETS))
+    parser.add_argument("--touch", type=float, default=0.1, help="Warm run share")
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    source = args.source.rstrip("/") + "/"
+    manager = BackupManager({"backup": {"directories": [], "file_listing": False}})
+
+    results = {}
+    for profile in args.profiles:
+        dest = Path(args.dest) / profile
+        results[profile] = run_profile(manager, source, dest, profile, args.touch)
+        cold, warm = results[profile]["cold"], results[profile]["warm"]
+        print(
+            f"{profile:<22} cold {cold['seconds']:>8.2f}s "
+            f"({format_size(cold['bytes_per_second'])}/s)   "
+            f"warm {warm['seconds']:>8.2f}s"
+        )
+        shutil.rmtree(dest)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Benchmark the backup pipeline and save the results for the current commit.
+
+End-to-end scenarios run BackupManager.run_backup against a local destination
+on synthetic trees; micro-benchmarks time the rsync output and log handling
+on large generated files; startup benchmarks time CLI commands from a fresh
+interpreter. Every benchmark runs in its own process so peak RSS is measured
+per benchmark.
+
+    python -m benchmarks.run                  # everything, full size
+    python -m benchmarks.run --scale 0.1      # quick run
+    python -m benchmarks.run --only micro --output-size 2G
+    python -m benchmarks.run --only startup
+    python -m benchmarks.compare benchmarks/results/<old>.json <new>.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from src.backup_manager import BackupManager
+from src.rsync_output import RsyncOutputParser
+from src.utils import format_size
+
+from . import trees
+
+RESULTS_DIR = Path(__file__).parent / "results"
+SCHEMA_VERSION = 1
+
+
+def _peak_rss() -> dict:
+    # ru_maxrss is in KiB on Linux; children covers the rsync processes
+    return {
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "peak_child_rss_bytes": (
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        ),
+    }
+
+
+def _backup(source, destination, **backup_config):
+    config = {
+        "backup": {
+            "directories": [{"source": source, "destination": destination}],
+            **backup_config,
+        }
+    }
+    return BackupManager(config).run_backup()
+
+
+def _build(scenario, source, scale):
+    n = max(scale, 0.001)
+    if scenario == "many_tiny_files":
+        return trees.many_tiny_files(source, count=int(20000 * n))
+    if scenario == "few_huge_files":
+        return trees.few_huge_files(source, size=int(256 * trees.CHUNK_SIZE * n))
+    if scenario == "deep_nesting":
+        return trees.deep_nesting(source, depth=12 if scale >= 1 else 8)
+    if scenario in ("partial_changes", "partial_changes_indexed"):
+        return trees.many_tiny_files(source, count=int(20000 * n))
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def run_scenario(scenario, scale, workdir) -> dict:
+    """Build the tree, back it up and measure the timed backup."""
+    source = str(Path(workdir) / "src")
+    destination = str(Path(workdir) / "dest")
+    backup_config = {}
+    if scenario == "partial_changes_indexed":
+        backup_config["change_index"] = {"path": str(Path(workdir) / "index")}
+
+    _build(scenario, source, scale)
+    result = {}
+    if scenario.startswith("partial_changes"):
+        # The first backup is the baseline, the timed one is the nightly delta
+        _backup(source, destination, **backup_config)
+        result["files_modified"] = trees.modify_files(source)
+
+    source_bytes = trees.tree_size(source)
+    started = time.perf_counter()
+    stats = _backup(source, destination, **backup_config)
+    wall = time.perf_counter() - started
+
+    result.update(
+        {
+            "wall_seconds": wall,
+            "source_bytes": source_bytes,
+            "transferred_files": stats.total_files,
+            "transferred_bytes": stats.total_size,
+            "throughput_bytes_per_second": stats.total_size / wall if wall else 0.0,
+            "scan_bytes_per_second": source_bytes / wall if wall else 0.0,
+        }
+    )
+    return result
+
+
+def run_micro(name, size, workdir) -> dict:
+    """Time one rsync output/log helper on about ``size`` bytes of input."""
+    manager = BackupManager({"backup": {"directories": []}})
+    path = Path(workdir) / "input"
+    if name == "has_errors_in_log":
+        trees.write_rsync_log(path, size)
+    else:
+        trees.write_rsync_output(path, size)
+    input_bytes = path.stat().st_size
+
+    started = time.perf_counter()
+    if name == "stream_parser":
+        # What a backup does: feed rsync's stdout line by line
+        parser = RsyncOutputParser()
+        with open(path) as f:
+            for line in f:
+                parser.feed(line.rstrip("\n"))
+    elif name == "parse_rsync_stats":
+        manager._parse_rsync_stats(path.read_text(), "/src")
+    elif name == "extract_summary":
+        manager._extract_summary(path.read_text())
+    elif name == "has_errors_in_log":
+        manager._has_errors_in_log(path)
+    else:
+        raise ValueError(f"Unknown micro-benchmark: {name}")
+    wall = time.perf_counter() - started
+
+    return {
+        "wall_seconds": wall,
+        "input_bytes": input_bytes,
+        "throughput_bytes_per_second": input_bytes / wall if wall else 0.0,
+    }
+
+
+# CLI invocations timed from a fresh interpreter; {config} is a minimal config
+STARTUP = {
+    "import_main": ["-c", "import src.main"],
+    "help": ["-m", "src.main", "--help"],
+    "status": ["-m", "src.main", "status", "--config", "{config}"],
+}
+
+
+def run_startup(name, runs=5) -> dict:
+    """Best wall time of a CLI command over several fresh interpreters."""
+    with tempfile.TemporaryDirectory(prefix="nas-backup-bench-") as workdir:
+        config = Path(workdir) / "config.yaml"
+        config.write_text(
+            "backup:\n"
+            f"  directories: [{{source: {workdir}, destination: {workdir}/dest}}]\n"
+            f"  schedule: {{lock_file: {workdir}/lock}}\n"
+        )
+        args = [a.format(config=config) for a in STARTUP[name]]
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run(
+                [sys.executable, *args],
+                check=True,
+                capture_output=True,
+                cwd=Path(__file__).parent.parent,
+            )
+            timings.append(time.perf_counter() - started)
+    return {"wall_seconds": min(timings)}
+
+
+def _child(func, args, queue):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory(prefix="nas-backup-bench-") as workdir:
+        try:
+            result = func(*args, workdir)
+        except Exception as e:
+            queue.put({"error": f"{type(e).__name__}: {e}"})
+            return
+    result.update(_peak_rss())
+    queue.put(result)
+
+
+def measure(func, *args) -> dict:
+    """Run func(*args, workdir) in a fresh process and return its result."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_child, args=(func, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+SCENARIOS = (
+    "many_tiny_files",
+    "few_huge_files",
+    "deep_nesting",
+    "partial_changes",
+    "partial_changes_indexed",
+)
+MICRO = ("stream_parser", "parse_rsync_stats", "extract_summary", "has_errors_in_log")
+
+
+def parse_size(value: str) -> int:
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    value = value.strip().upper()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _rsync_version() -> str:
+    if not shutil.which("rsync"):
+        return ""
+    output = subprocess.run(["rsync", "--version"], capture_output=True, text=True)
+    return output.stdout.splitlines()[0] if output.stdout else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", choices=["e2e", "micro", "startup"])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS)
+    parser.add_argument("--scale", type=float, default=1.0, help="Tree size factor")
+    parser.add_argument(
+        "--output-size",
+        type=parse_size,
+        default=parse_size("256M"),
+        help="Size of the generated rsync output/log, e.g. 2G",
+    )
+    parser.add_argument("--output", help="Defaults to results/<commit>.json")
+    args = parser.parse_args()
+
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "rsync": _rsync_version(),
+        "scale": args.scale,
+        "e2e": {},
+        "micro": {},
+        "startup": {},
+    }
+
+    if args.only in (None, "e2e"):
+        if not report["rsync"]:
+            print("rsync not found, skipping end-to-end scenarios", file=sys.stderr)
+        else:
+            for scenario in args.scenarios or SCENARIOS:
+                result = measure(run_scenario, scenario, args.scale)
+                report["e2e"][scenario] = result
+                print(_format_line(scenario, result))
+
+    if args.only in (None, "micro"):
+        for name in MICRO:
+            result = measure(run_micro, name, args.output_size)
+            report["micro"][name] = result
+            print(_format_line(name, result))
+
+    if args.only in (None, "startup"):
+        for name in STARTUP:
+            result = run_startup(name)
+            report["startup"][name] = result
+            print(f"{name:<26} {result['wall_seconds'] * 1000:>8.1f}ms")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+def _format_line(name, result) -> str:
+    if "error" in result:
+        return f"{name:<26} ERROR {result['error']}"
+    return (
+        f"{name:<26} {result['wall_seconds']:>9.3f}s "
+        f"{format_size(result['throughput_bytes_per_second']):>10}/s "
+        f"peak RSS {format_size(result['peak_rss_bytes'])}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Synthetic source trees and rsync output for the benchmarks.
+
+Everything is generated from a fixed seed so runs on different commits see
+the same data.
+"""
+
+import os
+import random
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _write_file(path: Path, size: int, rng: random.Random):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, CHUNK_SIZE)
+            # Random bytes so compression doesn't make transfers look free
+            f.write(rng.randbytes(chunk))
+            remaining -= chunk
+
+
+def many_tiny_files(root, count=20000, per_dir=100, max_size=4096, seed=1) -> int:
+    """Lots of small documents spread over flat directories."""
+    rng = random.Random(seed)
+    total = 0
+    for i in range(count):
+        size = rng.randint(1, max_size)
+        _write_file(
+            Path(root) / f"dir{i // per_dir:04d}" / f"doc{i:06d}.txt", size, rng
+        )
+        total += size
+    return total
+
+
+def few_huge_files(root, count=4, size=256 * CHUNK_SIZE, seed=2) -> int:
+    """A handful of large media files."""
+    rng = random.Random(seed)
+    for i in range(count):
+        _write_file(Path(root) / f"video{i:02d}.mkv", size, rng)
+    return count * size
+
+
+def deep_nesting(root, depth=12, branching=2, files_per_dir=2, seed=3) -> int:
+    """A full tree of ``branching ** depth`` leaf directories."""
+    rng = random.Random(seed)
+    total = 0
+    level = [Path(root)]
+    for d in range(depth + 1):
+        for directory in level:
+            for i in range(files_per_dir):
+                size = rng.randint(1, 2048)
+                _write_file(directory / f"file{i}.dat", size, rng)
+                total += size
+        if d < depth:
+            level = [p / f"n{b}" for p in level for b in range(branching)]
+    return total
+
+
+def modify_files(root, fraction=0.05, seed=4) -> int:
+    """Rewrite a share of the files in place and add a few new ones.
+
+    Returns the number of files touched.
+    """
+    rng = random.Random(seed)
+    paths = sorted(
+        Path(dirpath) / name for dirpath, _, files in os.walk(root) for name in files
+    )
+    changed = rng.sample(paths, max(1, int(len(paths) * fraction))) if paths else []
+    for path in changed:
+        _write_file(path, path.stat().st_size + 1, rng)
+    for i in range(max(1, len(changed) // 10)):
+        _write_file(Path(root) / "new" / f"added{i:05d}.txt", 512, rng)
+    return len(changed)
+
+
+def tree_size(root) -> int:
+    return sum(
+        os.lstat(os.path.join(dirpath, name)).st_size
+        for dirpath, _, files in os.walk(root)
+        for name in files
+    )
+
+
+RSYNC_STATS = """
+Number of files: {files:,} (reg: {files:,}, dir: {dirs:,})
+Number of created files: {files:,}
+Number of deleted files: 0
+Number of regular files transferred: {files:,}
+Total file size: {size:,} bytes
+Total transferred file size: {size:,} bytes
+Literal data: {size:,} bytes
+Matched data: 0 bytes
+File list size: 0
+Total bytes sent: {size:,}
+Total bytes received: 0
+
+sent {size:,} bytes  received 0 bytes  1,000.00 bytes/sec
+total size is {size:,}  speedup is 1.00
+"""
+
+
+def write_rsync_output(path, size: int) -> int:
+    """Write ``rsync -av --stats`` output of about ``size`` bytes.
+
+    Returns the number of file lines.
+    """
+    lines = 0
+    written = 0
+    with open(path, "w") as f:
+        f.write("sending incremental file list\n")
+        while written < size:
+            line = f"photos/{lines // 1000:05d}/IMG_{lines:08d}.jpg\n"
+            if lines % 5000 == 0:
+                line = f"created directory photos/{lines // 1000:05d}\n"
+            f.write(line)
+            written += len(line)
+            lines += 1
+        f.write(RSYNC_STATS.format(files=lines, dirs=lines // 1000, size=lines * 4096))
+    return lines
+
+
+def write_rsync_log(path, size: int, errors: int = 0) -> int:
+    """Write an rsync --log-file of about ``size`` bytes.
+
+    ``errors`` error lines go at the very end, so a clean scan reads it all.
+    """
+    lines = 0
+    written = 0
+    with open(path, "w") as f:
+        while written < size:
+            line = (
+                f"2024/01/01 02:00:00 [4242] >f+++++++++ "
+                f"photos/{lines // 1000:05d}/IMG_{lines:08d}.jpg\n"
+            )
+            f.write(line)
+            written += len(line)
+            lines += 1
+        for i in range(errors):
+            f.write(
+                "2024/01/01 02:00:01 [4242] rsync: [sender] send_files failed "
+                f'to open "photos/locked{i}.jpg": Permission denied (13)\n'
+            )
+    return lines
@@ -1,6 +1,18 @@
-from .backup_manager import BackupManager
-from .email_sender import EmailSender
-from .nas_controller import NASController
+import importlib
 
 __all__ = ["BackupManager", "EmailSender", "NASController"]
 __version__ = "0.1.0"
+
+# Loaded on first access, so that e.g. `src.main status` doesn't import
+# every component and its dependencies
+_EXPORTS = {
+    "BackupManager": ".backup_manager",
+    "EmailSender": ".email_sender",
+    "NASController": ".nas_controller",
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
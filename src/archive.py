@@ -0,0 +1,244 @@
+import logging
+import os
+import re
+import signal
+import subprocess
+import tempfile
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from .timing import span
+from .utils import CommandError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = "%Y-%m-%d_%H%M%S"
+PARTIAL_SUFFIX = ".partial"
+# Written by tar --totals to stderr
+TOTALS_PATTERN = re.compile(r"Total bytes written: (\d+)")
+
+
+@dataclass
+class ArchiveResult:
+    name: str
+    incremental: bool
+    files: int = 0
+    # Size of the tar stream, before compression
+    source_bytes: int = 0
+    archive_bytes: int = 0
+    # tar's complaints about files that changed or vanished while read
+    warnings: str = ""
+
+
+class ArchiveWriter:
+    """Writes a directory as compressed, optionally encrypted tar archives.
+
+    ``tar | zstd -T<threads> [| age]`` runs as a pipeline of processes that
+    write straight to a file on the NAS mount: one large sequential write
+    instead of a round trip per file, which is what makes trees of tiny files
+    slow over SMB. The pipes between the processes bound the data in flight,
+    and the file only gets its final name once every stage succeeded.
+
+    Archives are named ``<timestamp>-full.tar.zst`` or
+    ``<timestamp>-incremental.tar.zst`` (``.age`` appended when encrypted).
+    An incremental archive holds the files changed since the previous
+    archive; restoring means extracting the last full one and then every
+    later incremental one in order. Deletions are not recorded, so files
+    deleted since the full archive come back on restore.
+    """
+
+    def __init__(self, destination, archive_config=None):
+        self.destination = Path(destination)
+        config = archive_config if isinstance(archive_config, dict) else {}
+        self.level = config.get("level", 3)
+        if not 1 <= self.level <= 19:
+            raise ValueError(
+                f"Archive zstd level must be between 1 and 19: {self.level}"
+            )
+        # 0 lets zstd use one thread per core
+        self.threads = config.get("threads", 0)
+        encrypt = config.get("encrypt") or {}
+        self.recipients = list(encrypt.get("recipients") or [])
+        self.recipients_file = encrypt.get("recipients_file")
+        if encrypt and not (self.recipients or self.recipients_file):
+            raise ValueError("Archive encryption needs recipients or recipients_file")
+
+    @property
+    def encrypted(self) -> bool:
+        return bool(self.recipients or self.recipients_file)
+
+    def archive_name(self, now: datetime, incremental: bool) -> str:
+        kind = "incremental" if incremental else "full"
+        name = f"{now.strftime(ARCHIVE_FORMAT)}-{kind}.tar.zst"
+        return name + ".age" if self.encrypted else name
+
+    def archives(self) -> List[str]:
+        """Finished archives, oldest first."""
+        if not self.destination.is_dir():
+            return []
+        return sorted(
+            p.name
+            for p in self.destination.iterdir()
+            if ".tar.zst" in p.name and not p.name.endswith(PARTIAL_SUFFIX)
+        )
+
+    def commands(self, source: str, index_file, files_from=None) -> List[List[str]]:
+        # Same layout as rsync: "dir" is archived as dir/..., "dir/" as ./...
+        if source.endswith("/"):
+            base, member = source, "."
+        else:
+            base = os.path.dirname(os.path.abspath(source))
+            member = os.path.basename(source)
+        tar = [
+            "tar",
+            "--create",
+            "--file=-",
+            "--totals",
+            "--verbose",
+            f"--index-file={index_file}",
+            f"--directory={base}",
+        ]
+        if files_from is not None:
+            tar.extend(
+                ["--null", "--verbatim-files-from", f"--files-from={files_from}"]
+            )
+        else:
+            tar.append(member)
+        commands = [
+            tar,
+            ["zstd", f"-{self.level}", f"-T{self.threads}", "-q", "-c"],
+        ]
+        if self.encrypted:
+            age = ["age", "--encrypt"]
+            for recipient in self.recipients:
+                age.extend(["-r", recipient])
+            if self.recipients_file:
+                age.extend(["-R", self.recipients_file])
+            commands.append(age)
+        return commands
+
+    def clean_partial(self):
+        """Remove archives left behind by an interrupted run."""
+        if self.destination.is_dir():
+            for path in self.destination.glob(f"*{PARTIAL_SUFFIX}"):
+                logger.info("Removing unfinished archive %s", path)
+                path.unlink()
+
+    def write(
+        self,
+        source: str,
+        paths: Optional[List[str]] = None,
+        now: Optional[datetime] = None,
+        dry_run=False,
+    ) -> ArchiveResult:
+        """Archive source, or only ``paths`` (relative to it) incrementally."""
+        incremental = paths is not None
+        result = ArchiveResult(
+            self.archive_name(now or datetime.now(), incremental), incremental
+        )
+        target = self.destination / result.name
+        partial = target.with_name(target.name + PARTIAL_SUFFIX)
+
+        with tempfile.TemporaryDirectory(prefix="nas-backup-archive-") as tmp_dir:
+            files_from = None
+            if incremental:
+                prefix = "" if source.endswith("/") else os.path.basename(source)
+                files_from = Path(tmp_dir) / "files.list"
+                files_from.write_bytes(
+                    b"".join(
+                        os.fsencode(os.path.join(prefix, p)) + b"\0" for p in paths
+                    )
+                )
+            index_file = Path(tmp_dir) / "index.txt"
+            commands = self.commands(source, index_file, files_from)
+            display = " | ".join(" ".join(cmd) for cmd in commands) + f" > {target}"
+            if dry_run:
+                logger.info("[DRY RUN] Would execute: %s", display)
+                return result
+
+            self.destination.mkdir(parents=True, exist_ok=True)
+            self.clean_partial()
+            logger.info("Executing: %s", display)
+            try:
+                with span("command:archive"):
+                    stderrs = self._run_pipeline(commands, partial)
+            except BaseException:
+                partial.unlink(missing_ok=True)
+                raise
+
+            with open(index_file, errors="replace") as f:
+                # Directories are listed with a trailing slash
+                result.files = sum(
+                    1 for line in f if not line.rstrip("\n").endswith("/")
+                )
+        match = TOTALS_PATTERN.search(stderrs[0])
+        result.source_bytes = int(match.group(1)) if match else 0
+        result.warnings = stderrs[0][: match.start()].strip() if match else stderrs[0]
+        os.replace(partial, target)
+        result.archive_bytes = target.stat().st_size
+        return result
+
+    @staticmethod
+    def _run_pipeline(commands: List[List[str]], output: Path) -> List[str]:
+        """Run commands piped into each other, the last one writing output.
+
+        Returns every command's stderr; raises CommandError naming the stage
+        that failed. tar's exit status 1 (a file changed while it was read)
+        still yields a usable archive and is not an error.
+        """
+        processes = []
+        with ExitStack() as stack:
+            out = stack.enter_context(open(output, "wb"))
+            stderr_files = [
+                stack.enter_context(tempfile.TemporaryFile(mode="w+")) for _ in commands
+            ]
+            try:
+                stdin = None
+                for i, cmd in enumerate(commands):
+                    last = i == len(commands) - 1
+                    process = subprocess.Popen(
+                        cmd,
+                        stdin=stdin,
+                        stdout=out if last else subprocess.PIPE,
+                        stderr=stderr_files[i],
+                    )
+                    if stdin is not None:
+                        # Only the next stage may hold the pipe, so that it
+                        # sees EOF and a failing reader stops the writer
+                        stdin.close()
+                    stdin = process.stdout
+                    processes.append(process)
+                returncodes = [process.wait() for process in processes]
+            except BaseException:
+                for process in processes:
+                    process.kill()
+                    process.wait()
+                raise
+
+            stderrs = []
+            for stderr_file in stderr_files:
+                stderr_file.seek(0)
+                stderrs.append(stderr_file.read())
+
+        failed = [
+            (os.path.basename(cmd[0]), returncode, stderr)
+            for cmd, returncode, stderr in zip(commands, returncodes, stderrs)
+            if returncode != 0 and not (cmd[0] == "tar" and returncode == 1)
+        ]
+        if failed:
+            # When a stage fails, the stages writing into it die of SIGPIPE;
+            # blame the one that failed on its own
+            name, returncode, stderr = next(
+                (f for f in failed if f[1] != -signal.SIGPIPE), failed[0]
+            )
+            raise CommandError(
+                f"Archive stage {name} failed with exit status {returncode}: "
+                f"{stderr.strip()}",
+                returncode,
+                "",
+                stderr,
+            )
+        return stderrs
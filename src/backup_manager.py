@@ -1,35 +1,441 @@
+import contextvars
+import json
 import logging
+import os
 import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
+from .archive import ArchiveWriter
+from .change_index import ChangeIndex, ChangeSet, TreeScan, scan_tree
+from .checkpoint import DEFAULT_MAX_AGE_HOURS, Checkpoint
+from .dedup import store_for
+from .error_log import ErrorLogAnalyzer, ErrorSummary, rotate_logs
 from .models import BackupStats, DirectoryStats
-from .utils import CommandError, run_command
+from .preflight import PreflightCheck
+from .profiles import load_profiles, resolve_profile
+from .progress import ProgressTracker, create_progress_sink
+from .rsync_output import RsyncOutputParser
+from .snapshots import SnapshotSet
+from .throttle import Throttle
+from .timing import span
+from .transport import Transport
+from .utils import CommandError, DeadlineReached, format_size, stream_command
+from .verify import Verifier, synced_path, verifier_for
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class PreparedDirectory:
+    """Local-only work for one directory, done before the NAS is reachable."""
+
+    profile_args: List[str]
+    shards: List[List[str]] = field(default_factory=list)
+    index: Optional[ChangeIndex] = None
+    index_key: Optional[str] = None
+    scan: Optional[TreeScan] = None
+    changes: Optional[ChangeSet] = None
+    duration_seconds: float = 0.0
+    # Restored from the checkpoint of an interrupted job
+    completed: Optional[DirectoryStats] = None
+    file_lists: Optional[List[List[str]]] = None
+    shards_done: Dict[int, RsyncOutputParser] = field(default_factory=dict)
+
+
+class SourceCache:
+    """Results of walking the sources, shared by the backup managers of a job.
+
+    With several targets each source is scanned and sharded only once,
+    however many targets it is backed up to.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._locks: Dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, compute):
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # Managers asking for the same source wait for the first one's walk
+        with lock:
+            if key not in self._results:
+                self._results[key] = compute()
+            return self._results[key]
+
+
 class BackupManager:
-    def __init__(self, config, dry_run=False):
+    def __init__(self, config, dry_run=False, progress_sink=None, resume=False):
         self.config = config
         self.dry_run = dry_run
+        self.resume = resume
+        # Set per job when several managers back up the same sources
+        self.source_cache: Optional[SourceCache] = None
+        # Set by the orchestrator, lets preflight ask a remote NAS for its space
+        self.remote_free_space: Optional[Callable[[List[str]], List[int]]] = None
+        self.checkpoint_config = self.config["backup"].get("checkpoint") or {}
+        self._checkpoint: Optional[Checkpoint] = None
+        self.progress_config = self.config["backup"].get("progress") or {}
+        self.progress_sink = progress_sink or create_progress_sink(self.progress_config)
+        self.error_log_config = self.config["backup"].get("error_logs") or {}
+        self.verify_config = self.config["backup"].get("verify") or {}
+        self.dedup_config = self.config["backup"].get("dedup") or {}
+        throttle_config = self.config["backup"].get("throttle")
+        self.throttle = Throttle(throttle_config) if throttle_config else None
+        self.transport = Transport.from_config(config)
+        self.profiles = load_profiles(self.config["backup"])
+        # Fail on a bad profile before the NAS is woken up
+        for dir_config in self.config["backup"]["directories"]:
+            profile = resolve_profile(dir_config.get("profile"), self.profiles)
+            if dir_config.get("snapshots"):
+                if self.transport.remote:
+                    # Snapshots are renamed and pruned through the mount
+                    raise ValueError(
+                        f"Snapshots of {dir_config['source']} need the mount "
+                        f"transport, not {self.transport.type}"
+                    )
+                if "--inplace" in profile.rsync_args():
+                    # A resumed snapshot hard-links files of the previous one,
+                    # writing them in place would change the old snapshot too
+                    raise ValueError(
+                        f"Snapshots of {dir_config['source']} can't use a profile "
+                        "with inplace"
+                    )
+                SnapshotSet(dir_config["destination"], dir_config["snapshots"])
+            if dir_config.get("dedup"):
+                if self.transport.remote or dir_config.get("snapshots"):
+                    # Chunks and manifests are written through the mount
+                    raise ValueError(
+                        f"Dedup backups of {dir_config['source']} need the mount "
+                        "transport and can't be combined with snapshots"
+                    )
+                store_for(self.dedup_config, dir_config)
+                continue
+            if dir_config.get("archive"):
+                if self.transport.remote or dir_config.get("snapshots"):
+                    # Archives are written through the mount
+                    raise ValueError(
+                        f"Archives of {dir_config['source']} need the mount "
+                        "transport and can't be combined with snapshots"
+                    )
+                ArchiveWriter(dir_config["destination"], dir_config["archive"])
+                continue
+            if self._verifier(dir_config) is not None and self.transport.remote:
+                raise ValueError(
+                    f"Verifying {dir_config['source']} needs the mount transport, "
+                    f"not {self.transport.type}"
+                )
+
+    def prepare(self, sources=None) -> Dict[str, PreparedDirectory]:
+        """Scan the sources and plan shards ahead of run_backup.
+
+        Only local sources and the local change index are read, so this can
+        run while the NAS is still booting.
+        """
+        self._open_checkpoint()
+        return self._prepare_all(self._directories(sources))
+
+    def _prepare_all(self, directories) -> Dict[str, PreparedDirectory]:
+        parallel = self.config["backup"].get("parallel") or {}
+        prepared = self._map_concurrently(
+            lambda d: self._prepare_directory(d["source"], d["destination"], d),
+            directories,
+            parallel.get("max_workers", 1),
+        )
+        return {d["source"]: p for d, p in zip(directories, prepared)}
+
+    def run_backup(
+        self, prepared: Optional[Dict[str, PreparedDirectory]] = None, sources=None
+    ):
+        """Back up the configured directories and return BackupStats.
+
+        ``prepared`` is the result of an earlier prepare() call; directories
+        missing from it are prepared on the fly. ``sources`` limits the run to
+        those directories (all of them by default).
+        """
+        checkpoint = self._open_checkpoint()
+        try:
+            stats = self._run_directories(prepared or {}, self._directories(sources))
+        finally:
+            # The next job reads whatever is left of the checkpoint from disk
+            self._checkpoint = None
+        if checkpoint is not None:
+            checkpoint.clear()
+        return stats
 
-    def run_backup(self) -> BackupStats:
+    def _open_checkpoint(self) -> Optional[Checkpoint]:
+        if self._checkpoint is None and self.checkpoint_config and not self.dry_run:
+            self._checkpoint = Checkpoint.open(
+                self.checkpoint_config["path"],
+                resume=self.resume,
+                max_age_hours=self.checkpoint_config.get(
+                    "max_age_hours", DEFAULT_MAX_AGE_HOURS
+                ),
+            )
+            # --resume only applies to the job that was interrupted
+            self.resume = False
+        return self._checkpoint
+
+    def _directories(self, sources=None) -> List[dict]:
+        directories = self.config["backup"]["directories"]
+        if sources is None:
+            return directories
+        return [d for d in directories if d["source"] in sources]
+
+    def _run_directories(self, prepared, configured) -> BackupStats:
+        started = time.monotonic()
         stats = BackupStats()
+        parallel = self.config["backup"].get("parallel") or {}
+        max_workers = parallel.get("max_workers", 1)
 
-        for dir_config in self.config["backup"]["directories"]:
-            dir_stats = self._backup_directory(
-                dir_config["source"], dir_config["destination"]
+        directories, skipped, estimates = configured, {}, {}
+        if self.config["backup"].get("preflight"):
+            # Estimates come from the scans, so scan what prepare() didn't
+            missing = [d for d in configured if d["source"] not in prepared]
+            prepared = {**prepared, **self._prepare_all(missing)}
+            logger.info("Running preflight capacity check")
+            with span("preflight"):
+                directories, skipped, estimates = PreflightCheck(
+                    self.config,
+                    dry_run=self.dry_run,
+                    remote_free_space=self.remote_free_space,
+                ).run(configured, prepared)
+
+        if max_workers > 1 and len(directories) > 1:
+            results = self._run_parallel(
+                directories, max_workers, parallel.get("group_by", []), prepared
             )
+        else:
+            results = [
+                self._backup_entry(d, prepared.get(d["source"])) for d in directories
+            ]
+
+        # Report in config order, including directories skipped by preflight
+        by_source = {**skipped, **{d.source: d for d in results}}
+        for dir_config in configured:
+            dir_stats = by_source.get(dir_config["source"])
+            if dir_stats is None:
+                continue
+            if dir_stats.estimated_bytes is None:
+                dir_stats.estimated_bytes = estimates.get(dir_stats.source)
             stats.directories[dir_stats.source] = dir_stats
             stats.total_files += dir_stats.files_transferred
             stats.total_size += dir_stats.size_bytes
 
+        stats.duration_seconds = time.monotonic() - started
         return stats
 
-    def _backup_directory(self, source, destination) -> DirectoryStats:
+    def _run_parallel(self, directories, max_workers, group_by, prepared=None) -> list:
+        """Back up directories concurrently, returning stats in config order.
+
+        Directories that share a group (same source device and/or destination,
+        depending on ``group_by``) run one after another in the same worker so
+        they never compete for the same disk.
+        """
+        groups = self._group_directories(directories, group_by)
+        logger.info(
+            "Running %d directories in %d groups with up to %d workers",
+            len(directories),
+            len(groups),
+            max_workers,
+        )
+
+        prepared = prepared or {}
+
+        def run_group(indices):
+            return [
+                (i, self._backup_entry(d, prepared.get(d["source"])))
+                for i, d in ((i, directories[i]) for i in indices)
+            ]
+
+        results = [None] * len(directories)
+        for group_results in self._map_concurrently(run_group, groups, max_workers):
+            for i, dir_stats in group_results:
+                results[i] = dir_stats
+
+        return results
+
+    def _map_concurrently(self, func, items, max_workers) -> list:
+        """Apply func to items in a thread pool, returning results in order.
+
+        The first failure (in item order) is re-raised once running work has
+        finished; work that has not started yet is cancelled.
+        """
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+        try:
+            # Copy the context so timing spans nest under the submitting phase
+            futures = [
+                executor.submit(contextvars.copy_context().run, func, item)
+                for item in items
+            ]
+            results = [future.result() for future in futures]
+        except Exception:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+        return results
+
+    def _group_directories(self, directories, group_by) -> list:
+        """Group directory indices that must not run concurrently."""
+        groups = []
+        owners = {}  # grouping key -> index into groups
+
+        for i, dir_config in enumerate(directories):
+            keys = []
+            if "device" in group_by:
+                keys.append(("device", self._device_of(dir_config["source"])))
+            if "destination" in group_by:
+                dest = os.path.normpath(dir_config["destination"])
+                keys.append(("destination", dest))
+
+            matched = sorted({owners[k] for k in keys if k in owners})
+            if not matched:
+                groups.append([i])
+                target = len(groups) - 1
+            else:
+                # Merge every group sharing one of our keys into the first one
+                target = matched[0]
+                for other in matched[1:]:
+                    groups[target].extend(groups[other])
+                    groups[other] = []
+                    for key, owner in owners.items():
+                        if owner == other:
+                            owners[key] = target
+                groups[target].append(i)
+
+            for key in keys:
+                owners[key] = target
+
+        return [sorted(group) for group in groups if group]
+
+    def _device_of(self, path):
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            # Unknown device: keep the directory in its own group
+            return os.path.normpath(path)
+
+    def _backup_entry(self, dir_config, prepared=None) -> DirectoryStats:
+        with span(f"directory:{dir_config['source']}"):
+            return self._backup_directory(
+                dir_config["source"],
+                dir_config["destination"],
+                dir_config,
+                prepared=prepared,
+            )
+
+    def _prepare_directory(self, source, destination, dir_config) -> PreparedDirectory:
+        started = time.monotonic()
+        profile_args = resolve_profile(
+            dir_config.get("profile"), self.profiles
+        ).rsync_args()
+        prepared = PreparedDirectory(
+            profile_args=profile_args,
+            index_key=self._index_key(source, destination, profile_args),
+        )
+
+        checkpoint = self._checkpoint
+        if checkpoint is not None:
+            prepared.completed = checkpoint.completed(source, prepared.index_key)
+            pending = checkpoint.pending(source, prepared.index_key)
+            if pending is not None:
+                prepared.file_lists, prepared.shards_done = pending
+            if prepared.completed or pending:
+                # Nothing to scan, the interrupted job already did that
+                return prepared
+
+        index = None
+        # A snapshot must contain every file, not just the changed ones; the
+        # dedup store keeps its own index of unchanged files
+        if (
+            dir_config.get("change_index", True)
+            and not dir_config.get("snapshots")
+            and not dir_config.get("dedup")
+        ):
+            index = self._change_index()
+        if index is not None:
+            with span("scan"):
+                prepared.scan = self._cached(
+                    ("scan", source), lambda: scan_tree(source)
+                )
+            prepared.index = index
+            prepared.changes = index.diff(prepared.index_key, prepared.scan)
+            logger.info("Change index for %s: %s", source, prepared.changes.reason)
+
+        sharding = dir_config.get("sharding") or {}
+        if dir_config.get("dedup") or dir_config.get("archive"):
+            sharding = {}
+        if sharding and not (prepared.changes and prepared.changes.unchanged):
+            prepared.shards = self._cached(
+                ("shards", source, json.dumps(sharding, sort_keys=True)),
+                lambda: self._plan_shards(source, sharding),
+            )
+
+        prepared.duration_seconds = time.monotonic() - started
+        return prepared
+
+    def _cached(self, key: tuple, compute):
+        if self.source_cache is None:
+            return compute()
+        return self.source_cache.get(key, compute)
+
+    def _backup_directory(
+        self, source, destination, dir_config=None, prepared=None
+    ) -> DirectoryStats:
+        dir_config = dir_config or {}
+        if prepared is None:
+            prepared = self._prepare_directory(source, destination, dir_config)
+        # Time spent preparing counts towards the directory, wherever it ran
+        started = time.monotonic() - prepared.duration_seconds
+        profile_args, changes = prepared.profile_args, prepared.changes
+        checkpoint = self._checkpoint
+
+        if prepared.completed is not None:
+            logger.info("Skipping %s, it completed before the interruption", source)
+            return prepared.completed
+
+        if changes is not None and changes.unchanged:
+            return self._directory_done(
+                source,
+                prepared,
+                DirectoryStats(
+                    source=source,
+                    files_transferred=0,
+                    size_bytes=0,
+                    status="unchanged",
+                    details="No changes since the last backup",
+                    duration_seconds=time.monotonic() - started,
+                ),
+            )
+
+        if dir_config.get("dedup"):
+            return self._directory_done(
+                source, prepared, self._dedup_directory(source, dir_config, started)
+            )
+        if dir_config.get("archive"):
+            return self._directory_done(
+                source,
+                prepared,
+                self._archive_directory(
+                    source, destination, dir_config, prepared, started
+                ),
+            )
+
+        # Remote transports write straight to the NAS; logs then stay local
+        target = self.transport.destination(destination)
+        dest_path = Path(
+            self.transport.log_dir if self.transport.remote else destination
+        )
+
         # Create destination directory if it doesn't exist
-        dest_path = Path(destination)
         if not self.dry_run:
             try:
                 dest_path.mkdir(parents=True, exist_ok=True)
@@ -38,74 +444,468 @@ class BackupManager:
                 logger.error("Failed to create directory %s: %s", dest_path, e)
                 raise
 
+        snapshots = None
+        if dir_config.get("snapshots"):
+            snapshots = SnapshotSet(destination, dir_config["snapshots"])
+            target = str(snapshots.incomplete)
+            profile_args = [*profile_args, *snapshots.rsync_args()]
+
         # Updated rsync command with error handling and timestamped log file
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_file = dest_path / f"rsync_errors_{timestamp}.log"
+        log_name = f"rsync_errors_{timestamp}.log"
+        if self.transport.remote:
+            # Several directories share the local log dir
+            slug = re.sub(r"[^\w.-]+", "_", destination.strip("/"))
+            log_name = f"rsync_errors_{slug}_{timestamp}.log"
+        log_file = dest_path / log_name
+
+        sharding = dir_config.get("sharding") or {}
+        shards = prepared.shards
+        if prepared.file_lists is not None:
+            file_lists = prepared.file_lists
+            logger.info(
+                "Resuming %s with %d of %d file lists left",
+                source,
+                len(file_lists) - len(prepared.shards_done),
+                len(file_lists),
+            )
+        else:
+            if changes is not None and not changes.full:
+                # Only hand the changed paths to rsync, split along the shards
+                file_lists = self._split_paths(changes.paths, shards)
+            else:
+                file_lists = shards if len(shards) > 1 else None
+            if checkpoint is not None:
+                checkpoint.start_directory(source, prepared.index_key, file_lists)
+
+        if file_lists:
+            on_shard_done = None
+            if checkpoint is not None:
+
+                def on_shard_done(i, parser):
+                    checkpoint.shard_done(source, i, parser)
+
+            parser = self._run_file_lists(
+                source,
+                target,
+                log_file,
+                file_lists,
+                sharding.get("max_workers", len(file_lists)),
+                profile_args,
+                done=prepared.shards_done,
+                on_shard_done=on_shard_done,
+            )
+        else:
+            cmd = self._rsync_command(source, target, log_file, profile_args)
+            parser = self._run_rsync(cmd, source)
+
+        # Check error log if it exists and not in dry-run mode
+        error_log, error_summary = None, None
+        if not self.dry_run and log_file.exists():
+            error_summary = self._analyze_log(log_file)
+            if error_summary.total:
+                logger.warning(
+                    "Rsync reported %d errors (%s). Check %s for details",
+                    error_summary.total,
+                    error_summary.format(),
+                    log_file,
+                )
+                error_log = log_file
+        if not self.dry_run:
+            self._rotate_logs(dest_path, exclude=[log_file])
+
+        dir_stats = self._build_directory_stats(
+            parser, source, error_log=error_log, error_summary=error_summary
+        )
+        if snapshots is not None:
+            # Unchanged files were hard-linked from the previous snapshot
+            dir_stats.linked_bytes = max(parser.total_size_bytes - parser.size_bytes, 0)
+            if not self.dry_run:
+                dir_stats.snapshot = snapshots.finish()
+            with span("prune"):
+                snapshots.prune(dry_run=self.dry_run)
+
+        verifier = self._verifier(dir_config)
+        if (
+            verifier is not None
+            and not self.dry_run
+            and dir_stats.status in ("success", "completed_with_errors")
+        ):
+            root = os.path.join(destination, dir_stats.snapshot or "")
+            with span("verify"):
+                dir_stats.verification = verifier.verify(
+                    source,
+                    synced_path(source, root),
+                    files=self._scanned_files(prepared.scan),
+                )
+            if dir_stats.verification and dir_stats.verification.failed:
+                dir_stats.status = "completed_with_errors"
+        dir_stats.duration_seconds = time.monotonic() - started
+
+        # Only a clean run may become the baseline for the next comparison
+        if changes is not None and dir_stats.status == "success":
+            prepared.index.commit(prepared.index_key, prepared.scan, full=changes.full)
+
+        return self._directory_done(source, prepared, dir_stats)
+
+    def _dedup_directory(self, source, dir_config, started) -> DirectoryStats:
+        store = store_for(self.dedup_config, dir_config)
+        with span("dedup"):
+            result = store.backup(source, dry_run=self.dry_run)
+        status = "dry-run" if self.dry_run else "success"
+        if result.errors:
+            logger.warning(
+                "%d files of %s could not be stored, e.g. %s: %s",
+                len(result.errors),
+                source,
+                *result.errors[0],
+            )
+            status = "completed_with_errors"
+        details = (
+            f"{result.files} files, {result.files_chunked} chunked, "
+            f"{result.new_chunks} new chunks"
+        )
+        if result.errors:
+            details += f", {len(result.errors)} unreadable"
+        if result.skipped:
+            details += f", {len(result.skipped)} special files skipped"
+        return DirectoryStats(
+            source=source,
+            files_transferred=result.files_chunked,
+            size_bytes=result.new_bytes,
+            status=status,
+            details=details,
+            duration_seconds=time.monotonic() - started,
+            manifest=result.manifest,
+            deduplicated_bytes=result.deduplicated_bytes,
+        )
+
+    def _archive_directory(
+        self, source, destination, dir_config, prepared, started
+    ) -> DirectoryStats:
+        writer = ArchiveWriter(destination, dir_config["archive"])
+        changes = prepared.changes
+        # Without an earlier archive there is nothing to be incremental to
+        paths = None
+        if changes is not None and not changes.full and writer.archives():
+            paths = changes.paths
+        with span("archive"):
+            result = writer.write(source, paths, dry_run=self.dry_run)
+
+        kind = "incremental" if result.incremental else "full"
+        status = "dry-run" if self.dry_run else "success"
+        details = f"{kind} archive of {result.files} files"
+        if result.source_bytes:
+            details += (
+                f", {format_size(result.source_bytes)} compressed to "
+                f"{format_size(result.archive_bytes)}"
+            )
+        if result.warnings:
+            logger.warning("tar reported for %s: %s", source, result.warnings)
+            status = "completed_with_errors"
+            details += f" | {result.warnings.splitlines()[0]}"
+        dir_stats = DirectoryStats(
+            source=source,
+            files_transferred=result.files,
+            size_bytes=result.archive_bytes,
+            status=status,
+            details=details,
+            duration_seconds=time.monotonic() - started,
+            archive=None if self.dry_run else result.name,
+        )
+        if changes is not None and status == "success":
+            prepared.index.commit(prepared.index_key, prepared.scan, full=paths is None)
+        return dir_stats
+
+    def _verifier(self, dir_config) -> Optional[Verifier]:
+        return verifier_for(self.verify_config, dir_config)
+
+    @staticmethod
+    def _scanned_files(scan) -> Optional[List[Tuple[str, int]]]:
+        if scan is None:
+            return None
+        return [
+            (os.path.join(rel, name), meta[0])
+            for rel, node in scan.nodes.items()
+            for name, meta in node.files.items()
+        ]
+
+    def _directory_done(self, source, prepared, dir_stats) -> DirectoryStats:
+        if self._checkpoint is not None:
+            self._checkpoint.directory_done(source, prepared.index_key, dir_stats)
+        return dir_stats
+
+    def _rsync_command(
+        self, source, destination, log_file, profile_args=(), files_from=None
+    ) -> list:
+        # Without the per-file listing rsync only prints the --stats section
+        verbose = self.config["backup"].get("file_listing", True)
         cmd = [
             "rsync",
-            "-av",
+            "-av" if verbose else "-a",
             "--stats",
             "--ignore-errors",  # Continue on error
             "--partial",  # Keep partially transferred files
             "--safe-links",  # Ignore symlinks that point outside source tree
             f"--log-file={log_file}",  # Log errors to file
+            "--info=progress2" if self.progress_sink else None,
             "--dry-run" if self.dry_run else None,
-            source,
-            destination,
+            *self.transport.rsync_args(),
+            *profile_args,
         ]
-        cmd = [c for c in cmd if c is not None]
+        if files_from is not None:
+            # --files-from turns off the recursion implied by -a
+            cmd.extend([f"--files-from={files_from}", "--recursive"])
+        cmd.extend([source, destination])
+        return [c for c in cmd if c is not None]
+
+    def _run_rsync(self, cmd, label) -> RsyncOutputParser:
+        # Parse the output while rsync runs instead of buffering all of stdout
+        parser = RsyncOutputParser()
+        tracker = None
+        if self.progress_sink:
+            tracker = ProgressTracker(
+                label,
+                self.progress_sink,
+                interval=self.progress_config.get("interval", 10),
+            )
+
+        while True:
+            attempt = RsyncOutputParser()
+            on_line = attempt.feed
+            if tracker:
+
+                def on_line(line, attempt=attempt):
+                    attempt.feed(line)
+                    tracker.feed(line)
+
+            run_cmd, deadline = cmd, None
+            if self.throttle is not None:
+                now = datetime.now()
+                run_cmd, deadline = self.throttle.apply(cmd, now)
+                window = self.throttle.window_at(now)
+                if window is not None:
+                    logger.info("Throttling %s: %s", label, window.describe())
+            try:
+                stream_command(
+                    run_cmd,
+                    "Rsync failed",
+                    on_line,
+                    env=self.transport.env(),
+                    deadline=deadline,
+                )
+            except DeadlineReached:
+                # A stopped rsync prints no --stats, so what it sent before the
+                # restart is missing from the totals
+                logger.info("Throttle window changed, restarting rsync for %s", label)
+                parser.merge(attempt)
+                continue
+            except CommandError as e:
+                if e.returncode != 23:  # 23: Partial transfer due to error
+                    raise
+            parser.merge(attempt)
+            break
+        if tracker:
+            tracker.finish()
+
+        return parser
+
+    def _plan_shards(self, source, sharding) -> list:
+        """Split the top-level entries of source into balanced shards.
+
+        Entries are weighed by total size or file count (``balance_by``) and
+        assigned largest first to the currently lightest shard.
+        """
+        shard_count = sharding.get("shards", 1)
+        balance_by = sharding.get("balance_by", "size")
+        if balance_by not in ("size", "count"):
+            raise ValueError(f"Unsupported shard balance_by: {balance_by}")
+        if shard_count < 2:
+            return []
 
         try:
-            stdout, _ = run_command(cmd, "Rsync failed")
-            error_log = None
-        except CommandError as e:
-            if e.returncode == 23:  # Partial transfer due to error
-                stdout = e.stdout
-            else:
-                raise
+            entries = [
+                (self._entry_weight(entry, balance_by), entry.name)
+                for entry in os.scandir(source)
+            ]
+        except OSError as e:
+            logger.warning("Cannot shard %s, running a single job: %s", source, e)
+            return []
 
-        # Check error log if it exists and not in dry-run mode
-        if not self.dry_run and log_file.exists() and self._has_errors_in_log(log_file):
-            logger.warning("Rsync reported errors. Check %s for details", log_file)
-            error_log = log_file
+        shard_count = min(shard_count, len(entries))
+        loads = [0] * shard_count
+        shards = [[] for _ in range(shard_count)]
+        for weight, name in sorted(entries, reverse=True):
+            lightest = loads.index(min(loads))
+            shards[lightest].append(name)
+            loads[lightest] += weight
+
+        return [sorted(names) for names in shards]
+
+    def _entry_weight(self, entry, balance_by) -> int:
+        if not entry.is_dir(follow_symlinks=False):
+            if balance_by == "count":
+                return 1
+            return entry.stat(follow_symlinks=False).st_size
+
+        weight = 0
+        for root, _, files in os.walk(entry.path):
+            if balance_by == "count":
+                weight += len(files)
+                continue
+            for name in files:
+                try:
+                    weight += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return weight
+
+    def _split_paths(self, paths, shards) -> list:
+        """Distribute changed paths over shards by their top-level entry."""
+        if len(shards) < 2:
+            return [paths]
+
+        shard_of = {name: i for i, names in enumerate(shards) for name in names}
+        file_lists = [[] for _ in shards]
+        for path in paths:
+            top_level = path.split(os.sep, 1)[0]
+            # Entries created since the shards were planned go to the first one
+            file_lists[shard_of.get(top_level, 0)].append(path)
+        return [file_list for file_list in file_lists if file_list]
+
+    def _run_file_lists(
+        self,
+        source,
+        destination,
+        log_file,
+        file_lists,
+        max_workers,
+        profile_args=(),
+        done=None,
+        on_shard_done=None,
+    ):
+        """Run one rsync per list of paths and combine their output and logs.
+
+        Paths are relative to source; each list becomes a --files-from file.
+        Lists whose index is in ``done`` (index -> parser) already ran in an
+        interrupted job and are only merged; ``on_shard_done(index, parser)``
+        is called as each of the others finishes.
+        """
+        done = dict(done or {})
+        # rsync copies "dir" into destination/dir but "dir/" into destination,
+        # so keep the same layout by listing entries relative to the parent
+        if source.endswith("/"):
+            base, prefix = source, ""
+        else:
+            base = os.path.dirname(os.path.abspath(source)) + "/"
+            prefix = os.path.basename(source) + "/"
 
-        return self._parse_rsync_stats(stdout, source, error_log=error_log)
+        count = len(file_lists)
+        if count > 1:
+            logger.info("Backing up %s in %d shards", source, count)
+
+        with tempfile.TemporaryDirectory(prefix="nas-backup-shards-") as tmp_dir:
+
+            def run_shard(shard):
+                i, paths = shard
+                files_from = Path(tmp_dir) / f"shard{i}.list"
+                files_from.write_text("".join(f"{prefix}{p}\n" for p in paths))
+                shard_log = log_file.with_name(f"{log_file.stem}_shard{i}.log")
+                cmd = self._rsync_command(
+                    base, destination, shard_log, profile_args, files_from=files_from
+                )
+                label = f"{source} [shard {i + 1}/{count}]" if count > 1 else source
+                parser = self._run_rsync(cmd, label)
+                if on_shard_done:
+                    on_shard_done(i, parser)
+                return i, parser
+
+            pending = [
+                (i, paths) for i, paths in enumerate(file_lists) if i not in done
+            ]
+            done.update(self._map_concurrently(run_shard, pending, max_workers))
+
+        self._merge_shard_logs(log_file, count)
+
+        combined = RsyncOutputParser()
+        for i in sorted(done):
+            combined.merge(done[i])
+        return combined
+
+    def _change_index(self) -> Optional[ChangeIndex]:
+        index_config = self.config["backup"].get("change_index")
+        if not index_config:
+            return None
+        return ChangeIndex(index_config["path"], index_config.get("full_scan_days", 7))
+
+    def _index_key(self, source, destination, profile_args=()) -> str:
+        # Anything that changes what ends up in the destination belongs here
+        return json.dumps(
+            {
+                "source": source,
+                "destination": destination,
+                "rsync_args": list(profile_args),
+            }
+        )
+
+    def _merge_shard_logs(self, log_file: Path, shard_count: int):
+        """Concatenate per-shard rsync logs into the directory's log file."""
+        shard_logs = [
+            log_file.with_name(f"{log_file.stem}_shard{i}.log")
+            for i in range(shard_count)
+        ]
+        shard_logs = [p for p in shard_logs if p.exists()]
+        if not shard_logs:
+            return
+
+        with open(log_file, "a") as out:
+            for shard_log in shard_logs:
+                with open(shard_log, "r") as f:
+                    shutil.copyfileobj(f, out)
+                shard_log.unlink()
+
+    def _analyze_log(self, log_file: Path) -> ErrorSummary:
+        """Classify the errors in an rsync log, compacting it if configured."""
+        analyzer = ErrorLogAnalyzer(
+            top_paths=self.error_log_config.get("top_paths", 10)
+        )
+        if not self.error_log_config.get("errors_only", False):
+            return analyzer.analyze(log_file)
+
+        # The per-file transfer lines are the bulk of the log, keep only errors
+        compact = log_file.with_name(log_file.name + ".errors")
+        summary = analyzer.analyze(log_file, errors_to=compact)
+        if summary.total:
+            os.replace(compact, log_file)
+        else:
+            compact.unlink()
+            log_file.unlink()
+        return summary
+
+    def _rotate_logs(self, log_dir: Path, exclude=()):
+        keep_days = self.error_log_config.get("keep_days")
+        compress_after_days = self.error_log_config.get("compress_after_days")
+        if keep_days is None and compress_after_days is None:
+            return
+        rotate_logs(log_dir, keep_days, compress_after_days, exclude=exclude)
 
     def _has_errors_in_log(self, log_file: Path) -> bool:
         """Check if the rsync log file contains actual errors."""
         if not log_file.exists():
             return False
-
-        with open(log_file, "r") as f:
-            # Look for error indicators in rsync log
-            for line in f:
-                if any(x in line.lower() for x in ["error", "failed", "cannot"]):
-                    return True
-        return False
+        return ErrorLogAnalyzer(top_paths=0).analyze(log_file).total > 0
 
     def _parse_rsync_stats(self, output, source, error_log=None) -> DirectoryStats:
         """Parse rsync statistics output"""
-        files_transferred = 0
-        size_bytes = 0
-
-        # Regular expressions for parsing rsync stats
-        patterns = {
-            "files": r"Number of regular files transferred: (\d+)",
-            "size": r"Total transferred file size: ([\d,]+) bytes",
-        }
-
-        # Extract statistics
-        for key, pattern in patterns.items():
-            match = re.search(pattern, output)
-            if match:
-                value = match.group(1)
-                if key == "size":
-                    size_bytes = int(value.replace(",", ""))
-                elif key == "files":
-                    files_transferred = int(value)
+        parser = RsyncOutputParser()
+        parser.feed_output(output)
+        return self._build_directory_stats(parser, source, error_log=error_log)
 
+    def _build_directory_stats(
+        self, parser: RsyncOutputParser, source, error_log=None, error_summary=None
+    ) -> DirectoryStats:
         # Update status to include error information
-        status = "dry-run" if "DRY RUN" in output else "success"
+        status = "dry-run" if parser.dry_run else "success"
         if error_log and error_log.exists():
             status = "completed_with_errors"
 
@@ -113,10 +913,11 @@ class BackupManager:
         dir_stats = DirectoryStats(
             source=source,
             status=status,
-            files_transferred=files_transferred,
-            size_bytes=size_bytes,
-            details=self._extract_summary(output),
+            files_transferred=parser.files_transferred,
+            size_bytes=parser.size_bytes,
+            details=parser.summary,
             error_log=error_log,
+            error_summary=error_summary,
         )
 
         logger.info("Backup stats for %s: %s", source, dir_stats)
@@ -124,11 +925,6 @@ class BackupManager:
 
     def _extract_summary(self, output: str) -> str:
         """Extract the summary line from rsync output"""
-        summary_lines = []
-        for line in output.splitlines():
-            if any(
-                x in line.lower()
-                for x in ["created", "deleted", "changed", "transferred"]
-            ):
-                summary_lines.append(line.strip())
-        return " | ".join(summary_lines)
+        parser = RsyncOutputParser()
+        parser.feed_output(output)
+        return parser.summary
@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the stored format or hashing changes; older indexes are rebuilt
+INDEX_VERSION = 1
+
+
+@dataclass
+class DirectoryNode:
+    """Metadata of one scanned directory: its files and a subtree hash."""
+
+    files: Dict[str, list] = field(default_factory=dict)  # name -> [size, mtime, ino]
+    dirs: List[str] = field(default_factory=list)
+    hash: str = ""
+
+
+@dataclass
+class TreeScan:
+    """Result of walking a source tree, keyed by path relative to the source."""
+
+    source: str
+    nodes: Dict[str, DirectoryNode]
+    scanned_at: float
+
+    @property
+    def root_hash(self) -> str:
+        return self.nodes[""].hash
+
+    def size(self, paths: Optional[List[str]] = None) -> int:
+        """Bytes of the scanned files, or only of paths (files or directories)."""
+        total = 0
+        for path in [""] if paths is None else paths:
+            if path not in self.nodes:
+                parent, name = os.path.split(path)
+                node = self.nodes.get(parent)
+                meta = node.files.get(name) if node is not None else None
+                total += meta[0] if meta else 0
+                continue
+            pending = [path]
+            while pending:
+                rel = pending.pop()
+                node = self.nodes[rel]
+                total += sum(meta[0] for meta in node.files.values())
+                pending.extend(os.path.join(rel, name) for name in node.dirs)
+        return total
+
+
+@dataclass
+class ChangeSet:
+    """What a backup has to look at.
+
+    ``paths`` is None for a full backup, otherwise the changed files and new
+    directories relative to the source. An empty list means nothing changed.
+    """
+
+    paths: Optional[List[str]]
+    reason: str
+
+    @property
+    def full(self) -> bool:
+        return self.paths is None
+
+    @property
+    def unchanged(self) -> bool:
+        return self.paths == []
+
+
+def scan_tree(source: str) -> TreeScan:
+    """Walk source (local disk only) and hash every subtree bottom-up."""
+    nodes: Dict[str, DirectoryNode] = {}
+    root = os.path.abspath(source)
+
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        rel = os.path.relpath(dirpath, root)
+        rel = "" if rel == "." else rel
+        node = DirectoryNode()
+        digest = hashlib.sha1()
+
+        for name in sorted(filenames):
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue  # vanished while scanning
+            node.files[name] = [st.st_size, st.st_mtime_ns, st.st_ino]
+            digest.update(
+                f"f\0{name}\0{st.st_size}\0{st.st_mtime_ns}\0{st.st_ino}\n".encode()
+            )
+
+        for name in sorted(dirnames):
+            child = nodes.get(os.path.join(rel, name))
+            if child is not None:
+                node.dirs.append(name)
+                digest.update(f"d\0{name}\0{child.hash}\n".encode())
+                continue
+            # Symlinked directories aren't walked; rsync copies the link itself,
+            # so track it like a file
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            node.files[name] = [st.st_size, st.st_mtime_ns, st.st_ino]
+            digest.update(f"l\0{name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+
+        node.hash = digest.hexdigest()
+        nodes[rel] = node
+
+    if "" not in nodes:
+        raise FileNotFoundError(f"Source directory not found: {source}")
+    return TreeScan(source=source, nodes=nodes, scanned_at=time.time())
+
+
+class ChangeIndex:
+    """Per-directory metadata index kept between runs to skip unchanged trees.
+
+    A directory whose subtree hash (size, mtime and inode of every file below
+    it) is unchanged since the last successful backup is skipped entirely;
+    otherwise only the changed files and new directories are handed to rsync.
+
+    Invalidation rules:
+        - nothing is stored until a backup completes without errors
+        - the index is keyed by source, destination and rsync options, so a
+          changed destination or profile starts over with a full backup
+        - a full backup is forced every ``full_scan_days`` days
+        - indexes written by another INDEX_VERSION are ignored
+    """
+
+    def __init__(self, path, full_scan_days: float = 7):
+        self.path = Path(path)
+        self.full_scan_days = full_scan_days
+
+    def _file_for(self, key: str) -> Path:
+        return self.path / f"{hashlib.sha1(key.encode()).hexdigest()}.json.gz"
+
+    def _load(self, key: str) -> Optional[dict]:
+        index_file = self._file_for(key)
+        if not index_file.exists():
+            return None
+        try:
+            with gzip.open(index_file, "rt") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable change index %s: %s", index_file, e)
+            return None
+        if data.get("version") != INDEX_VERSION or data.get("key") != key:
+            return None
+        return data
+
+    def diff(self, key: str, scan: TreeScan) -> ChangeSet:
+        stored = self._load(key)
+        if stored is None:
+            return ChangeSet(None, "no previous index")
+
+        age_days = (scan.scanned_at - stored["last_full_scan"]) / 86400
+        if age_days >= self.full_scan_days:
+            return ChangeSet(None, f"last full scan {age_days:.1f} days ago")
+
+        old_nodes = stored["nodes"]
+        if old_nodes.get("", {}).get("hash") == scan.root_hash:
+            return ChangeSet([], "unchanged")
+
+        paths: List[str] = []
+        pending = [""]
+        while pending:
+            rel = pending.pop()
+            node = scan.nodes[rel]
+            old = old_nodes.get(rel)
+            if old is None:
+                paths.append(rel)  # new directory, rsync copies it recursively
+                continue
+            if old["hash"] == node.hash:
+                continue
+            for name, meta in node.files.items():
+                if old["files"].get(name) != meta:
+                    paths.append(os.path.join(rel, name))
+            pending.extend(os.path.join(rel, name) for name in node.dirs)
+
+        return ChangeSet(sorted(paths), f"{len(paths)} changed paths")
+
+    def commit(self, key: str, scan: TreeScan, full: bool):
+        """Store scan as the state of the last successful backup."""
+        stored = None if full else self._load(key)
+        last_full = stored["last_full_scan"] if stored else scan.scanned_at
+        data = {
+            "version": INDEX_VERSION,
+            "key": key,
+            "source": scan.source,
+            "scanned_at": scan.scanned_at,
+            "last_full_scan": last_full,
+            "nodes": {
+                rel: {"hash": node.hash, "files": node.files}
+                for rel, node in scan.nodes.items()
+            },
+        }
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        index_file = self._file_for(key)
+        tmp_file = index_file.with_suffix(".tmp")
+        with gzip.open(tmp_file, "wt") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_file, index_file)
+        logger.info("Updated change index for %s", scan.source)
+
+    def invalidate(self, key: str):
+        self._file_for(key).unlink(missing_ok=True)
@@ -0,0 +1,222 @@
+import dataclasses
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .error_log import ErrorSummary
+from .models import DirectoryStats
+from .rsync_output import RsyncOutputParser
+from .verify import VerifyResult
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+STATE_FILE = "state.json"
+# Well below a daily schedule: the next night's job must not reuse the
+# directories an interrupted job finished, their changes since would be lost
+DEFAULT_MAX_AGE_HOURS = 6
+
+
+def parser_to_dict(parser: RsyncOutputParser) -> dict:
+    return {
+        "files_transferred": parser.files_transferred,
+        "size_bytes": parser.size_bytes,
+        "total_size_bytes": parser.total_size_bytes,
+        "dry_run": parser.dry_run,
+        "summary_lines": parser.summary_lines,
+    }
+
+
+def parser_from_dict(data: dict) -> RsyncOutputParser:
+    parser = RsyncOutputParser()
+    parser.files_transferred = data["files_transferred"]
+    parser.size_bytes = data["size_bytes"]
+    parser.total_size_bytes = data.get("total_size_bytes", 0)
+    parser.dry_run = data["dry_run"]
+    parser.summary_lines = list(data["summary_lines"])
+    return parser
+
+
+def stats_to_dict(dir_stats: DirectoryStats) -> dict:
+    data = dataclasses.asdict(dir_stats)
+    data["error_log"] = str(dir_stats.error_log) if dir_stats.error_log else None
+    return data
+
+
+def stats_from_dict(data: dict) -> DirectoryStats:
+    data = dict(data)
+    if data.get("error_log"):
+        data["error_log"] = Path(data["error_log"])
+    if data.get("error_summary"):
+        summary = dict(data["error_summary"])
+        summary["top_paths"] = [tuple(p) for p in summary["top_paths"]]
+        data["error_summary"] = ErrorSummary(**summary)
+    if data.get("verification"):
+        data["verification"] = VerifyResult(**data["verification"])
+    return DirectoryStats(**data)
+
+
+class Checkpoint:
+    """Progress of the running backup job, kept on local disk.
+
+    Records which directories completed (with their stats), and for the
+    directory in flight the file lists it was split into and which of them
+    finished. An interrupted job picks up from there instead of starting
+    every directory over. Entries are keyed like the change index, so a
+    directory whose destination or profile changed starts from scratch.
+
+    Layout of ``path``:
+        state.json: small, rewritten after every directory and shard
+        <sha1 of source>.lists.json.gz: file lists, written once per directory
+    """
+
+    def __init__(self, path, state: Optional[dict] = None):
+        self.path = Path(path)
+        self.state = state or {
+            "version": CHECKPOINT_VERSION,
+            "started": datetime.now().isoformat(),
+            "directories": {},
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(
+        cls, path, resume=False, max_age_hours: float = DEFAULT_MAX_AGE_HOURS
+    ) -> "Checkpoint":
+        """Continue an interrupted job found at path, or start a new one.
+
+        A checkpoint older than ``max_age_hours`` is only resumed when
+        ``resume`` is set.
+        """
+        path = Path(path)
+        state = cls._load(path)
+        if state is not None:
+            age_hours = (time.time() - state["updated"]) / 3600
+            if resume or age_hours < max_age_hours:
+                logger.info(
+                    "Resuming the backup job started %s (%d directories done)",
+                    state["started"],
+                    sum(
+                        1
+                        for e in state["directories"].values()
+                        if e["status"] == "done"
+                    ),
+                )
+                return cls(path, state)
+            logger.info("Discarding checkpoint from %.1f hours ago", age_hours)
+
+        checkpoint = cls(path)
+        checkpoint.clear()
+        return checkpoint
+
+    @classmethod
+    def pending_job(cls, path) -> Optional[dict]:
+        """State of an interrupted job at path, read without resuming it."""
+        return cls._load(Path(path))
+
+    @staticmethod
+    def _load(path: Path) -> Optional[dict]:
+        state_file = path / STATE_FILE
+        if not state_file.exists():
+            return None
+        try:
+            state = json.loads(state_file.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", state_file, e)
+            return None
+        if state.get("version") != CHECKPOINT_VERSION:
+            return None
+        return state
+
+    def _entry(self, source: str, key: str) -> Optional[dict]:
+        entry = self.state["directories"].get(source)
+        if entry is None or entry["key"] != key:
+            return None
+        return entry
+
+    def _lists_file(self, source: str) -> Path:
+        return self.path / f"{hashlib.sha1(source.encode()).hexdigest()}.lists.json.gz"
+
+    def completed(self, source: str, key: str) -> Optional[DirectoryStats]:
+        """Stats of a directory that finished before the interruption."""
+        entry = self._entry(source, key)
+        if entry is None or entry["status"] != "done":
+            return None
+        return stats_from_dict(entry["stats"])
+
+    def pending(
+        self, source: str, key: str
+    ) -> Optional[Tuple[List[List[str]], Dict[int, RsyncOutputParser]]]:
+        """File lists of an interrupted directory and the finished ones' output.
+
+        Returns None when the directory wasn't split into file lists; it then
+        simply runs again (rsync's --partial keeps what was transferred).
+        """
+        entry = self._entry(source, key)
+        if entry is None or entry["status"] != "in_progress" or not entry["lists"]:
+            return None
+        try:
+            with gzip.open(self._lists_file(source), "rt") as f:
+                file_lists = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable file lists of %s: %s", source, e)
+            return None
+        done = {int(i): parser_from_dict(p) for i, p in entry["shards_done"].items()}
+        return file_lists, done
+
+    def start_directory(self, source: str, key: str, file_lists=None):
+        if file_lists:
+            self.path.mkdir(parents=True, exist_ok=True)
+            lists_file = self._lists_file(source)
+            tmp_file = lists_file.with_suffix(".tmp")
+            with gzip.open(tmp_file, "wt") as f:
+                json.dump(file_lists, f, separators=(",", ":"))
+            os.replace(tmp_file, lists_file)
+        with self._lock:
+            self.state["directories"][source] = {
+                "key": key,
+                "status": "in_progress",
+                "lists": bool(file_lists),
+                "shards_done": {},
+            }
+            self._save()
+
+    def shard_done(self, source: str, index: int, parser: RsyncOutputParser):
+        with self._lock:
+            entry = self.state["directories"][source]
+            entry["shards_done"][str(index)] = parser_to_dict(parser)
+            self._save()
+
+    def directory_done(self, source: str, key: str, dir_stats: DirectoryStats):
+        with self._lock:
+            self.state["directories"][source] = {
+                "key": key,
+                "status": "done",
+                "stats": stats_to_dict(dir_stats),
+            }
+            self._save()
+        self._lists_file(source).unlink(missing_ok=True)
+
+    def clear(self):
+        """Forget all progress, e.g. once the job has finished."""
+        with self._lock:
+            self.state["directories"] = {}
+        # The directory may be shared with other state, only remove our files
+        (self.path / STATE_FILE).unlink(missing_ok=True)
+        for lists_file in self.path.glob("*.lists.json.gz"):
+            lists_file.unlink()
+
+    def _save(self):
+        self.state["updated"] = time.time()
+        self.path.mkdir(parents=True, exist_ok=True)
+        state_file = self.path / STATE_FILE
+        tmp_file = state_file.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(self.state))
+        os.replace(tmp_file, state_file)
@@ -0,0 +1,486 @@
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import stat
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MANIFEST_FORMAT = "%Y-%m-%d_%H%M%S"
+MIN_CHUNK = 1024 * 1024
+MAX_CHUNK = 8 * 1024 * 1024
+# A chunk ends after the first anchor past MIN_CHUNK bytes. In media files the
+# anchor occurs every ~64 KiB, so boundaries follow the content and realign
+# right after an insertion, while bytes.find keeps chunking at memory speed;
+# a rolling hash in Python would make chunking, not hashing, the per-byte cost
+ANCHOR = b"\x8f\x3a"
+READ_SIZE = 16 * 1024 * 1024
+# Files handed to a worker at once, so tiny files don't cost a round trip each
+BATCH_BYTES = 64 * 1024 * 1024
+BATCH_FILES = 256
+
+INDEX_SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, size INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    chunks TEXT NOT NULL
+);
+"""
+
+
+def iter_chunks(f, min_size=MIN_CHUNK, max_size=MAX_CHUNK) -> Iterator[memoryview]:
+    """Split a binary file into content-defined chunks."""
+    buf, pos, eof = b"", 0, False
+    while True:
+        if not eof and len(buf) - pos < max_size:
+            block = f.read(READ_SIZE)
+            if block:
+                buf, pos = buf[pos:] + block, 0
+            else:
+                eof = True
+            continue
+        if pos >= len(buf):
+            return
+        limit = min(pos + max_size, len(buf))
+        cut = buf.find(ANCHOR, pos + min_size, limit)
+        end = cut + len(ANCHOR) if cut != -1 else limit
+        yield memoryview(buf)[pos:end]
+        pos = end
+
+
+def chunk_path(root: Path, digest: str) -> Path:
+    return root / "chunks" / digest[:2] / digest
+
+
+def _write_chunk(root: Path, digest: str, data):
+    path = chunk_path(root, digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f".{digest}.{os.getpid()}.tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, path)
+
+
+def _store_files(paths, root, index_path, dry_run):
+    """Chunk and hash files in a worker process.
+
+    Chunks the local index doesn't know are written to the store right away,
+    so every file is read only once. Returns (path, chunks, error) per file.
+    """
+    root = Path(root)
+    results = []
+    written = set()
+    # No index yet (a dry run before the first backup): every chunk is new
+    uri = f"file:{index_path}?mode=ro" if index_path else "file::memory:"
+    with closing(sqlite3.connect(uri, uri=True)) as index:
+        if not index_path:
+            index.executescript(INDEX_SCHEMA)
+        for path in paths:
+            chunks = []
+            try:
+                with open(path, "rb") as f:
+                    for data in iter_chunks(f):
+                        digest = hashlib.sha256(data).hexdigest()
+                        chunks.append((digest, len(data)))
+                        if (
+                            digest in written
+                            or index.execute(
+                                "SELECT 1 FROM chunks WHERE hash = ?", (digest,)
+                            ).fetchone()
+                        ):
+                            continue
+                        if not dry_run:
+                            _write_chunk(root, digest, data)
+                        written.add(digest)
+            except OSError as e:
+                results.append((path, None, str(e)))
+                continue
+            results.append((path, chunks, None))
+    return results
+
+
+@dataclass
+class DedupResult:
+    files: int = 0
+    # Files read and chunked; the others were unchanged since the last run
+    files_chunked: int = 0
+    total_bytes: int = 0
+    new_chunks: int = 0
+    new_bytes: int = 0
+    manifest: Optional[str] = None
+    errors: List[Tuple[str, str]] = field(default_factory=list)
+    # Sockets, FIFOs and devices, which can't be stored
+    skipped: List[str] = field(default_factory=list)
+
+    @property
+    def deduplicated_bytes(self) -> int:
+        return self.total_bytes - self.new_bytes
+
+
+class DedupStore:
+    """Content-addressed chunk store on the NAS with a local chunk index.
+
+    Files are split into content-defined chunks named by their SHA-256, so a
+    renamed or re-saved file only stores the chunks the store lacks. Each
+    backup writes a manifest listing every file's chunks and every symlink's
+    target, from which restore() rebuilds the tree.
+
+    Layout of ``root``:
+        store_id: random id, tells whether the local index belongs to this store
+        chunks/<ab>/<sha256>: chunk data
+        manifests/<source>/<timestamp>.json.gz: one per backup
+
+    The local index (SQLite) records the chunks in the store and each file's
+    size, mtime and chunks from the last run, so unchanged files are neither
+    read nor looked up on the NAS.
+    """
+
+    def __init__(self, root, index_path, workers: Optional[int] = None):
+        self.root = Path(root)
+        self.index_path = Path(index_path)
+        self.workers = workers or os.cpu_count() or 1
+
+    def _open_index(self, dry_run=False) -> Tuple[sqlite3.Connection, Optional[str]]:
+        """The local index, and its path for workers (None: use an empty one).
+
+        A dry run only reads an index that belongs to the store; otherwise it
+        works on an empty one in memory and leaves the disk alone.
+        """
+        id_file = self.root / "store_id"
+        store_id = id_file.read_text().strip() if id_file.exists() else None
+        if dry_run:
+            if store_id and self.index_path.exists():
+                conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+                row = conn.execute(
+                    "SELECT value FROM meta WHERE key = 'store_id'"
+                ).fetchone()
+                if row is not None and row[0] == store_id:
+                    return conn, str(self.index_path)
+                conn.close()
+            conn = sqlite3.connect(":memory:")
+            conn.executescript(INDEX_SCHEMA)
+            return conn, None
+
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.index_path)
+        conn.executescript(INDEX_SCHEMA)
+        if store_id is None:
+            store_id = uuid.uuid4().hex
+            self.root.mkdir(parents=True, exist_ok=True)
+            id_file.write_text(store_id + "\n")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'store_id'").fetchone()
+        if row is None or row[0] != store_id:
+            # A new or replaced store: nothing the index knows is in it
+            logger.info(
+                "Chunk index %s doesn't match %s, resetting", self.index_path, self.root
+            )
+            with conn:
+                conn.execute("DELETE FROM chunks")
+                conn.execute("DELETE FROM files")
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('store_id', ?)", (store_id,)
+                )
+        return conn, str(self.index_path)
+
+    def manifest_dir(self, source: str) -> Path:
+        return self.root / "manifests" / re.sub(r"[^\w.-]+", "_", source.strip("/"))
+
+    def manifests(self, source: str) -> List[Path]:
+        """Manifests of source, oldest first."""
+        directory = self.manifest_dir(source)
+        if not directory.is_dir():
+            return []
+        return sorted(directory.glob("*.json.gz"))
+
+    def backup(
+        self, source: str, dry_run=False, now: Optional[datetime] = None
+    ) -> DedupResult:
+        """Store the files below source and write a manifest of them."""
+        result = DedupResult()
+        # Relative path -> (size, mtime_ns, mode, chunk hashes)
+        files = {}
+        # Relative path -> (mtime_ns, mode, link target)
+        links = {}
+        index, index_path = self._open_index(dry_run)
+        with closing(index):
+            changed = {}
+            for rel, st in self._walk(source, result):
+                path = os.path.join(source, rel)
+                if stat.S_ISLNK(st.st_mode):
+                    try:
+                        links[rel] = (st.st_mtime_ns, st.st_mode, os.readlink(path))
+                    except OSError as e:
+                        result.errors.append((rel, str(e)))
+                    continue
+                row = index.execute(
+                    "SELECT size, mtime_ns, ino, chunks FROM files WHERE path = ?",
+                    (path,),
+                ).fetchone()
+                if row and tuple(row[:3]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+                    files[rel] = (
+                        st.st_size,
+                        st.st_mtime_ns,
+                        st.st_mode,
+                        json.loads(row[3]),
+                    )
+                else:
+                    changed[path] = (rel, st)
+            logger.info(
+                "Dedup backup of %s: %d files, %d new or changed",
+                source,
+                len(files) + len(changed),
+                len(changed),
+            )
+
+            seen = set()
+            for results in self._chunk_in_workers(changed, index_path, dry_run):
+                # One transaction per batch: an interrupted run only chunks
+                # the files of unfinished batches again
+                with index:
+                    for path, chunks, error in results:
+                        rel, st = changed[path]
+                        if error is not None:
+                            result.errors.append((rel, error))
+                            continue
+                        hashes = [digest for digest, _ in chunks]
+                        self._record_chunks(index, chunks, seen, result, dry_run)
+                        if not dry_run:
+                            index.execute(
+                                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                (
+                                    path,
+                                    st.st_size,
+                                    st.st_mtime_ns,
+                                    st.st_ino,
+                                    json.dumps(hashes),
+                                ),
+                            )
+                        size = sum(size for _, size in chunks)
+                        files[rel] = (size, st.st_mtime_ns, st.st_mode, hashes)
+                        result.files_chunked += 1
+
+        result.files = len(files) + len(links)
+        result.total_bytes = sum(entry[0] for entry in files.values())
+        if result.skipped:
+            logger.warning(
+                "Dedup backup of %s: skipped %d special files, e.g. %s",
+                source,
+                len(result.skipped),
+                result.skipped[0],
+            )
+        if not dry_run:
+            result.manifest = self._write_manifest(
+                source, files, links, now or datetime.now()
+            )
+        logger.info(
+            "Dedup backup of %s: %d new chunks (%d bytes), %d bytes deduplicated",
+            source,
+            result.new_chunks,
+            result.new_bytes,
+            result.deduplicated_bytes,
+        )
+        return result
+
+    def changed_bytes(self, source: str) -> int:
+        """Size of the files below source the next backup has to chunk."""
+        total = 0
+        index, _ = self._open_index(dry_run=True)
+        with closing(index):
+            for rel, st in self._walk(source, DedupResult()):
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                row = index.execute(
+                    "SELECT size, mtime_ns, ino FROM files WHERE path = ?",
+                    (os.path.join(source, rel),),
+                ).fetchone()
+                if not row or tuple(row) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                    total += st.st_size
+        return total
+
+    @staticmethod
+    def _walk(source: str, result: DedupResult):
+        """Regular files and symlinks below source, as (relative path, lstat)."""
+        for root, dirs, names in os.walk(source):
+            # Symlinks to directories are listed as directories, not followed
+            for name in names + [
+                d for d in dirs if os.path.islink(os.path.join(root, d))
+            ]:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, source)
+                try:
+                    st = os.lstat(path)
+                except OSError as e:
+                    result.errors.append((rel, str(e)))
+                    continue
+                if stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
+                    yield rel, st
+                else:
+                    result.skipped.append(rel)
+
+    @staticmethod
+    def _record_chunks(index, chunks, seen, result: DedupResult, dry_run):
+        for digest, size in chunks:
+            if digest in seen:
+                continue
+            seen.add(digest)
+            if dry_run:
+                known = index.execute(
+                    "SELECT 1 FROM chunks WHERE hash = ?", (digest,)
+                ).fetchone()
+            else:
+                # Workers may have written the same new chunk; count it once
+                known = not index.execute(
+                    "INSERT OR IGNORE INTO chunks VALUES (?, ?)", (digest, size)
+                ).rowcount
+            if not known:
+                result.new_chunks += 1
+                result.new_bytes += size
+
+    def _chunk_in_workers(self, changed, index_path, dry_run):
+        """Yield the results of _store_files, one list per batch of files."""
+        batches, batch, batch_bytes = [], [], 0
+        for path, (_, st) in changed.items():
+            batch.append(path)
+            batch_bytes += st.st_size
+            if batch_bytes >= BATCH_BYTES or len(batch) >= BATCH_FILES:
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            batches.append(batch)
+        args = (str(self.root), index_path, dry_run)
+        if self.workers == 1 or len(batches) <= 1:
+            for batch in batches:
+                yield _store_files(batch, *args)
+            return
+        # Fresh interpreters: forking a process that runs threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            min(self.workers, len(batches)), mp_context=context
+        ) as executor:
+            futures = [executor.submit(_store_files, batch, *args) for batch in batches]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _write_manifest(
+        self, source: str, files: dict, links: dict, now: datetime
+    ) -> str:
+        directory = self.manifest_dir(source)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"{now.strftime(MANIFEST_FORMAT)}.json.gz"
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "source": source,
+            "created": now.isoformat(timespec="seconds"),
+            "files": [
+                {
+                    "path": rel,
+                    "size": size,
+                    "mtime_ns": mtime_ns,
+                    "mode": mode,
+                    "chunks": chunks,
+                }
+                for rel, (size, mtime_ns, mode, chunks) in sorted(files.items())
+            ],
+            "links": [
+                {"path": rel, "mtime_ns": mtime_ns, "mode": mode, "target": target}
+                for rel, (mtime_ns, mode, target) in sorted(links.items())
+            ],
+        }
+        tmp_file = directory / f".{name}.tmp"
+        with gzip.open(tmp_file, "wt") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_file, directory / name)
+        return name
+
+    def restore(self, manifest_path, target, prefix: Optional[str] = None) -> int:
+        """Rebuild the files of a manifest below target, return how many.
+
+        ``prefix`` limits the restore to one file or directory of the source.
+        Every chunk is checked against its hash on the way.
+        """
+        manifest = load_manifest(manifest_path)
+        prefix = prefix.strip("/") if prefix else None
+
+        def selected(entries):
+            for entry in entries:
+                rel = entry["path"]
+                if prefix and rel != prefix and not rel.startswith(prefix + "/"):
+                    continue
+                if os.path.isabs(rel) or os.pardir in Path(rel).parts:
+                    raise ValueError(f"Unsafe path in manifest {manifest_path}: {rel}")
+                path = Path(target) / rel
+                path.parent.mkdir(parents=True, exist_ok=True)
+                yield entry, rel, path
+
+        restored = 0
+        for entry, rel, path in selected(manifest["files"]):
+            tmp_file = path.with_name(f".{path.name}.restore")
+            with open(tmp_file, "wb") as f:
+                for digest in entry["chunks"]:
+                    data = chunk_path(self.root, digest).read_bytes()
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise ValueError(f"Chunk {digest} of {rel} is corrupt")
+                    f.write(data)
+            os.chmod(tmp_file, stat.S_IMODE(entry["mode"]))
+            os.utime(tmp_file, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            os.replace(tmp_file, path)
+            restored += 1
+        # Links last, so no file is written through one
+        for entry, rel, path in selected(manifest.get("links", [])):
+            if path.is_symlink() or path.exists():
+                path.unlink()
+            os.symlink(entry["target"], path)
+            os.utime(
+                path, ns=(entry["mtime_ns"], entry["mtime_ns"]), follow_symlinks=False
+            )
+            restored += 1
+        logger.info("Restored %d files from %s to %s", restored, manifest_path, target)
+        return restored
+
+
+def load_manifest(path) -> dict:
+    with gzip.open(path, "rt") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version in {path}")
+    return manifest
+
+
+def store_for(dedup_config, dir_config) -> DedupStore:
+    """The chunk store of a directory backed up with ``dedup``.
+
+    The store lives at the directory's destination unless ``dedup.store``
+    names another one (directories sharing a store share their chunks). The
+    local index is kept per store below ``backup.dedup.path``.
+    """
+    options = dir_config["dedup"] if isinstance(dir_config["dedup"], dict) else {}
+    root = options.get("store", dir_config["destination"])
+    index_dir = (dedup_config or {}).get("path")
+    if not index_dir:
+        raise ValueError(
+            f"Dedup backups of {dir_config['source']} need backup.dedup.path "
+            "for the local chunk index"
+        )
+    key = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:16]
+    return DedupStore(
+        root,
+        Path(index_dir) / f"{key}.db",
+        workers=(dedup_config or {}).get("workers"),
+    )
@@ -1,26 +1,52 @@
+import html
 import logging
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from typing import Optional
 
+from .error_log import ErrorSummary
 from .models import BackupStats
+from .report import build_report
+from .utils import format_size
+from .verify import VerifyResult
 
 logger = logging.getLogger(__name__)
 
 
+def _signed(value: float, fmt) -> str:
+    return ("+" if value > 0 else "-" if value < 0 else "±") + fmt(abs(value))
+
+
+def _format_trend(trend: Optional[dict], size_key: str) -> str:
+    if not trend:
+        return ""
+    return (
+        f"{_signed(trend[size_key], format_size)}, "
+        f"{_signed(trend['duration_seconds'], lambda s: f'{s:.1f}s')}, "
+        f"{_signed(trend['bytes_per_second'], format_size)}/s"
+    )
+
+
 class EmailSender:
     def __init__(self, config, dry_run=False):
         self.config = config
         self.dry_run = dry_run
 
-    def send_report(self, stats: BackupStats):
-        msg = MIMEMultipart()
+    def send_report(self, stats: BackupStats, report: Optional[dict] = None):
+        """Email a run; ``report`` is its build_report() output, if built already."""
+        # Only needed when a report is sent, keep them off the CLI's startup path
+        import smtplib
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        report = report or build_report(stats)
+        msg = MIMEMultipart("alternative")
         msg["From"] = self.config["email"]["sender"]
         msg["To"] = self.config["email"]["recipient"]
         msg["Subject"] = f"Backup Report - {stats.timestamp}"
 
-        body = self._generate_report_body(stats)
+        body = self._generate_report_body(stats, report)
+        # Clients show the last part they can render: HTML, else the text
         msg.attach(MIMEText(body, "plain"))
+        msg.attach(MIMEText(self._generate_html_body(report), "html"))
 
         if self.dry_run:
             logger.info("[DRY RUN] Would send email:")
@@ -43,32 +69,199 @@ class EmailSender:
             logger.error(f"Failed to send email: {str(e)}")
             raise
 
-    def _generate_report_body(self, stats: BackupStats):
-        if stats.status == "failed":
+    def _generate_report_body(self, stats: BackupStats, report=None):
+        report = report or build_report(stats)
+        if report["status"] == "failed":
             return f"""
 Backup Job Failed!
-Error: {stats.error}
-Time: {stats.timestamp}
-"""
-
-        report = [
-            "Backup Job Completed Successfully",
-            f"Total Files: {stats.total_files}",
-            f"Total Size: {stats.format_total_size()}",
-            "\nDetails by Directory:",
+Error: {report["error"]}
+Time: {report["timestamp"]}
+""" + self._format_timings(report)
+
+        lines = [
+            "Backup Job Completed Successfully"
+            if report["status"] == "success"
+            else "Backup Job Completed With Failed Targets",
+            f"Total Files: {report['total_files']}",
+            f"Total Size: {format_size(report['total_size'])}",
         ]
+        if report["trend"]:
+            lines.append(
+                f"Since {report['trend']['previous_timestamp']}: "
+                f"{_format_trend(report['trend'], 'total_size')}"
+            )
+        if report["targets"]:
+            lines.append("\nTargets:")
+            for target in report["targets"]:
+                line = (
+                    f"{target['name']}: {target['status']}, "
+                    f"{target['total_files']} files, "
+                    f"{format_size(target['total_size'])} in "
+                    f"{target['duration_seconds']:.1f}s"
+                )
+                if target["error"]:
+                    line += f" ({target['error']})"
+                lines.append(line)
+        lines.append("\nDetails by Directory:")
 
-        for dir_stats in stats.directories.values():
-            report.extend(
+        for d in report["directories"]:
+            target = f" -> {d['target']}" if d["target"] else ""
+            size = format_size(d["size_bytes"])
+            lines.extend(
                 [
-                    f"\nDirectory: {dir_stats.source}",
-                    f"Files Transferred: {dir_stats.files_transferred}",
-                    f"Size Transferred: {dir_stats.size_formatted}",
-                    f"Status: {dir_stats.status}",
-                    f"Details: {dir_stats.details}",
+                    f"\nDirectory: {d['source']}{target}",
+                    f"Files Transferred: {d['files_transferred']}",
+                    f"Size Transferred: {size}",
+                    f"Status: {d['status']}",
+                    f"Details: {d['details']}",
                 ]
             )
-            if dir_stats.status == "completed_with_errors" and dir_stats.error_log:
-                report.append(f"Error Log: {dir_stats.error_log}")
+            if d["trend"]:
+                lines.append(f"Change: {_format_trend(d['trend'], 'size_bytes')}")
+            if d["status"] == "completed_with_errors" and d["error_log"]:
+                lines.append(f"Error Log: {d['error_log']}")
+            if d["snapshot"]:
+                lines.append(
+                    f"Snapshot: {d['snapshot']} ({size} new, "
+                    f"{format_size(d['linked_bytes'])} hard-linked)"
+                )
+            if d["manifest"]:
+                lines.append(
+                    f"Manifest: {d['manifest']} ({size} new, "
+                    f"{format_size(d['deduplicated_bytes'])} deduplicated)"
+                )
+            if d["archive"]:
+                lines.append(f"Archive: {d['archive']}")
+            verification = d["verification"]
+            if verification:
+                lines.append(f"Verification: {VerifyResult(**verification).format()}")
+                for label, paths in (
+                    ("Mismatch", verification["mismatches"]),
+                    ("Missing", verification["missing"]),
+                ):
+                    lines.extend(f"  {label}: {path}" for path in paths[:10])
+            errors = d["errors"]
+            if errors and errors["total"]:
+                summary = ErrorSummary(categories=errors["categories"])
+                lines.append(f"Errors: {errors['total']} ({summary.format()})")
+                for path, count in errors["top_paths"]:
+                    lines.append(f"  {count}x {path}")
+
+        timings = self._format_timings(report)
+        if timings:
+            lines.append(timings)
+
+        return "\n".join(lines)
 
-        return "\n".join(report)
+    def _format_timings(self, report: dict) -> str:
+        if not report["timings"]:
+            return ""
+
+        lines = ["\nPhase Timings:"]
+        for timing in report["timings"]:
+            indent = "  " * timing["depth"]
+            lines.append(f"{indent}{timing['name']}: {timing['duration_seconds']:.1f}s")
+        return "\n".join(lines)
+
+    def _generate_html_body(self, report: dict) -> str:
+        """The report as HTML tables, with changes against the previous run."""
+
+        def table(headers, rows):
+            head = "".join(f"<th>{html.escape(h)}</th>" for h in headers)
+            body = "".join(
+                "<tr>"
+                + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row)
+                + "</tr>"
+                for row in rows
+            )
+            return (
+                '<table border="1" cellpadding="4" cellspacing="0">'
+                f"<tr>{head}</tr>{body}</table>"
+            )
+
+        status = report["status"]
+        parts = [f"<h2>Backup {html.escape(status)}</h2>"]
+        if report["error"]:
+            parts.append(f"<p>Error: {html.escape(report['error'])}</p>")
+        summary = [
+            ["Time", report["timestamp"]],
+            ["Files", report["total_files"]],
+            ["Size", format_size(report["total_size"])],
+            ["Duration", f"{report['duration_seconds']:.1f}s"],
+            ["Throughput", f"{format_size(report['bytes_per_second'])}/s"],
+        ]
+        if report["trend"]:
+            summary.append(
+                [
+                    f"Since {report['trend']['previous_timestamp']}",
+                    _format_trend(report["trend"], "total_size"),
+                ]
+            )
+        parts.append(table(["", ""], summary))
+
+        if report["targets"]:
+            parts.append("<h3>Targets</h3>")
+            parts.append(
+                table(
+                    ["Target", "Status", "Files", "Size", "Duration", "Error"],
+                    [
+                        [
+                            t["name"],
+                            t["status"],
+                            t["total_files"],
+                            format_size(t["total_size"]),
+                            f"{t['duration_seconds']:.1f}s",
+                            t["error"] or "",
+                        ]
+                        for t in report["targets"]
+                    ],
+                )
+            )
+
+        if report["directories"]:
+            parts.append("<h3>Directories</h3>")
+            parts.append(
+                table(
+                    [
+                        "Directory",
+                        "Status",
+                        "Files",
+                        "Size",
+                        "Duration",
+                        "Throughput",
+                        "Change",
+                        "Errors",
+                    ],
+                    [
+                        [
+                            d["key"],
+                            d["status"],
+                            d["files_transferred"],
+                            format_size(d["size_bytes"]),
+                            f"{d['duration_seconds']:.1f}s",
+                            f"{format_size(d['bytes_per_second'])}/s",
+                            _format_trend(d["trend"], "size_bytes"),
+                            ErrorSummary(
+                                categories=(d["errors"] or {}).get("categories", {})
+                            ).format(),
+                        ]
+                        for d in report["directories"]
+                    ],
+                )
+            )
+
+        if report["timings"]:
+            parts.append("<h3>Phase Timings</h3>")
+            parts.append(
+                table(
+                    ["Phase", "Duration"],
+                    [
+                        [
+                            "  " * t["depth"] + t["name"],
+                            f"{t['duration_seconds']:.1f}s",
+                        ]
+                        for t in report["timings"]
+                    ],
+                )
+            )
+        return "<html><body>" + "".join(parts) + "</body></html>"
@@ -0,0 +1,198 @@
+import gzip
+import logging
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Any of these (lowercase) marks a line worth classifying; everything else, the
+# per-file transfer lines that make up almost all of a log, is never decoded.
+# rsync prefixes nearly all of its own messages with "rsync:" or "rsync error:"
+ERROR_MARKERS = (b"rsync:", b"error", b"failed", b"cannot", b"vanished")
+
+# First match wins, checked in this order
+CATEGORIES: List[Tuple[str, re.Pattern]] = [
+    ("permission", re.compile(r"Permission denied|Operation not permitted")),
+    ("vanished", re.compile(r"file has vanished")),
+    ("no_space", re.compile(r"No space left on device|Disk quota exceeded")),
+    ("io", re.compile(r"Input/output error|IO error|read errors mapping", re.I)),
+    ("not_found", re.compile(r"No such file or directory")),
+    ("name_too_long", re.compile(r"File name too long")),
+    (
+        "connection",
+        re.compile(r"connection unexpectedly closed|Broken pipe|timeout", re.I),
+    ),
+    ("rsync_exit", re.compile(r"rsync error:")),
+]
+QUOTED_PATH = re.compile(r'"([^"]+)"')
+
+LOG_GLOB = "rsync_errors_*.log"
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+@dataclass
+class ErrorSummary:
+    """What went wrong in one rsync log, small enough for reports and history."""
+
+    total: int = 0
+    categories: Dict[str, int] = field(default_factory=dict)
+    top_paths: List[Tuple[str, int]] = field(default_factory=list)
+    # First message seen per category, to show what the errors look like
+    examples: Dict[str, str] = field(default_factory=dict)
+
+    def format(self) -> str:
+        return ", ".join(
+            f"{category} {count}"
+            for category, count in sorted(
+                self.categories.items(), key=lambda item: (-item[1], item[0])
+            )
+        )
+
+
+def classify(message: str) -> str:
+    for category, pattern in CATEGORIES:
+        if pattern.search(message):
+            return category
+    return "other"
+
+
+def _message(line: str) -> str:
+    # "2024/01/01 02:00:00 [1234] rsync: ..." -> "rsync: ..."
+    _, sep, rest = line.partition("] ")
+    return rest if sep else line
+
+
+class ErrorLogAnalyzer:
+    """Classify the errors of an rsync --log-file in one streaming pass.
+
+    The log is read in large binary blocks and only the lines containing one
+    of the ERROR_MARKERS are decoded, so memory stays flat regardless of the
+    log size. At most ``max_paths`` distinct paths are counted; when the
+    table is full the least frequent half is dropped, which keeps the
+    frequent offenders.
+    """
+
+    def __init__(self, top_paths: int = 10, max_paths: int = 10000):
+        self.top_paths = top_paths
+        self.max_paths = max_paths
+
+    def analyze(self, log_file, errors_to=None) -> ErrorSummary:
+        """Summarize log_file, optionally copying the error lines to errors_to."""
+        categories: Counter = Counter()
+        paths: Counter = Counter()
+        examples: Dict[str, str] = {}
+        out = open(errors_to, "wb") if errors_to else None
+
+        try:
+            for raw in self._error_lines(log_file):
+                if out:
+                    out.write(raw + b"\n")
+                message = _message(raw.decode("utf-8", "replace").strip())
+                category = classify(message)
+                categories[category] += 1
+                examples.setdefault(category, message)
+
+                match = QUOTED_PATH.search(message)
+                if match:
+                    paths[match.group(1)] += 1
+                    if len(paths) > self.max_paths:
+                        paths = Counter(dict(paths.most_common(self.max_paths // 2)))
+        finally:
+            if out:
+                out.close()
+
+        return ErrorSummary(
+            total=sum(categories.values()),
+            categories=dict(categories),
+            top_paths=paths.most_common(self.top_paths),
+            examples=examples,
+        )
+
+    def _error_lines(self, log_file):
+        with open(log_file, "rb") as f:
+            tail = b""
+            while True:
+                block = f.read(BLOCK_SIZE)
+                if not block:
+                    break
+                block = tail + block
+                # Only complete lines are searched, the rest waits for more data
+                end = block.rfind(b"\n") + 1
+                yield from self._matching_lines(block, end)
+                tail = block[end:]
+            if tail:
+                yield from self._matching_lines(tail + b"\n", len(tail) + 1)
+
+    def _matching_lines(self, block: bytes, end: int):
+        # One lowercase copy and a C-level find per marker is much faster than
+        # a case-insensitive regex, which has to try every position
+        lowered = block[:end].lower()
+        lines = set()
+        for marker in ERROR_MARKERS:
+            pos = lowered.find(marker)
+            while pos != -1:
+                start = lowered.rfind(b"\n", 0, pos) + 1
+                stop = lowered.find(b"\n", pos)
+                lines.add((start, stop))
+                pos = lowered.find(marker, stop)
+        for start, stop in sorted(lines):
+            yield block[start:stop]
+
+
+def rotate_logs(
+    directory,
+    keep_days: Optional[float] = None,
+    compress_after_days: Optional[float] = None,
+    exclude=(),
+    now: Optional[float] = None,
+):
+    """Compress and expire old rsync logs in directory.
+
+    Logs older than ``compress_after_days`` are gzipped, logs (compressed or
+    not) older than ``keep_days`` are deleted. Paths in ``exclude`` are left
+    alone.
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return
+    now = now if now is not None else time.time()
+    exclude = {Path(p) for p in exclude}
+
+    for path in sorted(directory.glob(LOG_GLOB)) + sorted(
+        directory.glob(LOG_GLOB + ".gz")
+    ):
+        if path in exclude:
+            continue
+        try:
+            age_days = (now - path.stat().st_mtime) / 86400
+        except OSError:
+            continue
+
+        if keep_days is not None and age_days >= keep_days:
+            logger.info("Removing expired rsync log %s", path)
+            path.unlink(missing_ok=True)
+        elif (
+            compress_after_days is not None
+            and age_days >= compress_after_days
+            and path.suffix == ".log"
+        ):
+            _compress(path)
+
+
+def _compress(path: Path):
+    compressed = path.with_name(path.name + ".gz")
+    tmp_file = compressed.with_name(compressed.name + ".tmp")
+    with open(path, "rb") as src, gzip.open(tmp_file, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    # Keep the age of the log so expiry still counts from when it was written
+    st = path.stat()
+    os.utime(tmp_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(tmp_file, compressed)
+    path.unlink()
+    logger.info("Compressed rsync log %s", compressed)
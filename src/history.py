@@ -0,0 +1,130 @@
+import logging
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    duration_seconds REAL NOT NULL,
+    total_files INTEGER NOT NULL,
+    total_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS directories (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    source TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    status TEXT NOT NULL,
+    files_transferred INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    duration_seconds REAL NOT NULL,
+    details TEXT,
+    error_log TEXT
+);
+CREATE INDEX IF NOT EXISTS directories_source ON directories(source, run_id);
+"""
+
+
+def open_history(config) -> Optional["HistoryStore"]:
+    """Return the configured HistoryStore, or None if history is disabled."""
+    history_config = config.get("history") or {}
+    if not history_config.get("path"):
+        return None
+    return HistoryStore(history_config["path"])
+
+
+class HistoryStore:
+    """Append-only SQLite record of every backup run and its directories."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record_run(self, report: dict) -> int:
+        """Store a finished run's report (see report.build_report), return its id."""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (timestamp, status, error, duration_seconds, "
+                "total_files, total_size) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    report["timestamp"],
+                    report["status"],
+                    report["error"],
+                    report["duration_seconds"],
+                    report["total_files"],
+                    report["total_size"],
+                ),
+            )
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO directories (run_id, source, timestamp, status, "
+                "files_transferred, size_bytes, duration_seconds, details, error_log) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        d["key"],
+                        d["timestamp"],
+                        d["status"],
+                        d["files_transferred"],
+                        d["size_bytes"],
+                        d["duration_seconds"],
+                        d["details"],
+                        d["error_log"],
+                    )
+                    for d in report["directories"]
+                ],
+            )
+
+        logger.info("Recorded backup run %d in %s", run_id, self.path)
+        return run_id
+
+    def recent_runs(self, limit: int = 10) -> List[dict]:
+        """Return the latest runs, newest first."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM runs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._with_throughput(dict(row), "total_size") for row in rows]
+
+    def directory_trend(self, source: Optional[str] = None, limit: int = 10):
+        """Return the latest per-directory results, newest first.
+
+        With ``source`` only that directory is returned, otherwise the latest
+        ``limit`` entries of every directory.
+        """
+        query = (
+            "SELECT * FROM ("
+            "  SELECT d.*, ROW_NUMBER() OVER ("
+            "    PARTITION BY d.source ORDER BY d.run_id DESC"
+            "  ) AS rank FROM directories d"
+            ") WHERE rank <= ?"
+        )
+        params = [limit]
+        if source is not None:
+            query += " AND source = ?"
+            params.append(source)
+        query += " ORDER BY source, run_id DESC"
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._with_throughput(dict(row), "size_bytes") for row in rows]
+
+    def _with_throughput(self, row: dict, size_key: str) -> dict:
+        row.pop("rank", None)
+        duration = row["duration_seconds"]
+        row["bytes_per_second"] = row[size_key] / duration if duration > 0 else 0.0
+        return row
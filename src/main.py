@@ -1,17 +1,18 @@
+"""Command line entry point.
+
+Every command imports what it needs when it runs, so that quick commands
+like ``status`` don't pay for SSH, email or the whole backup pipeline.
+"""
+
 import argparse
 import logging
 import sys
-import time
 from datetime import datetime
 from pathlib import Path
 
-import schedule
 import yaml
 
-from .backup_manager import BackupManager
-from .email_sender import EmailSender
-from .models import BackupStats
-from .nas_controller import NASController
+from .utils import format_size
 
 # Configure logging
 logging.basicConfig(
@@ -20,116 +21,290 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class BackupOrchestrator:
-    def __init__(self, dry_run=False, config_path=None):
-        self.dry_run = dry_run
-        self.config = self._load_config(config_path)
+def load_config(config_path=None):
+    path = Path(
+        config_path or (Path(__file__).parent.parent / "config" / "backup_config.yaml")
+    )
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
 
-        self.nas_controller = NASController(self.config, dry_run=dry_run)
-        self.backup_manager = BackupManager(self.config, dry_run=dry_run)
-        self.email_sender = EmailSender(self.config, dry_run=dry_run)
+def print_history(config, limit):
+    """Print recent runs and per-directory trends from the history store."""
+    from .history import open_history
 
-    def _load_config(self, config_path):
-        path = Path(
-            config_path
-            or (Path(__file__).parent.parent / "config" / "backup_config.yaml")
-        )
-        with open(path, "r") as f:
-            return yaml.safe_load(f)
+    history = open_history(config)
+    if history is None:
+        print("History is not configured (set history.path in the config)")
+        return False
 
-    def run_backup_job(self) -> bool:
-        """Run backup job and return True if successful, False otherwise."""
-        try:
-            logger.info("Starting backup job%s", " (DRY RUN)" if self.dry_run else "")
+    print("Recent runs:")
+    for run in history.recent_runs(limit):
+        print(
+            f"  {run['timestamp']}  {run['status']:<22} "
+            f"{run['duration_seconds']:>8.1f}s  {run['total_files']:>8} files  "
+            f"{format_size(run['total_size']):>10}  "
+            f"{format_size(run['bytes_per_second'])}/s"
+        )
 
-            # Start NAS
-            logger.info("Powering on NAS")
-            self.nas_controller.start_nas()
+    source = None
+    for entry in history.directory_trend(limit=limit):
+        if entry["source"] != source:
+            source = entry["source"]
+            print(f"\nDirectory: {source}")
+        print(
+            f"  {entry['timestamp']}  {entry['status']:<22} "
+            f"{entry['duration_seconds']:>8.1f}s  "
+            f"{entry['files_transferred']:>8} files  "
+            f"{format_size(entry['size_bytes']):>10}  "
+            f"{format_size(entry['bytes_per_second'])}/s"
+        )
+    return True
 
-            # Run backup
-            logger.info("Starting backup process")
-            stats = self.backup_manager.run_backup()
 
-            # Send report
-            logger.info("Sending backup report")
-            self.email_sender.send_report(stats)
+def print_status(config) -> bool:
+    """Print the last run, whether a job is running and when the next ones are."""
+    from .checkpoint import Checkpoint
+    from .history import open_history
+    from .scheduler import DEFAULT_LOCK_FILE, JobLock, JobLocked, Scheduler
 
-            # Shutdown NAS
-            logger.info("Shutting down NAS")
-            self.nas_controller.shutdown_nas()
+    history = open_history(config)
+    runs = history.recent_runs(1) if history is not None else []
+    if runs:
+        run = runs[0]
+        print(
+            f"Last run: {run['timestamp']}  {run['status']}  "
+            f"{run['duration_seconds']:.1f}s  {run['total_files']} files  "
+            f"{format_size(run['total_size'])}"
+        )
+    else:
+        print("Last run: unknown" + ("" if history else " (history not configured)"))
 
-            logger.info("Backup job completed successfully")
+    schedule_config = config["backup"].get("schedule")
+    if not isinstance(schedule_config, dict):
+        schedule_config = {}
+    try:
+        with JobLock(schedule_config.get("lock_file", DEFAULT_LOCK_FILE)):
+            running = False
+    except JobLocked:
+        running = True
+    print(f"Job running: {'yes' if running else 'no'}")
 
-            # Check if any directory had errors
-            has_errors = any(
-                d.status == "completed_with_errors" for d in stats.directories.values()
+    checkpoint_config = config["backup"].get("checkpoint") or {}
+    if checkpoint_config.get("path"):
+        state = Checkpoint.pending_job(checkpoint_config["path"])
+        if state is not None:
+            done = sum(
+                1 for e in state["directories"].values() if e["status"] == "done"
             )
-            return not has_errors
-
-        except Exception as e:
-            error_msg = f"Backup job failed: {str(e)}"
-            logger.error(error_msg)
-            # Send error notification
-            self.email_sender.send_report(
-                BackupStats(
-                    total_files=0,
-                    total_size=0,
-                    status="failed",
-                    error=error_msg,
-                    timestamp=datetime.now().isoformat(),
-                    directories={},
-                )
+            print(
+                f"Interrupted job: started {state['started']}, {done} directories done"
             )
-            return False
 
+    scheduler = Scheduler(config, run_job=None)
+    print("Next runs:")
+    for source in scheduler.schedules:
+        next_run = scheduler.next_run(source)
+        when = next_run.strftime("%Y-%m-%d %H:%M") if next_run else "now (never ran)"
+        print(f"  {source}  {when}")
+    return True
 
-def main():
-    parser = argparse.ArgumentParser(description="NAS Backup Tool")
-    parser.add_argument(
-        "--dry-run", action="store_true", help="Run in dry-run mode (no actual changes)"
+
+def run_verification(config, sources=None, full=False) -> bool:
+    """Verify the backups on the mounted NAS; True if every copy matched."""
+    from .snapshots import SnapshotSet
+    from .transport import Transport
+    from .verify import Verifier, synced_path, verifier_for
+
+    if Transport.from_config(config).remote:
+        print("Verification reads the backups through the mount transport")
+        return False
+    # Asked for explicitly, so verify even without a verify section
+    verify_config = config["backup"].get("verify") or {"mode": "sample"}
+    ok = True
+    for dir_config in config["backup"]["directories"]:
+        source = dir_config["source"]
+        if sources and source not in sources:
+            continue
+        verifier = verifier_for(verify_config, dir_config) or Verifier()
+        if full:
+            verifier.mode = "full"
+        if dir_config.get("dedup"):
+            # Restoring checks every chunk against its hash instead
+            print(f"{source}: stored as chunks, verified on restore")
+            continue
+        if dir_config.get("archive"):
+            print(f"{source}: stored as archives, not verified")
+            continue
+        destination = dir_config["destination"]
+        if dir_config.get("snapshots"):
+            latest = SnapshotSet(destination).latest()
+            if latest is None:
+                print(f"{source}: no snapshot yet")
+                continue
+            destination = str(Path(destination) / latest)
+        result = verifier.verify(source, synced_path(source, destination))
+        if result is None:
+            continue
+        print(f"{source}: {result.format()}")
+        for path in result.mismatches:
+            print(f"  Mismatch: {path}")
+        for path in result.missing:
+            print(f"  Missing: {path}")
+        ok = ok and not result.failed
+    return ok
+
+
+def run_restore(config, source, target, manifest=None, path=None) -> bool:
+    """Rebuild a dedup-backed directory from one of its manifests."""
+    from .dedup import store_for
+
+    dir_config = next(
+        (d for d in config["backup"]["directories"] if d["source"] == source), None
     )
-    parser.add_argument(
+    if dir_config is not None and dir_config.get("archive"):
+        print(
+            f"{source} is archived: extract the last full archive in "
+            f"{dir_config['destination']} and every later incremental one, in "
+            "order. Files deleted since the full archive come back."
+        )
+        return False
+    if dir_config is None or not dir_config.get("dedup"):
+        print(f"{source} is not a directory backed up with dedup")
+        return False
+    store = store_for(config["backup"].get("dedup"), dir_config)
+    manifests = store.manifests(source)
+    if manifest:
+        manifests = [m for m in manifests if m.name.startswith(manifest)]
+    if not manifests:
+        print(f"No manifest of {source} found in {store.root}")
+        return False
+    restored = store.restore(manifests[-1], target, prefix=path)
+    print(f"Restored {restored} files from {manifests[-1].name} to {target}")
+    return True
+
+
+def run_backups(config, args) -> bool:
+    from .orchestrator import BackupOrchestrator
+    from .scheduler import Scheduler
+
+    logger.info("Starting with arguments: %s", args)
+    orchestrator = BackupOrchestrator(config, dry_run=args.dry_run, resume=args.resume)
+    try:
+        scheduler = Scheduler(
+            config, orchestrator.run_scheduled_job, dry_run=args.dry_run
+        )
+    except ValueError as e:
+        logger.error("Invalid schedule: %s", e)
+        return False
+
+    if args.once:
+        started = datetime.now()
+        success = orchestrator.run_backup_job()
+        # Keeps a scheduler started later from repeating what this run did
+        scheduler.record(orchestrator.backed_up, started)
+        logger.info("Completed single run, exiting")
+        return success
+
+    # Runs whatever is due (or was missed) right away, then sleeps until the
+    # next directory is due
+    scheduler.run_forever()
+    return True
+
+
+COMMANDS = ("run", "status", "history", "verify", "restore")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
         "--config",
         help="Path to config file (default: config/backup_config.yaml)",
     )
-    parser.add_argument(
+    parser = argparse.ArgumentParser(
+        description="NAS Backup Tool", epilog="Without a command, runs `run`."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser(
+        "run", parents=[common], help="Run backups on their schedule"
+    )
+    run.add_argument(
+        "--dry-run", action="store_true", help="Run in dry-run mode (no actual changes)"
+    )
+    run.add_argument(
         "--once",
         action="store_true",
         help="Run once without scheduling",
     )
-    args = parser.parse_args()
+    run.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run from its checkpoint, however old",
+    )
 
-    logger.info("Starting with arguments: %s", args)
+    commands.add_parser(
+        "status",
+        parents=[common],
+        help="Show the last run, a running or interrupted job and the next runs",
+    )
 
-    orchestrator = BackupOrchestrator(dry_run=args.dry_run, config_path=args.config)
+    history = commands.add_parser(
+        "history",
+        parents=[common],
+        help="Show recorded runs and per-directory trends",
+    )
+    history.add_argument("limit", type=int, nargs="?", default=10, metavar="N")
 
-    # Run immediately
-    success = orchestrator.run_backup_job()
+    verify = commands.add_parser(
+        "verify",
+        parents=[common],
+        help="Checksum the backups on the mounted NAS against the sources",
+    )
+    verify.add_argument("sources", nargs="*", help="Directories (default: all)")
+    verify.add_argument("--full", action="store_true", help="Check every file")
 
-    # Exit if --once is specified
-    if args.once:
-        logger.info("Completed single run, exiting")
-        sys.exit(0 if success else 1)
-
-    # Schedule backup based on configuration
-    frequency = orchestrator.config["backup"]["frequency"]
-
-    if frequency == "daily":
-        schedule.every().day.at("02:00").do(orchestrator.run_backup_job)
-    elif frequency == "weekly":
-        schedule.every().monday.at("02:00").do(orchestrator.run_backup_job)
-    elif frequency == "monthly":
-        schedule.every().first_monday_of_month.at("02:00").do(
-            orchestrator.run_backup_job
+    restore = commands.add_parser(
+        "restore",
+        parents=[common],
+        help="Rebuild a dedup-backed directory from a manifest",
+        description=(
+            "Rebuild a dedup-backed directory from a manifest. Archive "
+            "directories are restored by extracting the last full archive and "
+            "every later incremental one in order; deletions are not recorded "
+            "in incremental archives, so deleted files come back."
+        ),
+    )
+    restore.add_argument("source", help="Configured source directory")
+    restore.add_argument("target", help="Directory to restore into")
+    restore.add_argument(
+        "--manifest", help="Manifest name or timestamp prefix (default: latest)"
+    )
+    restore.add_argument("--path", help="Only restore this file or subdirectory")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # `main.py --config x.yaml [--once]` predates the commands and means `run`
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["run", *argv]
+    args = build_parser().parse_args(argv)
+    config = load_config(args.config)
+
+    if args.command == "status":
+        success = print_status(config)
+    elif args.command == "history":
+        success = print_history(config, args.limit)
+    elif args.command == "verify":
+        success = run_verification(config, args.sources, full=args.full)
+    elif args.command == "restore":
+        success = run_restore(
+            config, args.source, args.target, manifest=args.manifest, path=args.path
         )
     else:
-        logger.error(f"Unsupported backup frequency: {frequency}")
-        sys.exit(1)
-
-    # Keep the script running
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+        success = run_backups(config, args)
+    sys.exit(0 if success else 1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+import logging
+import os
+import tempfile
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+from .timing import PhaseTiming
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "nas_backup"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _gauge(lines: List[str], name: str, help_text: str, samples):
+    lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {PREFIX}_{name} gauge")
+    for labels, value in samples:
+        label_str = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+        suffix = f"{{{label_str}}}" if label_str else ""
+        lines.append(f"{PREFIX}_{name}{suffix} {value}")
+
+
+def _directory_labels(entry: dict) -> dict:
+    if entry["target"]:
+        return {"source": entry["source"], "target": entry["target"]}
+    return {"source": entry["source"]}
+
+
+def render_prometheus(report: dict, timings: List[PhaseTiming]) -> str:
+    """Render a run report (see report.build_report) for Prometheus.
+
+    Phase durations come from ``timings`` rather than the report, which is
+    built before the email and shutdown phases have run.
+    """
+    # Spans with the same name (e.g. one rsync command per shard) are summed
+    phase_totals = defaultdict(float)
+    for timing in timings:
+        phase_totals[timing.name] += timing.duration_seconds
+
+    timestamp = datetime.fromisoformat(report["timestamp"]).timestamp()
+    lines = []
+    _gauge(
+        lines,
+        "last_run_timestamp_seconds",
+        "Start time of the last backup run.",
+        [({}, f"{timestamp:.0f}")],
+    )
+    _gauge(
+        lines,
+        "last_run_success",
+        "1 if the last backup run succeeded, 0 otherwise.",
+        [({}, 0 if report["status"] == "failed" else 1)],
+    )
+    _gauge(
+        lines,
+        "last_run_duration_seconds",
+        "Duration of the backup phase of the last run.",
+        [({}, f"{report['duration_seconds']:.3f}")],
+    )
+    _gauge(
+        lines,
+        "phase_duration_seconds",
+        "Duration of each phase of the last backup run.",
+        [({"phase": name}, f"{total:.3f}") for name, total in phase_totals.items()],
+    )
+    if report["targets"]:
+        _gauge(
+            lines,
+            "target_success",
+            "1 if the last backup to a NAS target succeeded, 0 otherwise.",
+            [
+                ({"target": t["name"]}, 0 if t["status"] == "failed" else 1)
+                for t in report["targets"]
+            ],
+        )
+    directories = report["directories"]
+    _gauge(
+        lines,
+        "directory_duration_seconds",
+        "Duration of the last backup per directory.",
+        [(_directory_labels(d), f"{d['duration_seconds']:.3f}") for d in directories],
+    )
+    _gauge(
+        lines,
+        "directory_transferred_bytes",
+        "Bytes transferred by the last backup per directory.",
+        [(_directory_labels(d), d["size_bytes"]) for d in directories],
+    )
+    _gauge(
+        lines,
+        "directory_transferred_files",
+        "Files transferred by the last backup per directory.",
+        [(_directory_labels(d), d["files_transferred"]) for d in directories],
+    )
+    _gauge(
+        lines,
+        "directory_errors",
+        "rsync errors of the last backup per directory and category.",
+        [
+            ({**_directory_labels(d), "category": category}, count)
+            for d in directories
+            if d["errors"]
+            for category, count in sorted(d["errors"]["categories"].items())
+        ],
+    )
+    _gauge(
+        lines,
+        "directory_verify_failures",
+        "Mismatched or missing files found by the last verification per directory.",
+        [
+            (
+                _directory_labels(d),
+                len(d["verification"]["mismatches"] + d["verification"]["missing"]),
+            )
+            for d in directories
+            if d["verification"]
+        ],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path, report: dict, timings: List[PhaseTiming]):
+    """Atomically write metrics for node_exporter's textfile collector."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # node_exporter must never read a half-written file, so write then rename
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(render_prometheus(report, timings))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    logger.info("Wrote metrics to %s", path)
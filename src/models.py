@@ -1,9 +1,12 @@
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
+from .error_log import ErrorSummary
+from .timing import PhaseTiming
 from .utils import format_size
+from .verify import VerifyResult
 
 
 @dataclass
@@ -12,16 +15,36 @@ class DirectoryStats:
     files_transferred: int
     size_bytes: int
     timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
-    status: str = (
-        "success"  # Can be "success", "dry-run", "completed_with_errors", or "failed"
-    )
+    # Can be "success", "dry-run", "completed_with_errors", "skipped" or "failed"
+    status: str = "success"
     details: str = ""
     error_log: Optional[Path] = None
+    duration_seconds: float = 0.0
+    estimated_bytes: Optional[int] = None
+    error_summary: Optional[ErrorSummary] = None
+    # Snapshot mode: the snapshot written and the bytes hard-linked from the
+    # previous one instead of being transferred (size_bytes is the new data)
+    snapshot: Optional[str] = None
+    linked_bytes: int = 0
+    verification: Optional[VerifyResult] = None
+    # Dedup mode: the manifest written and the bytes of chunks already in the
+    # store (size_bytes is the new chunk data)
+    manifest: Optional[str] = None
+    deduplicated_bytes: int = 0
+    # Archive mode: the archive written (size_bytes is its compressed size)
+    archive: Optional[str] = None
+    # Name of the NAS target when backing up to several
+    target: Optional[str] = None
 
     @property
     def size_formatted(self) -> str:
         return format_size(self.size_bytes)
 
+    @property
+    def key(self) -> str:
+        """Unique per run: the source, prefixed by the target if there are several."""
+        return f"{self.target}:{self.source}" if self.target else self.source
+
 
 @dataclass
 class BackupStats:
@@ -31,6 +54,11 @@ class BackupStats:
     error: Optional[str] = None
     timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
     directories: Dict[str, DirectoryStats] = field(default_factory=dict)
+    duration_seconds: float = 0.0
+    timings: List[PhaseTiming] = field(default_factory=list)
+    # With several NAS targets: each target's own stats; the fields above
+    # then sum them up and directories are keyed by DirectoryStats.key
+    targets: Dict[str, "BackupStats"] = field(default_factory=dict)
 
     def format_total_size(self) -> str:
         return format_size(self.total_size)
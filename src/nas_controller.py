@@ -1,31 +1,209 @@
 import asyncio
+import json
 import logging
+import os
+import random
+import shlex
 import socket
+import statistics
+import tempfile
+import threading
 import time
 from pathlib import Path
+from typing import List, Optional
 
-import asyncssh
-from wakeonlan import send_magic_packet
-
+from .timing import span
+from .transport import Transport
 from .utils import run_command
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BOOT_CONFIG = {
+    "initial_interval": 2,  # seconds between the first probes
+    "max_interval": 30,  # upper bound for the backed-off interval
+    "backoff": 1.5,  # interval multiplier after every failed probe
+    "jitter": 0.2,  # +/- fraction applied to every interval
+    "timeout": 300,  # give up after this many seconds
+    "history_size": 10,  # boot durations remembered in state_file
+}
+
+
+class SSHSessionManager:
+    """Run many remote commands over one long-lived SSH connection.
+
+    The connection is opened lazily on a private event loop thread, kept alive
+    with SSH keepalives and transparently re-established if it drops. Commands
+    submitted together run in parallel as separate channels of the connection.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: Optional[str] = None,
+        port: int = 22,
+        keepalive_interval: int = 15,
+        max_sessions: int = 4,
+        command_timeout: Optional[float] = None,
+    ):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.keepalive_interval = keepalive_interval
+        self.max_sessions = max_sessions
+        self.command_timeout = command_timeout
+        self._conn = None
+        self._loop = None
+        self._thread = None
+        self._connect_lock = None
+        self._sessions = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, nas_config) -> "SSHSessionManager":
+        ssh_config = nas_config.get("ssh") or {}
+        return cls(
+            nas_config["ip"],
+            nas_config["username"],
+            password=nas_config.get("password"),
+            port=ssh_config.get("port", 22),
+            keepalive_interval=ssh_config.get("keepalive_interval", 15),
+            max_sessions=ssh_config.get("max_sessions", 4),
+            command_timeout=ssh_config.get("command_timeout"),
+        )
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever, name="ssh-session", daemon=True
+            )
+            self._thread.start()
+
+    def _submit(self, coro):
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _connection(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._sessions = asyncio.Semaphore(self.max_sessions)
+
+        # asyncssh pulls in cryptography, so it is only loaded once SSH is used
+        import asyncssh
+
+        async with self._connect_lock:
+            if self._conn is None or self._conn.is_closed():
+                logger.info("Opening SSH connection to %s", self.host)
+                self._conn = await asyncssh.connect(
+                    self.host,
+                    port=self.port,
+                    username=self.username,
+                    password=self.password,
+                    known_hosts=None,
+                    client_keys=None,
+                    keepalive_interval=self.keepalive_interval,
+                    keepalive_count_max=3,
+                )
+            return self._conn
+
+    async def _run(self, command: str, check: bool) -> str:
+        import asyncssh
+
+        for attempt in (1, 2):
+            conn = await self._connection()
+            try:
+                async with self._sessions:
+                    result = await conn.run(
+                        command, check=check, timeout=self.command_timeout
+                    )
+                return result.stdout
+            except asyncssh.ChannelOpenError as e:
+                # The command never started, so it is safe to retry it once
+                if attempt == 2:
+                    raise
+                logger.warning("SSH channel failed (%s), reconnecting", e)
+                self._drop(conn)
+            except (asyncssh.DisconnectError, OSError):
+                # The command may have run, don't repeat it; just make sure the
+                # next command gets a fresh connection
+                self._drop(conn)
+                raise
+
+    def _drop(self, conn):
+        conn.close()
+        if self._conn is conn:
+            self._conn = None
+
+    async def _run_many(self, commands: List[str], check: bool) -> List[str]:
+        return await asyncio.gather(*(self._run(c, check) for c in commands))
+
+    def run(self, command: str, check: bool = True) -> str:
+        """Run a command on the NAS and return its stdout."""
+        return self._submit(self._run(command, check))
+
+    def run_many(self, commands: List[str], check: bool = True) -> List[str]:
+        """Run commands concurrently over the shared connection.
+
+        Returns their stdout in the order given.
+        """
+        return self._submit(self._run_many(commands, check))
+
+    def close(self):
+        """Close the connection and stop the event loop thread."""
+        if self._loop is None:
+            return
+
+        async def _close():
+            if self._conn is not None:
+                self._conn.close()
+                await self._conn.wait_closed()
+                self._conn = None
+
+        try:
+            self._submit(_close())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._connect_lock = None
+
 
 class NASController:
     def __init__(self, config, dry_run=False):
         self.config = config
         self.dry_run = dry_run
         self.mount_point = Path(self.config["nas"]["mount"]["local_path"])
+        self.ssh = SSHSessionManager.from_config(self.config["nas"])
+        self.transport = Transport.from_config(self.config)
+
+    def _boot_config(self) -> dict:
+        return {**DEFAULT_BOOT_CONFIG, **(self.config["nas"].get("boot") or {})}
+
+    def _readiness_ports(self) -> list:
+        boot_config = self._boot_config()
+        if "ports" in boot_config:
+            return boot_config["ports"]
+        # SSH itself is probed for its banner
+        return [port for port in self.transport.ports if port != self.ssh.port]
 
     def _check_nas_connection(self, timeout: int = 5) -> bool:
-        """Check if NAS is accessible via SSH."""
+        """Check if NAS is ready: SSH sends its banner and transport ports are open."""
+        ip = self.config["nas"]["ip"]
         try:
-            with socket.create_connection(
-                (self.config["nas"]["ip"], 22), timeout=timeout
-            ):
-                return True
-        except (socket.timeout, socket.error):
+            # A listening port alone isn't enough, sshd may not be serving yet
+            with socket.create_connection((ip, self.ssh.port), timeout=timeout) as sock:
+                if not sock.recv(256).startswith(b"SSH-"):
+                    return False
+            for port in self._readiness_ports():
+                with socket.create_connection((ip, port), timeout=timeout):
+                    pass
+            return True
+        except OSError:
             return False
 
     def start_nas(self):
@@ -36,7 +214,8 @@ class NASController:
                     self.config["nas"]["mac_address"],
                 )
                 logger.info("[DRY RUN] Would wait for NAS to boot")
-                logger.info("[DRY RUN] Would mount NAS at %s", self.mount_point)
+                if self.transport.requires_mount:
+                    logger.info("[DRY RUN] Would mount NAS at %s", self.mount_point)
                 return
 
             # Check if NAS is already online
@@ -47,13 +226,20 @@ class NASController:
                 logger.info(
                     f"Sending WOL packet to {self.config['nas']['mac_address']}"
                 )
+                from wakeonlan import send_magic_packet
+
                 send_magic_packet(self.config["nas"]["mac_address"])
 
                 logger.info("Waiting for NAS to boot...")
-                self._verify_nas_online()
+                with span("boot_wait"):
+                    self._verify_nas_online()
 
             # Mount NAS
-            self._mount_nas()
+            if self.transport.requires_mount:
+                with span("mount"):
+                    self._mount_nas()
+            else:
+                logger.info("Using %s transport, not mounting NAS", self.transport.type)
 
         except Exception as e:
             logger.error(f"Failed to start NAS: {str(e)}")
@@ -70,17 +256,46 @@ class NASController:
                 return
 
             # Unmount NAS
-            self._unmount_nas()
+            if self.transport.requires_mount:
+                with span("unmount"):
+                    self._unmount_nas()
 
             logger.info(f"Connecting to NAS at {self.config['nas']['ip']}")
-            asyncio.run(
-                self._execute_ssh_command(self.config["nas"]["shutdown_command"])
-            )
+            with span("shutdown_command"):
+                self.ssh.run(self.config["nas"]["shutdown_command"], check=False)
             logger.info("Shutdown command executed successfully")
 
         except Exception as e:
             logger.error(f"Failed to shutdown NAS: {str(e)}")
             raise
+        finally:
+            self.ssh.close()
+
+    def run_remote(self, commands: List[str]) -> List[str]:
+        """Run commands on the NAS in parallel over the shared SSH connection."""
+        if self.dry_run:
+            for command in commands:
+                logger.info("[DRY RUN] Would execute on NAS: %s", command)
+            return ["" for _ in commands]
+
+        logger.info("Executing on NAS: %s", "; ".join(commands))
+        with span("remote_commands"):
+            return self.ssh.run_many(commands)
+
+    def run_hooks(self, stage: str):
+        """Run the nas.hooks.<stage> commands (e.g. pre_backup, post_backup)."""
+        commands = (self.config["nas"].get("hooks") or {}).get(stage) or []
+        if commands:
+            logger.info("Running %s hooks on NAS", stage)
+            self.run_remote(commands)
+
+    def remote_free_space(self, paths: List[str]) -> List[int]:
+        """Return the free bytes of each remote path, as reported by df."""
+        outputs = self.run_remote([f"df -Pk {shlex.quote(p)}" for p in paths])
+        if self.dry_run:
+            return [0 for _ in paths]
+        # Second line of POSIX df output: fs, blocks, used, available, ...
+        return [int(out.splitlines()[1].split()[3]) * 1024 for out in outputs]
 
     def _mount_nas(self):
         """Mount NAS share"""
@@ -142,37 +357,89 @@ class NASController:
             logger.error(f"Failed to check mount status: {str(e)}")
             return False
 
-    async def _execute_ssh_command(self, command):
-        async with asyncssh.connect(
-            self.config["nas"]["ip"],
-            username=self.config["nas"]["username"],
-            password=self.config["nas"].get("password"),
-            known_hosts=None,
-            client_keys=None,
-        ) as conn:
-            result = await conn.run(command)
-            return result.stdout
-
     def _verify_nas_online(self):
         if self.dry_run:
             logger.info("[DRY RUN] Would verify NAS is online")
             return True
 
-        retry_count = 0
-        max_retries = 10
-        wait_time = 30  # seconds to wait between retries
+        boot_config = self._boot_config()
+        started = time.monotonic()
+        deadline = started + boot_config["timeout"]
+
+        # Probing is pointless while the NAS is still booting, so start close to
+        # the boot time learned from previous runs
+        boot_times = self._load_boot_times()
+        if boot_times:
+            expected = statistics.median(boot_times)
+            initial_wait = min(expected * 0.8, boot_config["timeout"])
+            logger.info(
+                "NAS usually boots in %.0fs, first probe in %.0fs",
+                expected,
+                initial_wait,
+            )
+            time.sleep(initial_wait)
 
-        while retry_count < max_retries:
+        interval = boot_config["initial_interval"]
+        attempt = 0
+        while True:
+            attempt += 1
             if self._check_nas_connection():
-                logger.info("NAS is online and accepting connections")
+                boot_time = time.monotonic() - started
+                logger.info(
+                    "NAS is online and accepting connections after %.0fs", boot_time
+                )
+                self._record_boot_time(boot_time)
                 return True
-            else:
-                retry_count += 1
-                if retry_count < max_retries:
-                    logger.warning(
-                        f"NAS not responding, retrying ({retry_count}/{max_retries}) \
-                                after {wait_time} seconds.."
-                    )
-                    time.sleep(wait_time)
 
-        raise Exception("NAS failed to come online after maximum retries")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            jitter = boot_config["jitter"]
+            delay = min(interval, boot_config["max_interval"])
+            delay = min(delay * random.uniform(1 - jitter, 1 + jitter), remaining)
+            logger.warning(
+                "NAS not ready (attempt %d), probing again in %.1f seconds",
+                attempt,
+                delay,
+            )
+            time.sleep(delay)
+            interval *= boot_config["backoff"]
+
+        raise Exception(
+            f"NAS failed to come online within {boot_config['timeout']} seconds"
+        )
+
+    def _load_boot_times(self) -> list:
+        state_file = self._boot_config().get("state_file")
+        if not state_file or not Path(state_file).exists():
+            return []
+        try:
+            with open(state_file, "r") as f:
+                return json.load(f).get("boot_times", [])
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable boot state %s: %s", state_file, e)
+            return []
+
+    def _record_boot_time(self, boot_time: float):
+        boot_config = self._boot_config()
+        state_file = boot_config.get("state_file")
+        if not state_file:
+            return
+
+        boot_times = self._load_boot_times() + [round(boot_time, 1)]
+        boot_times = boot_times[-boot_config["history_size"] :]
+        path = Path(state_file)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # A reader must never see a half-written file
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"boot_times": boot_times}, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning("Failed to save boot state %s: %s", state_file, e)
@@ -0,0 +1,338 @@
+import logging
+import time
+from datetime import datetime
+from typing import List
+
+from .backup_manager import BackupManager, SourceCache
+from .email_sender import EmailSender
+from .history import open_history
+from .metrics import write_prometheus_textfile
+from .models import BackupStats
+from .nas_controller import NASController
+from .pipeline import Pipeline, StageSkipped
+from .report import ReportExporter, build_report
+from .scheduler import DEFAULT_LOCK_FILE, JobLock, JobLocked
+from .targets import load_targets
+from .timing import Tracer
+
+logger = logging.getLogger(__name__)
+
+# Directory statuses after which a source counts as run. Errors of single
+# files and preflight skips are reported, retrying wouldn't change them.
+RAN_STATUSES = ("success", "unchanged", "dry-run", "completed_with_errors", "skipped")
+
+
+class BackupOrchestrator:
+    def __init__(self, config, dry_run=False, resume=False):
+        self.dry_run = dry_run
+        self.config = config
+
+        self.nas_controller = NASController(self.config, dry_run=dry_run)
+        self.backup_manager = BackupManager(self.config, dry_run=dry_run, resume=resume)
+        # Several NAS targets replace the single controller and manager above
+        self.targets = load_targets(self.config)
+        self.nas_controllers = {
+            t.name: NASController(t.config, dry_run=dry_run) for t in self.targets
+        }
+        self.backup_managers = {
+            t.name: BackupManager(t.config, dry_run=dry_run, resume=resume)
+            for t in self.targets
+        }
+        # Preflight asks remote transports' NASes for their free space
+        self.backup_manager.remote_free_space = self.nas_controller.remote_free_space
+        for name, manager in self.backup_managers.items():
+            manager.remote_free_space = self.nas_controllers[name].remote_free_space
+        self.email_sender = EmailSender(self.config, dry_run=dry_run)
+        self.history = open_history(self.config)
+        self.report_exporter = ReportExporter(self.config, dry_run=dry_run)
+        # Sources the last job ran for (on every target)
+        self.backed_up: List[str] = []
+
+    def _record_history(self, report: dict):
+        if self.history is None:
+            return
+        if self.dry_run:
+            logger.info("[DRY RUN] Would record run in %s", self.history.path)
+            return
+        try:
+            self.history.record_run(report)
+        except Exception as e:
+            # Losing a history entry must not fail the backup itself
+            logger.error("Failed to record backup history: %s", e)
+
+    def _build_report(self, stats: BackupStats) -> dict:
+        """The report of a run, with trends against the last recorded run.
+
+        Must run before the run itself is recorded in the history.
+        """
+        previous_run, previous_directories = None, {}
+        if self.history is not None:
+            try:
+                runs = self.history.recent_runs(1)
+                previous_run = runs[0] if runs else None
+                previous_directories = {
+                    d["source"]: d for d in self.history.directory_trend(limit=1)
+                }
+            except Exception as e:
+                logger.warning("Reporting without trends, history unreadable: %s", e)
+        return build_report(stats, previous_run, previous_directories)
+
+    def _publish(self, stats: BackupStats, report: dict):
+        """Report a run everywhere: export, history and email."""
+        self.report_exporter.export(report)
+        self._record_history(report)
+        self.email_sender.send_report(stats, report)
+
+    def _export_metrics(self, report: dict, tracer: Tracer):
+        textfile = (self.config.get("metrics") or {}).get("textfile")
+        if not textfile:
+            return
+        if self.dry_run:
+            logger.info("[DRY RUN] Would write metrics to %s", textfile)
+            return
+        try:
+            write_prometheus_textfile(textfile, report, tracer.spans)
+        except Exception as e:
+            logger.error("Failed to write metrics: %s", e)
+
+    def run_backup_job(self, sources=None) -> bool:
+        """Run backup job and return True if successful, False otherwise.
+
+        ``sources`` limits the job to those directories (all by default).
+        """
+        self.backed_up = []
+        schedule_config = self.config["backup"].get("schedule")
+        if not isinstance(schedule_config, dict):
+            schedule_config = {}
+        lock = JobLock(schedule_config.get("lock_file", DEFAULT_LOCK_FILE))
+        try:
+            with lock:
+                started = time.monotonic()
+                tracer = Tracer()
+                with tracer.activate():
+                    return self._run_backup_job(started, tracer, sources)
+        except JobLocked as e:
+            logger.warning("Skipping backup job: %s", e)
+            return False
+
+    def run_scheduled_job(self, sources: List[str]) -> List[str]:
+        """Run a job for sources and return those it ran for."""
+        self.run_backup_job(sources)
+        return self.backed_up
+
+    def _backed_up(self, stats: BackupStats, sources=None) -> List[str]:
+        if stats.status != "success":
+            # A failed target has no directory stats to go by
+            return []
+        done = {}
+        for dir_stats in stats.directories.values():
+            ok = dir_stats.status in RAN_STATUSES
+            done[dir_stats.source] = done.get(dir_stats.source, True) and ok
+        if sources is None:
+            sources = [d["source"] for d in self.config["backup"]["directories"]]
+        return [source for source in sources if done.get(source)]
+
+    def _build_pipeline(self, tracer: Tracer, sources=None) -> Pipeline:
+        """Stages of a backup job and what each of them waits for.
+
+        Sources are scanned while the NAS boots, and the report is sent while
+        the post-backup hooks and the shutdown run.
+        """
+
+        def backup(prepared, _):
+            logger.info("Starting backup process")
+            stats = self.backup_manager.run_backup(prepared, sources=sources)
+            stats.timings = tracer.spans
+            return stats
+
+        def report(stats, run_report):
+            logger.info("Sending backup report")
+            self.email_sender.send_report(stats, run_report)
+
+        def shutdown(_):
+            logger.info("Shutting down NAS")
+            self.nas_controller.shutdown_nas()
+
+        hooks = self.nas_controller.run_hooks
+        return (
+            Pipeline()
+            .add("start_nas", self.nas_controller.start_nas)
+            .add("prepare", lambda: self.backup_manager.prepare(sources))
+            .add("pre_backup", lambda _: hooks("pre_backup"), after=["start_nas"])
+            .add("backup", backup, after=["prepare", "pre_backup"])
+            .add("report", self._build_report, after=["backup"])
+            .add("export", self.report_exporter.export, after=["report"])
+            # Recorded only once the report has read the previous run
+            .add("history", self._record_history, after=["report"])
+            .add("email", report, after=["backup", "report"])
+            .add("post_backup", lambda _: hooks("post_backup"), after=["backup"])
+            .add("shutdown_nas", shutdown, after=["post_backup"])
+        )
+
+    def _build_fanout_pipeline(self, tracer: Tracer, sources=None) -> Pipeline:
+        """Stages of a job backing up to several NAS targets.
+
+        Every target runs its own chain (wake-up and mount, hooks, backup,
+        shutdown) alongside the others, and the sources are scanned once for
+        all of them while the NASes boot. A failing target is reported as
+        failed without holding up or failing the others; only the report
+        waits for every target.
+        """
+        cache = SourceCache()
+        errors = {}
+
+        def guarded(name, func):
+            def run(*args):
+                if name in errors:
+                    raise StageSkipped(name)
+                try:
+                    return func(*args)
+                except Exception as e:
+                    logger.error("Target %s failed: %s", name, e)
+                    errors.setdefault(name, e)
+                    # Skip the rest of this target, keep the job going
+                    raise StageSkipped(name) from e
+
+            return run
+
+        def prepare():
+            prepared = {}
+            for name, manager in self.backup_managers.items():
+                manager.source_cache = cache
+                try:
+                    prepared[name] = guarded(name, manager.prepare)(sources)
+                except StageSkipped:
+                    pass  # recorded in errors, the target's backup is skipped
+            return prepared
+
+        pipeline = Pipeline().add("prepare", prepare, always=True)
+        for name, controller in self.nas_controllers.items():
+            manager = self.backup_managers[name]
+
+            def backup(prepared, _, name=name, manager=manager):
+                logger.info("Starting backup to %s", name)
+                stats = manager.run_backup(prepared[name], sources=sources)
+                for dir_stats in stats.directories.values():
+                    dir_stats.target = name
+                return stats
+
+            def hooks(stage, controller=controller):
+                return lambda _: controller.run_hooks(stage)
+
+            (
+                pipeline.add(f"start_nas:{name}", guarded(name, controller.start_nas))
+                .add(
+                    f"pre_backup:{name}",
+                    guarded(name, hooks("pre_backup")),
+                    after=[f"start_nas:{name}"],
+                )
+                .add(
+                    f"backup:{name}",
+                    guarded(name, backup),
+                    after=["prepare", f"pre_backup:{name}"],
+                )
+                .add(
+                    f"post_backup:{name}",
+                    guarded(name, hooks("post_backup")),
+                    after=[f"backup:{name}"],
+                )
+                .add(
+                    f"shutdown_nas:{name}",
+                    guarded(name, lambda _, c=controller: c.shutdown_nas()),
+                    after=[f"post_backup:{name}"],
+                )
+            )
+
+        def collect(*results):
+            stats = self._combine_targets(
+                dict(zip(self.nas_controllers, results)), errors
+            )
+            stats.timings = tracer.spans
+            return stats
+
+        def report(stats, run_report):
+            logger.info("Sending backup report")
+            self.email_sender.send_report(stats, run_report)
+
+        return (
+            pipeline.add(
+                "backup",
+                collect,
+                after=[f"backup:{name}" for name in self.nas_controllers],
+                always=True,
+            )
+            .add("report", self._build_report, after=["backup"])
+            .add("export", self.report_exporter.export, after=["report"])
+            .add("history", self._record_history, after=["report"])
+            .add("email", report, after=["backup", "report"])
+        )
+
+    def _combine_targets(self, results, errors) -> BackupStats:
+        """One BackupStats over all targets, each target's own under .targets."""
+        stats = BackupStats()
+        for name, target_stats in results.items():
+            if target_stats is None:
+                target_stats = BackupStats(status="failed", error=str(errors[name]))
+            stats.targets[name] = target_stats
+            stats.total_files += target_stats.total_files
+            stats.total_size += target_stats.total_size
+            stats.duration_seconds = max(
+                stats.duration_seconds, target_stats.duration_seconds
+            )
+            for dir_stats in target_stats.directories.values():
+                stats.directories[dir_stats.key] = dir_stats
+
+        failed = [n for n, t in stats.targets.items() if t.status == "failed"]
+        if failed:
+            stats.status = "failed" if len(failed) == len(results) else "partial"
+            stats.error = "; ".join(
+                f"{name}: {stats.targets[name].error}" for name in failed
+            )
+        return stats
+
+    def _run_backup_job(self, started: float, tracer: Tracer, sources=None) -> bool:
+        pipeline = None
+        try:
+            logger.info("Starting backup job%s", " (DRY RUN)" if self.dry_run else "")
+            if self.targets:
+                pipeline = self._build_fanout_pipeline(tracer, sources)
+            else:
+                pipeline = self._build_pipeline(tracer, sources)
+            results = pipeline.run()
+            stats = results["backup"]
+            self.backed_up = self._backed_up(stats, sources)
+
+            logger.info("Backup job finished with status %s", stats.status)
+            self._export_metrics(results["report"], tracer)
+
+            # Check if any directory or target had errors
+            has_errors = stats.status != "success" or any(
+                d.status == "completed_with_errors" for d in stats.directories.values()
+            )
+            return not has_errors
+
+        except Exception as e:
+            error_msg = f"Backup job failed: {str(e)}"
+            logger.error(error_msg)
+            if pipeline is not None and "report" in pipeline.results:
+                # The run was already reported and recorded; a failing email
+                # or shutdown must not add a second, failed record of it
+                logger.warning("Keeping the report already published for this run")
+                self.backed_up = self._backed_up(pipeline.results["backup"], sources)
+                self._export_metrics(pipeline.results["report"], tracer)
+                return False
+            failed_stats = BackupStats(
+                total_files=0,
+                total_size=0,
+                status="failed",
+                error=error_msg,
+                timestamp=datetime.now().isoformat(),
+                directories={},
+                duration_seconds=time.monotonic() - started,
+                timings=tracer.spans,
+            )
+            report = self._build_report(failed_stats)
+            self._export_metrics(report, tracer)
+            # Send error notification
+            self._publish(failed_stats, report)
+            return False
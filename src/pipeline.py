@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+from .timing import span
+
+logger = logging.getLogger(__name__)
+
+
+class StageSkipped(Exception):
+    """Raised for a stage that didn't run because a dependency failed."""
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[..., Any]
+    after: Tuple[str, ...] = ()
+    # Run even when dependencies failed, passing None for their results
+    always: bool = False
+
+
+class Pipeline:
+    """Run blocking stages concurrently, each as soon as its dependencies finish.
+
+    Stages run in worker threads under a timing span named after the stage and
+    receive the results of the stages they depend on as positional arguments,
+    in ``after`` order. When a stage fails, the stages depending on it are
+    skipped; everything else still runs to completion before the first
+    failure is raised. Stages added with ``always`` run regardless, e.g. to
+    collect the results of independent branches that may fail on their own.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+        self.results: Dict[str, Any] = {}
+        self.skipped: List[str] = []
+
+    def add(
+        self, name: str, func: Callable[..., Any], after=(), always=False
+    ) -> "Pipeline":
+        if name in self.stages:
+            raise ValueError(f"Duplicate pipeline stage: {name}")
+        # Dependencies must already exist, which also rules out cycles
+        missing = [dep for dep in after if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {missing}")
+        self.stages[name] = Stage(name, func, tuple(after), always)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        """Run all stages and return their results by name."""
+        return asyncio.run(self._run())
+
+    async def _run(self) -> Dict[str, Any]:
+        tasks: Dict[str, asyncio.Task] = {}
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, tasks))
+        outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException) and not isinstance(
+                outcome, StageSkipped
+            ):
+                raise outcome
+        return self.results
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task]):
+        for dep in stage.after:
+            try:
+                await tasks[dep]
+            except Exception:
+                if stage.always:
+                    continue
+                logger.warning("Skipping %s because %s did not finish", stage.name, dep)
+                self.skipped.append(stage.name)
+                raise StageSkipped(stage.name)
+
+        args = [self.results.get(dep) for dep in stage.after]
+        # to_thread copies the context, so spans nest under the active tracer
+        self.results[stage.name] = await asyncio.to_thread(self._call, stage, args)
+
+    def _call(self, stage: Stage, args):
+        with span(stage.name):
+            return stage.func(*args)
@@ -0,0 +1,226 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .dedup import store_for
+from .models import DirectoryStats
+from .rsync_output import RsyncOutputParser
+from .snapshots import INCOMPLETE, SnapshotSet
+from .transport import Transport
+from .utils import CommandError, format_size, stream_command
+from .verify import synced_path
+
+logger = logging.getLogger(__name__)
+
+
+def _is_copied(path, st) -> bool:
+    """Whether path looks like a copy of st to rsync (same size and mtime)."""
+    try:
+        copied = os.lstat(path)
+    except OSError:
+        return False
+    return (copied.st_size, int(copied.st_mtime)) == (st.st_size, int(st.st_mtime))
+
+
+class PreflightError(Exception):
+    """Raised when the destination can't hold what a backup would transfer."""
+
+
+class PreflightCheck:
+    """Estimate what each directory will transfer and check destination space.
+
+    Estimators:
+        rsync: ``rsync --dry-run --stats`` against the destination (accurate,
+            but walks the destination as well)
+        source_size: size of the source files that don't exist on the
+            destination with the same size and mtime (a local walk and one
+            stat per file on the mount; over a remote transport the whole
+            source, assuming everything is new)
+
+    Directories the change index found unchanged need nothing, and those with
+    a list of changed paths need at most the size of those paths; neither is
+    estimated. Dedup directories need at most the files their chunk index
+    doesn't know, and archive directories their source size.
+
+    Over a remote transport the free space of the share is asked from the NAS
+    with ``remote_free_space`` (e.g. NASController.remote_free_space); without
+    it, and in dry runs, only the estimates are reported.
+    """
+
+    def __init__(
+        self,
+        config,
+        dry_run=False,
+        remote_free_space: Optional[Callable[[List[str]], List[int]]] = None,
+    ):
+        self.config = config
+        self.dry_run = dry_run
+        self.preflight_config = config["backup"].get("preflight") or {}
+        self.transport = Transport.from_config(config)
+        self.remote_free_space = remote_free_space
+        self._remote_free: Dict[str, int] = {}
+
+    def run(
+        self, directories, prepared: Optional[dict] = None
+    ) -> Tuple[List[dict], Dict[str, DirectoryStats], dict]:
+        """Check all directories before anything is transferred.
+
+        ``prepared`` maps sources to their BackupManager.prepare() results.
+
+        Returns:
+            Tuple of (directories that fit, stats of the skipped directories,
+            estimated bytes per source)
+
+        Raises:
+            PreflightError: If a directory doesn't fit and on_insufficient is
+                "abort" (the default)
+        """
+        estimator = self.preflight_config.get("estimator", "rsync")
+        max_workers = self.preflight_config.get("max_workers", 4)
+        prepared = prepared or {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            estimates = list(
+                executor.map(
+                    lambda d: self.estimate(d, estimator, prepared.get(d["source"])),
+                    directories,
+                )
+            )
+        estimated = {
+            d["source"]: estimate for d, estimate in zip(directories, estimates)
+        }
+
+        if self.dry_run or (self.transport.remote and self.remote_free_space is None):
+            # Dry runs don't mount the NAS, and without remote_free_space
+            # there is no filesystem to ask: only report the estimates
+            for source, estimate in estimated.items():
+                logger.info("Preflight %s: needs ~%s", source, format_size(estimate))
+            if self.dry_run:
+                logger.info("Free space is not checked in dry runs")
+            else:
+                logger.info(
+                    "Free space is not checked for the %s transport",
+                    self.transport.type,
+                )
+            return list(directories), {}, estimated
+
+        margin = self.preflight_config.get("margin", 0.05)
+        reserve = self.preflight_config.get("reserve_bytes", 0)
+        free_by_device = {}
+        to_run, skipped, problems = [], {}, []
+
+        for dir_config, estimate in zip(directories, estimates):
+            device, free = self._free_space(dir_config["destination"])
+            remaining = free_by_device.setdefault(device, free - reserve)
+            needed = int(estimate * (1 + margin))
+            logger.info(
+                "Preflight %s: needs ~%s, %s available on destination",
+                dir_config["source"],
+                format_size(needed),
+                format_size(max(remaining, 0)),
+            )
+
+            if needed <= remaining:
+                free_by_device[device] = remaining - needed
+                to_run.append(dir_config)
+                continue
+
+            message = (
+                f"needs ~{format_size(needed)} but only "
+                f"{format_size(max(remaining, 0))} is free on "
+                f"{dir_config['destination']}"
+            )
+            problems.append(f"{dir_config['source']}: {message}")
+            skipped[dir_config["source"]] = DirectoryStats(
+                source=dir_config["source"],
+                files_transferred=0,
+                size_bytes=0,
+                status="skipped",
+                details=f"Skipped by preflight check: {message}",
+                estimated_bytes=estimate,
+            )
+
+        if problems and self.preflight_config.get("on_insufficient", "abort") != "skip":
+            raise PreflightError(
+                "Not enough space on destination:\n" + "\n".join(problems)
+            )
+        for problem in problems:
+            logger.warning("Skipping %s", problem)
+
+        return to_run, skipped, estimated
+
+    def estimate(self, dir_config, estimator: str, prepared=None) -> int:
+        """Estimate the bytes a backup of dir_config will transfer."""
+        if prepared is not None:
+            changes = prepared.changes
+            if prepared.completed is not None or (changes and changes.unchanged):
+                return 0
+            if changes is not None and not changes.full:
+                return prepared.scan.size(changes.paths)
+        if dir_config.get("dedup"):
+            store = store_for(self.config["backup"].get("dedup"), dir_config)
+            return store.changed_bytes(dir_config["source"])
+        if dir_config.get("archive"):
+            # Without a list of changes the whole tree goes into a full archive
+            if prepared is not None and prepared.scan is not None:
+                return prepared.scan.size()
+            return self._estimate_source_size(dir_config["source"])
+        destination = dir_config["destination"]
+        if dir_config.get("snapshots"):
+            # The new snapshot only stores what differs from the latest one
+            latest = SnapshotSet(destination).latest() or INCOMPLETE
+            destination = os.path.join(destination, latest)
+        if estimator == "rsync":
+            return self._estimate_rsync(dir_config["source"], destination)
+        if estimator == "source_size":
+            existing = None
+            if not self.transport.remote:
+                existing = synced_path(dir_config["source"], destination)
+            return self._estimate_source_size(dir_config["source"], existing)
+        raise ValueError(f"Unsupported preflight estimator: {estimator}")
+
+    def _estimate_rsync(self, source, destination) -> int:
+        parser = RsyncOutputParser()
+        cmd = ["rsync", "-a", "--dry-run", "--stats", "--safe-links"]
+        cmd.extend(self.transport.rsync_args())
+        cmd.extend([source, self.transport.destination(destination)])
+        try:
+            stream_command(
+                cmd, "Rsync estimate failed", parser.feed, env=self.transport.env()
+            )
+        except CommandError as e:
+            if e.returncode != 23:  # 23: Partial transfer due to error
+                raise
+        return parser.size_bytes
+
+    def _estimate_source_size(self, source, existing=None) -> int:
+        """Bytes of the files below source that aren't below existing yet."""
+        total = 0
+        for root, _, files in os.walk(source):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if existing is not None and _is_copied(
+                    os.path.join(existing, os.path.relpath(path, source)), st
+                ):
+                    continue
+                total += st.st_size
+        return total
+
+    def _free_space(self, destination) -> Tuple[int, int]:
+        """Return (device, free bytes) of the filesystem holding destination."""
+        if self.transport.remote:
+            # Destinations may not exist yet, ask for the share they live on
+            root = self.transport.remote_root
+            if root not in self._remote_free:
+                self._remote_free[root] = self.remote_free_space([root])[0]
+            return root, self._remote_free[root]
+        # The destination may not exist yet, use its closest existing parent
+        path = os.path.abspath(destination)
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        st = os.statvfs(path)
+        return os.stat(path).st_dev, st.f_bavail * st.f_frsize
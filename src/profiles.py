@@ -0,0 +1,126 @@
+import re
+from dataclasses import dataclass, field, fields, replace
+from typing import Dict, List, Optional
+
+BWLIMIT_PATTERN = re.compile(r"^\d+(\.\d+)?[KMGkmg]?$")
+CHECKSUM_CHOICES = ("auto", "xxh128", "xxh3", "xxh64", "xxhash", "md5", "md4", "sha1")
+
+
+@dataclass(frozen=True)
+class RsyncProfile:
+    """Per-directory rsync tuning on top of the fixed base flags.
+
+    ``None`` keeps rsync's own default for that option.
+    """
+
+    # Skip the delta algorithm; rsync already does this for local (mount) copies
+    whole_file: Optional[bool] = None
+    # Compress on the wire; only useful with the ssh/rsync_daemon transports
+    compress: bool = False
+    # Update files in place instead of writing a temp copy, for huge files
+    inplace: bool = False
+    # Bandwidth limit, e.g. "20M" (rsync --bwlimit syntax)
+    bwlimit: Optional[str] = None
+    # Checksum algorithm for delta transfers (rsync >= 3.2)
+    checksum_choice: Optional[str] = None
+    # Incremental recursion keeps file-list memory low; -H works better without
+    inc_recursive: bool = True
+    # Preserve hard links (-H)
+    hard_links: bool = False
+    extra_args: List[str] = field(default_factory=list)
+
+    def rsync_args(self) -> List[str]:
+        args = []
+        if self.whole_file is not None:
+            args.append("--whole-file" if self.whole_file else "--no-whole-file")
+        if self.compress:
+            args.append("--compress")
+        if self.inplace:
+            args.append("--inplace")
+        if self.bwlimit:
+            args.append(f"--bwlimit={self.bwlimit}")
+        if self.checksum_choice:
+            args.append(f"--checksum-choice={self.checksum_choice}")
+        if not self.inc_recursive:
+            args.append("--no-inc-recursive")
+        if self.hard_links:
+            args.append("--hard-links")
+        return args + list(self.extra_args)
+
+
+PRESETS: Dict[str, RsyncProfile] = {
+    "default": RsyncProfile(),
+    # Few multi-GB files on a fast LAN: no delta pass, no temp copies
+    "photos-large-files": RsyncProfile(whole_file=True, inplace=True),
+    # Many small files: the file list dominates, keep it incremental
+    "many-small-docs": RsyncProfile(whole_file=True, checksum_choice="xxh3"),
+    # Slow or remote links: delta transfer plus compression
+    "wan": RsyncProfile(whole_file=False, compress=True),
+    # Trees with hard links (e.g. snapshot folders) need the full file list
+    "hardlinked-trees": RsyncProfile(hard_links=True, inc_recursive=False),
+}
+
+
+def validate_profile(profile: RsyncProfile, name: str = "profile"):
+    if profile.bwlimit is not None and not BWLIMIT_PATTERN.match(str(profile.bwlimit)):
+        raise ValueError(f"{name}: invalid bwlimit {profile.bwlimit!r}")
+    if (
+        profile.checksum_choice is not None
+        and profile.checksum_choice not in CHECKSUM_CHOICES
+    ):
+        raise ValueError(
+            f"{name}: invalid checksum_choice {profile.checksum_choice!r}, "
+            f"expected one of {', '.join(CHECKSUM_CHOICES)}"
+        )
+    if profile.inplace and profile.whole_file is False:
+        # Delta updates in place can't reference blocks they already overwrote
+        raise ValueError(f"{name}: inplace requires whole_file to not be false")
+    for option in ("compress", "inplace", "inc_recursive", "hard_links"):
+        if not isinstance(getattr(profile, option), bool):
+            raise ValueError(f"{name}: {option} must be true or false")
+    if profile.whole_file not in (None, True, False):
+        raise ValueError(f"{name}: whole_file must be true, false or unset")
+    if not isinstance(profile.extra_args, list) or not all(
+        isinstance(arg, str) for arg in profile.extra_args
+    ):
+        raise ValueError(f"{name}: extra_args must be a list of strings")
+
+
+def _from_spec(spec: dict, profiles: Dict[str, RsyncProfile], name: str):
+    spec = dict(spec)
+    base_name = spec.pop("base", "default")
+    if base_name not in profiles:
+        raise ValueError(f"{name}: unknown base profile {base_name!r}")
+
+    known = {f.name for f in fields(RsyncProfile)}
+    unknown = set(spec) - known
+    if unknown:
+        raise ValueError(f"{name}: unknown options {', '.join(sorted(unknown))}")
+
+    profile = replace(profiles[base_name], **spec)
+    validate_profile(profile, name)
+    return profile
+
+
+def load_profiles(backup_config) -> Dict[str, RsyncProfile]:
+    """Return the presets plus the custom profiles of backup.profiles."""
+    profiles = dict(PRESETS)
+    for name, spec in (backup_config.get("profiles") or {}).items():
+        profiles[name] = _from_spec(spec, profiles, f"profile {name}")
+    return profiles
+
+
+def resolve_profile(spec, profiles: Dict[str, RsyncProfile]) -> RsyncProfile:
+    """Resolve a directory's ``profile`` setting: a name or inline options."""
+    if spec is None:
+        return profiles["default"]
+    if isinstance(spec, str):
+        if spec not in profiles:
+            raise ValueError(
+                f"Unknown rsync profile {spec!r}, "
+                f"expected one of {', '.join(sorted(profiles))}"
+            )
+        return profiles[spec]
+    if isinstance(spec, dict):
+        return _from_spec(spec, profiles, "inline profile")
+    raise ValueError(f"Invalid rsync profile: {spec!r}")
@@ -0,0 +1,169 @@
+import json
+import logging
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+from .utils import format_size
+
+logger = logging.getLogger(__name__)
+
+# rsync --info=progress2 line, e.g.
+#     32,768,000  45%   12.34MB/s    0:00:10 (xfr#5, to-chk=10/100)
+PROGRESS_PATTERN = re.compile(
+    r"^\s*([\d,]+)\s+(\d+)%\s+\S+/s\s+\d+:\d{2}:\d{2}"
+    r"(?:\s+\(xfr#(\d+), (?:ir|to)-chk=\d+/\d+\))?"
+)
+# First line of the --stats section, after which no more files are listed
+STATS_HEADER = "Number of files:"
+
+
+@dataclass
+class TransferProgress:
+    source: str
+    bytes_transferred: int
+    files_transferred: int
+    percent: int
+    elapsed_seconds: float
+    bytes_per_second: float
+    files_per_second: float
+    eta_seconds: Optional[float] = None
+    current_file: Optional[str] = None
+    finished: bool = False
+    timestamp: str = ""
+
+    def __str__(self) -> str:
+        eta = f"{self.eta_seconds:.0f}s" if self.eta_seconds is not None else "?"
+        return (
+            f"{self.source}: {self.percent}% "
+            f"{format_size(self.bytes_transferred)} at "
+            f"{format_size(self.bytes_per_second)}/s, "
+            f"{self.files_transferred} files at {self.files_per_second:.1f}/s, "
+            f"ETA {eta}, current: {self.current_file or '-'}"
+        )
+
+
+class LogProgressSink:
+    """Emit progress as log lines."""
+
+    def __call__(self, progress: TransferProgress):
+        logger.info("Progress %s", progress)
+
+
+class JsonLinesProgressSink:
+    """Append progress as one JSON object per line to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, progress: TransferProgress):
+        line = json.dumps(asdict(progress))
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class CallbackProgressSink:
+    """Forward progress to an arbitrary callable."""
+
+    def __init__(self, callback: Callable[[TransferProgress], None]):
+        self.callback = callback
+
+    def __call__(self, progress: TransferProgress):
+        self.callback(progress)
+
+
+def create_progress_sink(progress_config):
+    """Build a progress sink from the backup.progress config block."""
+    if not progress_config:
+        return None
+
+    sink = progress_config.get("sink", "log")
+    if sink == "log":
+        return LogProgressSink()
+    if sink == "jsonl":
+        return JsonLinesProgressSink(progress_config["path"])
+    raise ValueError(f"Unsupported progress sink: {sink}")
+
+
+class ProgressTracker:
+    """Turn rsync --info=progress2 output into throttled TransferProgress events.
+
+    Feed it every rsync output line; it remembers the file currently being
+    transferred and emits to the sink at most once per ``interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        sink: Callable[[TransferProgress], None],
+        interval: float = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.source = source
+        self.sink = sink
+        self.interval = interval
+        self.clock = clock
+        self.started = clock()
+        self.current_file = None
+        self.bytes_transferred = 0
+        self.files_transferred = 0
+        self.percent = 0
+        self._last_emit = None
+        self._in_stats = False
+
+    def feed(self, line: str):
+        match = PROGRESS_PATTERN.match(line)
+        if not match:
+            if line.startswith(STATS_HEADER):
+                self._in_stats = True
+            elif line.strip() and not self._in_stats:
+                self.current_file = line.strip()
+            return
+
+        self.bytes_transferred = int(match.group(1).replace(",", ""))
+        self.percent = int(match.group(2))
+        if match.group(3):
+            self.files_transferred = int(match.group(3))
+
+        now = self.clock()
+        if self._last_emit is None or now - self._last_emit >= self.interval:
+            self._emit(now)
+
+    def finish(self):
+        """Emit a final event once the transfer is over."""
+        self._emit(self.clock(), finished=True)
+
+    def _emit(self, now: float, finished: bool = False):
+        self._last_emit = now
+        elapsed = now - self.started
+        bytes_per_second = self.bytes_transferred / elapsed if elapsed > 0 else 0.0
+        files_per_second = self.files_transferred / elapsed if elapsed > 0 else 0.0
+
+        eta = None
+        if finished:
+            eta = 0.0
+        elif 0 < self.percent < 100:
+            eta = elapsed * (100 - self.percent) / self.percent
+
+        progress = TransferProgress(
+            source=self.source,
+            bytes_transferred=self.bytes_transferred,
+            files_transferred=self.files_transferred,
+            percent=self.percent,
+            elapsed_seconds=round(elapsed, 3),
+            bytes_per_second=round(bytes_per_second, 1),
+            files_per_second=round(files_per_second, 2),
+            eta_seconds=round(eta, 1) if eta is not None else None,
+            current_file=None if finished else self.current_file,
+            finished=finished,
+            timestamp=datetime.now().isoformat(),
+        )
+        try:
+            self.sink(progress)
+        except Exception as e:
+            # Telemetry must never break the backup itself
+            logger.warning("Progress sink failed: %s", e)
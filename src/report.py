@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import tempfile
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, Optional
+
+from .models import BackupStats, DirectoryStats
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever a field is renamed or removed; adding fields keeps it
+SCHEMA_VERSION = 1
+# Compared against the previous run of the same directory
+TREND_FIELDS = ("files_transferred", "size_bytes", "duration_seconds")
+RUN_TREND_FIELDS = ("total_files", "total_size", "duration_seconds")
+
+
+def _rate(size: int, duration: float) -> float:
+    return round(size / duration, 1) if duration > 0 else 0.0
+
+
+def _trend(current: dict, previous: Optional[dict], fields) -> Optional[dict]:
+    """Changes since previous, a history row; None without one."""
+    if not previous:
+        return None
+    trend = {"previous_timestamp": previous["timestamp"]}
+    for name in (*fields, "bytes_per_second"):
+        trend[name] = round(current[name] - previous[name], 3)
+    return trend
+
+
+def _directory(dir_stats: DirectoryStats, previous: Optional[dict]) -> dict:
+    entry = {
+        "key": dir_stats.key,
+        "source": dir_stats.source,
+        "target": dir_stats.target,
+        "timestamp": dir_stats.timestamp,
+        "status": dir_stats.status,
+        "details": dir_stats.details,
+        "files_transferred": dir_stats.files_transferred,
+        "size_bytes": dir_stats.size_bytes,
+        "duration_seconds": round(dir_stats.duration_seconds, 3),
+        "bytes_per_second": _rate(dir_stats.size_bytes, dir_stats.duration_seconds),
+        "estimated_bytes": dir_stats.estimated_bytes,
+        "error_log": str(dir_stats.error_log) if dir_stats.error_log else None,
+        "errors": asdict(dir_stats.error_summary) if dir_stats.error_summary else None,
+        "snapshot": dir_stats.snapshot,
+        "linked_bytes": dir_stats.linked_bytes,
+        "manifest": dir_stats.manifest,
+        "deduplicated_bytes": dir_stats.deduplicated_bytes,
+        "archive": dir_stats.archive,
+        "verification": (
+            asdict(dir_stats.verification) if dir_stats.verification else None
+        ),
+    }
+    entry["trend"] = _trend(entry, previous, TREND_FIELDS)
+    return entry
+
+
+def build_report(
+    stats: BackupStats,
+    previous_run: Optional[dict] = None,
+    previous_directories: Optional[Dict[str, dict]] = None,
+) -> dict:
+    """The report of a run as JSON-compatible data.
+
+    Every consumer (the JSON export, the webhook, the email, the history and
+    the Prometheus metrics) reads this one structure. ``previous_run`` and
+    ``previous_directories`` (keyed like DirectoryStats.key) are rows of the
+    run history; with them each entry carries a ``trend`` of deltas against
+    the previous run.
+    """
+    previous_directories = previous_directories or {}
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "timestamp": stats.timestamp,
+        "status": stats.status,
+        "error": stats.error,
+        "total_files": stats.total_files,
+        "total_size": stats.total_size,
+        "duration_seconds": round(stats.duration_seconds, 3),
+        "bytes_per_second": _rate(stats.total_size, stats.duration_seconds),
+        "targets": [
+            {
+                "name": name,
+                "status": target.status,
+                "error": target.error,
+                "total_files": target.total_files,
+                "total_size": target.total_size,
+                "duration_seconds": round(target.duration_seconds, 3),
+            }
+            for name, target in stats.targets.items()
+        ],
+        "directories": [
+            _directory(d, previous_directories.get(d.key))
+            for d in stats.directories.values()
+        ],
+        "timings": [asdict(timing) for timing in stats.timings],
+    }
+    report["trend"] = _trend(report, previous_run, RUN_TREND_FIELDS)
+    return report
+
+
+class ReportExporter:
+    """Writes run reports to a local file and/or posts them to a webhook.
+
+    A ``path`` ending in ``.jsonl`` gets one line appended per run; any other
+    path is replaced by the latest report. Export failures are logged and
+    never fail the backup.
+    """
+
+    def __init__(self, config, dry_run=False):
+        self.config = config.get("reports") or {}
+        self.dry_run = dry_run
+
+    def export(self, report: dict):
+        path = self.config.get("path")
+        webhook = self.config.get("webhook") or {}
+        if self.dry_run:
+            for where in filter(None, (path, webhook.get("url"))):
+                logger.info("[DRY RUN] Would export the run report to %s", where)
+            return
+        if path:
+            try:
+                self.write_file(path, report)
+            except Exception as e:
+                logger.error("Failed to write the run report: %s", e)
+        if webhook.get("url"):
+            try:
+                self.post(webhook, report)
+            except Exception as e:
+                logger.error("Failed to post the run report: %s", e)
+
+    @staticmethod
+    def write_file(path, report: dict):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".jsonl":
+            with open(path, "a") as f:
+                f.write(json.dumps(report, separators=(",", ":")) + "\n")
+            return
+        # Readers never see a half-written report
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(report, f, indent=2)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.info("Wrote the run report to %s", path)
+
+    @staticmethod
+    def post(webhook: dict, report: dict):
+        # Only needed for webhooks, keep it off the CLI's startup path
+        import urllib.request
+
+        request = urllib.request.Request(
+            webhook["url"],
+            data=json.dumps(report).encode(),
+            headers={"Content-Type": "application/json", **webhook.get("headers", {})},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=webhook.get("timeout", 10)):
+            pass
+        logger.info("Posted the run report to %s", webhook["url"])
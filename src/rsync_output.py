@@ -0,0 +1,74 @@
+import re
+
+# Regular expressions for parsing rsync --stats output
+FILES_PATTERN = re.compile(r"Number of regular files transferred: (\d+)")
+SIZE_PATTERN = re.compile(r"Total transferred file size: ([\d,]+) bytes")
+TOTAL_SIZE_PATTERN = re.compile(r"Total file size: ([\d,]+) bytes")
+
+# The --stats lines shown as a directory's details. Anchored, so that per-file
+# lines naming e.g. "created_at.jpg" never end up in the summary
+SUMMARY_PATTERN = re.compile(
+    r"^(Number of (created|deleted) files|Number of regular files transferred"
+    r"|Total transferred file size): "
+)
+
+
+class RsyncOutputParser:
+    """Incrementally parse rsync output one line at a time.
+
+    Only the values needed for DirectoryStats are kept, so memory stays bounded
+    no matter how long the per-file listing is.
+    """
+
+    def __init__(self):
+        self.files_transferred = 0
+        self.size_bytes = 0
+        self.total_size_bytes = 0  # size of all files rsync looked at
+        self.dry_run = False
+        self.summary_lines = []
+        self._files_found = False
+        self._size_found = False
+        self._total_size_found = False
+
+    def feed(self, line: str):
+        if not self.dry_run and "DRY RUN" in line:
+            self.dry_run = True
+
+        if not self._files_found:
+            match = FILES_PATTERN.search(line)
+            if match:
+                self.files_transferred = int(match.group(1))
+                self._files_found = True
+
+        if not self._size_found:
+            match = SIZE_PATTERN.search(line)
+            if match:
+                self.size_bytes = int(match.group(1).replace(",", ""))
+                self._size_found = True
+
+        if not self._total_size_found:
+            match = TOTAL_SIZE_PATTERN.search(line)
+            if match:
+                self.total_size_bytes = int(match.group(1).replace(",", ""))
+                self._total_size_found = True
+
+        stripped = line.strip()
+        if SUMMARY_PATTERN.match(stripped):
+            self.summary_lines.append(stripped)
+
+    def merge(self, other: "RsyncOutputParser"):
+        """Fold the results of another rsync run (e.g. a shard) into this one."""
+        self.files_transferred += other.files_transferred
+        self.size_bytes += other.size_bytes
+        self.total_size_bytes += other.total_size_bytes
+        self.dry_run = self.dry_run or other.dry_run
+        self.summary_lines.extend(other.summary_lines)
+
+    def feed_output(self, output: str):
+        """Parse a complete, already captured rsync output."""
+        for line in output.splitlines():
+            self.feed(line)
+
+    @property
+    def summary(self) -> str:
+        return " | ".join(self.summary_lines)
@@ -0,0 +1,296 @@
+import fcntl
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# The old ``backup.frequency`` values, as cron expressions
+FREQUENCIES = {
+    "daily": "0 2 * * *",
+    "weekly": "0 2 * * 1",
+    "monthly": "0 2 1 * *",
+}
+MONTH_NAMES = "jan feb mar apr may jun jul aug sep oct nov dec".split()
+WEEKDAY_NAMES = "sun mon tue wed thu fri sat".split()
+# Wake up at least this often, so a suspended host or a clock change is noticed
+MAX_SLEEP_SECONDS = 3600
+DEFAULT_LOCK_FILE = os.path.join(tempfile.gettempdir(), "nas-backup.lock")
+
+
+def _parse_value(value: str, low: int, names: Optional[List[str]]) -> int:
+    if names and value.lower() in names:
+        return names.index(value.lower()) + low
+    return int(value)
+
+
+def _parse_field(text: str, low: int, high: int, names=None) -> set:
+    values = set()
+    for part in text.split(","):
+        spec, _, step = part.partition("/")
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = (_parse_value(v, low, names) for v in spec.split("-", 1))
+        else:
+            start = _parse_value(spec, low, names)
+            end = high if step else start
+        step = int(step) if step else 1
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"Invalid cron field: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """A standard five-field cron expression: minute hour day month weekday.
+
+    Fields take ``*``, numbers, ranges, lists and steps (``*/15``, ``1-5``,
+    ``mon,thu``). As in cron, a day matching either the day-of-month or the
+    weekday field runs when both are restricted.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12, MONTH_NAMES)
+        # 7 is Sunday too
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7, WEEKDAY_NAMES)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+        self.next_after(datetime(2000, 1, 1))  # e.g. "0 0 30 2 *" never runs
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day = dt.day in self.days
+        weekday = dt.isoweekday() % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, dt: datetime) -> datetime:
+        """The first time strictly after dt that matches."""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Leap days are the rarest match, 8 years covers them
+        limit = dt + timedelta(days=366 * 8)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(
+                    day=1
+                )
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+class JobLocked(RuntimeError):
+    """Another backup job holds the lock."""
+
+
+class JobLock:
+    """An exclusive lock on a file, held while a backup job runs.
+
+    The kernel releases it when the process exits, so a crashed job never
+    leaves a stale lock behind.
+    """
+
+    def __init__(self, path=DEFAULT_LOCK_FILE):
+        self.path = Path(path)
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "JobLock":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise JobLocked(f"Another backup job holds {self.path}") from None
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class Scheduler:
+    """Runs backup jobs when directories are due, per their cron schedules.
+
+    Every directory follows ``backup.schedule.cron`` unless it has its own
+    ``schedule``, so heavy trees can run less often than small ones. A job
+    backs up all directories due at that moment. The time each directory last
+    ran is kept in ``state_file``, so runs missed while the host was off or
+    asleep happen on startup (``catch_up``); a job that overruns the next
+    event is followed by a single catch-up run, never a pile of them.
+
+    ``run_job`` returns the directories it ran for. Only those are recorded;
+    the others (their job raised, found the lock held or the directory failed)
+    are tried again after ``retry_minutes``, at most ``max_retries`` times
+    before waiting for their next scheduled run.
+    """
+
+    def __init__(
+        self,
+        config,
+        run_job: Callable[[List[str]], List[str]],
+        dry_run=False,
+        clock: Callable[[], datetime] = datetime.now,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        backup_config = config["backup"]
+        schedule_config = backup_config.get("schedule") or {}
+        if isinstance(schedule_config, str):
+            schedule_config = {"cron": schedule_config}
+        default = schedule_config.get("cron")
+        if default is None:
+            frequency = backup_config.get("frequency", "daily")
+            if frequency not in FREQUENCIES:
+                raise ValueError(f"Unsupported backup frequency: {frequency}")
+            default = FREQUENCIES[frequency]
+        self.schedules: Dict[str, CronSchedule] = {
+            d["source"]: CronSchedule(d.get("schedule") or default)
+            for d in backup_config["directories"]
+        }
+        self.run_job = run_job
+        self.dry_run = dry_run
+        self.clock = clock
+        self.sleep = sleep
+        self.jitter_seconds = schedule_config.get("jitter_minutes", 0) * 60
+        self.retry_delay = timedelta(minutes=schedule_config.get("retry_minutes", 60))
+        self.max_retries = schedule_config.get("max_retries", 3)
+        # Directories whose last job failed, when to try them again and how
+        # often they were retried since their scheduled run
+        self.retry_at: Dict[str, datetime] = {}
+        self.retries: Dict[str, int] = {}
+        self.state_file = schedule_config.get("state_file")
+        self.last_runs = self._load_state()
+
+        started = clock()
+        if not schedule_config.get("catch_up", True):
+            # Missed runs are dropped, the next one follows the schedule
+            self.last_runs = {source: started for source in self.schedules}
+
+    def _load_state(self) -> Dict[str, datetime]:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+            return {
+                source: datetime.fromisoformat(last)
+                for source, last in state["last_runs"].items()
+            }
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(
+                "Ignoring unreadable schedule state %s: %s", self.state_file, e
+            )
+            return {}
+
+    def _save_state(self):
+        if not self.state_file or self.dry_run:
+            return
+        path = Path(self.state_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_suffix(".tmp")
+        tmp_file.write_text(
+            json.dumps(
+                {"last_runs": {s: t.isoformat() for s, t in self.last_runs.items()}}
+            )
+        )
+        os.replace(tmp_file, path)
+
+    def next_run(self, source: str) -> Optional[datetime]:
+        """When source is due next; None if it never ran (it's due now)."""
+        last = self.last_runs.get(source)
+        if last is None:
+            return None
+        return self.schedules[source].next_after(last)
+
+    def due(self, now: datetime) -> List[str]:
+        return [
+            source
+            for source in self.schedules
+            if ((next_run := self.next_run(source)) is None or next_run <= now)
+            and self.retry_at.get(source, now) <= now
+        ]
+
+    def run_pending(self) -> List[str]:
+        """Run one job for every directory that is due, return their sources."""
+        due = self.due(self.clock())
+        if not due:
+            return []
+        if self.jitter_seconds:
+            # Spread the load when several hosts share the NAS and schedule
+            self.sleep(random.uniform(0, self.jitter_seconds))
+        started = self.clock()
+        logger.info("Scheduled backup of %d directories", len(due))
+        ran = set(self.run_job(due))
+        self.record([source for source in due if source in ran], started)
+        now = self.clock()
+        for source in due:
+            if source not in ran:
+                self._schedule_retry(source, now)
+        return due
+
+    def _schedule_retry(self, source: str, now: datetime):
+        retries = self.retries.get(source, 0)
+        if retries < self.max_retries:
+            self.retries[source] = retries + 1
+            retry_at = now + self.retry_delay
+        else:
+            # Don't wake the NAS all day for a directory that keeps failing
+            self.retries.pop(source, None)
+            retry_at = self.schedules[source].next_after(now)
+        logger.warning(
+            "Not backed up: %s, retrying at %s",
+            source,
+            retry_at.strftime("%Y-%m-%d %H:%M"),
+        )
+        self.retry_at[source] = retry_at
+
+    def record(self, sources: List[str], started: datetime):
+        """Remember that sources were backed up by a job started at started."""
+        for source in sources:
+            self.last_runs[source] = started
+            self.retry_at.pop(source, None)
+            self.retries.pop(source, None)
+        self._save_state()
+
+    def seconds_until_next(self) -> float:
+        now = self.clock()
+        upcoming = [
+            max(self.next_run(source) or now, self.retry_at.get(source, now))
+            for source in self.schedules
+        ]
+        return max((min(upcoming) - now).total_seconds(), 0.0)
+
+    def run_forever(self):
+        while True:
+            if self.run_pending():
+                continue
+            delay = self.seconds_until_next()
+            logger.info(
+                "Next backup at %s",
+                (self.clock() + timedelta(seconds=delay)).strftime("%Y-%m-%d %H:%M"),
+            )
+            self.sleep(min(delay, MAX_SLEEP_SECONDS))
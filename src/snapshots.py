@@ -0,0 +1,143 @@
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "%Y-%m-%d_%H%M%S"
+# rsync writes here; the directory is renamed to its timestamp once complete,
+# so an interrupted run simply continues into it next time
+INCOMPLETE = ".incomplete"
+DELETING_PREFIX = ".deleting-"
+
+RETENTION_PERIODS = {
+    "daily": lambda d: d.date(),
+    "weekly": lambda d: tuple(d.isocalendar())[:2],
+    "monthly": lambda d: (d.year, d.month),
+    "yearly": lambda d: d.year,
+}
+
+
+def parse_snapshot(name: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(name[: len("YYYY-mm-dd_HHMMSS")], SNAPSHOT_FORMAT)
+    except ValueError:
+        return None
+
+
+def snapshots_to_keep(names: List[str], retention: Dict[str, int]) -> set:
+    """Pick the snapshots a retention policy keeps.
+
+    ``last`` keeps the newest N snapshots (at least 1). ``daily``,
+    ``weekly``, ``monthly`` and ``yearly`` keep the newest snapshot of each
+    of the last N days/weeks/months/years that have one.
+    """
+    dated = sorted(
+        ((parse_snapshot(name), name) for name in names if parse_snapshot(name)),
+        reverse=True,
+    )
+    keep = {name for _, name in dated[: max(1, retention.get("last", 1))]}
+    for period, key in RETENTION_PERIODS.items():
+        count = retention.get(period, 0)
+        seen = set()
+        for taken, name in dated:
+            if len(seen) >= count:
+                break
+            if key(taken) not in seen:
+                seen.add(key(taken))
+                keep.add(name)
+    return keep
+
+
+class SnapshotSet:
+    """Dated, hard-linked snapshots of one directory below its destination.
+
+    Each run rsyncs into ``destination/.incomplete`` with ``--link-dest``
+    pointing at the newest snapshot, so unchanged files become hard links
+    and only changed data is transferred and stored. A finished run is
+    renamed to its timestamp (e.g. ``2024-01-31_020000``).
+    """
+
+    def __init__(self, destination, snapshot_config=None):
+        self.destination = Path(destination)
+        # ``snapshots: true`` enables them without a retention policy
+        self.config = snapshot_config if isinstance(snapshot_config, dict) else {}
+        retention = self.config.get("retention") or {}
+        unknown = set(retention) - set(RETENTION_PERIODS) - {"last"}
+        if unknown:
+            raise ValueError(
+                f"Unknown snapshot retention rules: {', '.join(sorted(unknown))}"
+            )
+
+    @property
+    def incomplete(self) -> Path:
+        return self.destination / INCOMPLETE
+
+    def names(self) -> List[str]:
+        """Finished snapshots, oldest first."""
+        if not self.destination.is_dir():
+            return []
+        return sorted(
+            entry.name
+            for entry in os.scandir(self.destination)
+            if entry.is_dir(follow_symlinks=False) and parse_snapshot(entry.name)
+        )
+
+    def latest(self) -> Optional[str]:
+        names = self.names()
+        return names[-1] if names else None
+
+    def rsync_args(self) -> List[str]:
+        latest = self.latest()
+        if latest is None:
+            return []
+        # Relative paths are resolved against the target directory
+        return [f"--link-dest=../{latest}"]
+
+    def finish(self, now: Optional[datetime] = None) -> str:
+        """Turn the incomplete snapshot into a dated one and return its name."""
+        name = (now or datetime.now()).strftime(SNAPSHOT_FORMAT)
+        suffix = 1
+        while (self.destination / name).exists():
+            name = f"{name.split('.')[0]}.{suffix}"
+            suffix += 1
+        os.rename(self.incomplete, self.destination / name)
+        logger.info("Created snapshot %s", self.destination / name)
+        return name
+
+    def prune(self, dry_run=False) -> List[str]:
+        """Delete the snapshots the retention policy doesn't keep.
+
+        Snapshots are renamed out of the way first so they disappear at once;
+        the slow part, unlinking every hard link, then runs in parallel.
+        """
+        retention = self.config.get("retention")
+        if not retention:
+            return []
+        names = self.names()
+        expired = [n for n in names if n not in snapshots_to_keep(names, retention)]
+        if dry_run:
+            for name in expired:
+                logger.info("[DRY RUN] Would delete snapshot %s", name)
+            return expired
+
+        for name in expired:
+            os.rename(
+                self.destination / name, self.destination / (DELETING_PREFIX + name)
+            )
+        # Also finish deletions an earlier run didn't get to
+        doomed = [
+            self.destination / entry
+            for entry in os.listdir(self.destination)
+            if entry.startswith(DELETING_PREFIX)
+        ]
+        with ThreadPoolExecutor(self.config.get("prune_workers", 4)) as executor:
+            list(executor.map(shutil.rmtree, doomed))
+
+        for name in expired:
+            logger.info("Deleted snapshot %s", self.destination / name)
+        return expired
@@ -0,0 +1,96 @@
+import copy
+import os
+from dataclasses import dataclass
+from typing import List
+
+from .transport import Transport
+
+# Local state that would clash if several targets shared it
+PER_TARGET_PATHS = (
+    ("backup", "checkpoint"),
+    ("backup", "change_index"),
+    ("backup", "dedup"),
+)
+# Files of the nas block each target keeps its own copy of
+PER_TARGET_FILES = (("boot", "state_file"),)
+
+
+@dataclass
+class Target:
+    """One NAS a job backs up to, with the config as that NAS sees it."""
+
+    name: str
+    config: dict
+
+
+def _reroot(path: str, old_root: str, new_root: str, what="Destination") -> str:
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(old_root))
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        raise ValueError(
+            f"{what} {path} is not below the NAS mount point {old_root}, "
+            "it can't be mapped to other targets"
+        )
+    return os.path.normpath(os.path.join(new_root, rel))
+
+
+def _merge(base: dict, override: dict) -> dict:
+    """base with override's values, nested dicts merged key by key."""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = _merge(merged[key], value)
+        merged[key] = value
+    return merged
+
+
+def load_targets(config) -> List[Target]:
+    """The NAS targets of a config, or an empty list with a single ``nas``.
+
+    Each ``targets`` entry has a ``name`` and optionally a ``nas`` block that
+    is merged over the top-level one (e.g. another ip, mac_address and
+    mount), nested blocks key by key. Directory destinations and dedup stores
+    are written below the top-level mount point and moved below each target's
+    own. Checkpoints, the change index, the dedup chunk index and the learned
+    boot times get a subdirectory per target.
+    """
+    entries = config.get("targets") or []
+    names = [entry.get("name") for entry in entries]
+    if not all(names) or len(set(names)) != len(names):
+        raise ValueError("Every NAS target needs a unique name")
+
+    base_root = config["nas"]["mount"]["local_path"]
+    targets = []
+    for entry in entries:
+        target_config = copy.deepcopy(config)
+        target_config.pop("targets")
+        own_nas = copy.deepcopy(entry.get("nas") or {})
+        nas = _merge(target_config["nas"], own_nas)
+        target_config["nas"] = nas
+        for section, key in PER_TARGET_FILES:
+            path = (nas.get(section) or {}).get(key)
+            if path and key not in (own_nas.get(section) or {}):
+                nas[section] = {
+                    **nas[section],
+                    key: os.path.join(
+                        os.path.dirname(path), entry["name"], os.path.basename(path)
+                    ),
+                }
+        if nas.get("transport"):
+            # Remote transports keep logs locally, one directory per target
+            log_dir = os.path.join(Transport(nas).log_dir, entry["name"])
+            nas["transport"] = {**nas["transport"], "log_dir": log_dir}
+
+        root = nas["mount"]["local_path"]
+        for dir_config in target_config["backup"]["directories"]:
+            dir_config["destination"] = _reroot(
+                dir_config["destination"], base_root, root
+            )
+            dedup = dir_config.get("dedup")
+            if isinstance(dedup, dict) and dedup.get("store"):
+                dedup["store"] = _reroot(dedup["store"], base_root, root, "Dedup store")
+        for section, key in PER_TARGET_PATHS:
+            settings = target_config.get(section, {}).get(key)
+            if isinstance(settings, dict) and settings.get("path"):
+                settings["path"] = os.path.join(settings["path"], entry["name"])
+        targets.append(Target(entry["name"], target_config))
+    return targets
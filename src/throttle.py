@@ -0,0 +1,148 @@
+import logging
+import shutil
+import time as time_module
+from dataclasses import dataclass, replace
+from datetime import datetime, time, timedelta
+from typing import List, Optional
+
+from .profiles import BWLIMIT_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# ionice scheduling classes; best-effort takes a level from 0 (high) to 7
+IONICE_CLASSES = {"idle": "3", "best-effort": "2"}
+
+
+def _parse_time(value) -> time:
+    if isinstance(value, int):
+        # YAML reads an unquoted 06:00 as sexagesimal minutes
+        return time(value // 60 % 24, value % 60)
+    try:
+        return time.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"Invalid throttle window time: {value!r}") from None
+
+
+@dataclass(frozen=True)
+class ThrottleWindow:
+    """Limits for rsync while the time of day is in [start, end).
+
+    A window whose start equals its end (e.g. neither given) lasts all day.
+    """
+
+    start: time
+    end: time
+    bwlimit: Optional[str] = None
+    ionice: Optional[str] = None
+    ionice_level: Optional[int] = None
+    nice: Optional[int] = None
+
+    def contains(self, t: time) -> bool:
+        if self.start == self.end:
+            return True
+        if self.start < self.end:
+            return self.start <= t < self.end
+        # Wraps around midnight, e.g. 22:00-06:00
+        return t >= self.start or t < self.end
+
+    def command_prefix(self) -> List[str]:
+        prefix = []
+        if self.ionice:
+            prefix.extend(["ionice", "-c", IONICE_CLASSES[self.ionice]])
+            if self.ionice_level is not None:
+                prefix.extend(["-n", str(self.ionice_level)])
+        if self.nice is not None:
+            prefix.extend(["nice", "-n", str(self.nice)])
+        return prefix
+
+    def rsync_args(self) -> List[str]:
+        return [f"--bwlimit={self.bwlimit}"] if self.bwlimit else []
+
+    def describe(self) -> str:
+        limits = [
+            f"bwlimit {self.bwlimit}" if self.bwlimit else None,
+            f"ionice {self.ionice}" if self.ionice else None,
+            f"nice {self.nice}" if self.nice is not None else None,
+        ]
+        return ", ".join(x for x in limits if x) or "full speed"
+
+
+class Throttle:
+    """Time-of-day limits for the rsync processes of a backup.
+
+    ``windows`` are checked in order and the first one containing the current
+    time applies; outside every window rsync runs unthrottled. A window sets
+    ``--bwlimit`` (replacing a profile's) and runs rsync under ``ionice`` and
+    ``nice``. rsync can't change these while it runs, so a transfer still
+    going when the window changes is stopped and started again with the new
+    limits; ``--partial`` keeps the file it was writing.
+    """
+
+    def __init__(self, throttle_config):
+        self.windows: List[ThrottleWindow] = []
+        ionice_found = shutil.which("ionice") is not None
+        for entry in throttle_config.get("windows") or []:
+            window = ThrottleWindow(
+                start=_parse_time(entry.get("start", "00:00")),
+                end=_parse_time(entry.get("end", "00:00")),
+                bwlimit=str(entry["bwlimit"]) if entry.get("bwlimit") else None,
+                ionice=entry.get("ionice"),
+                ionice_level=entry.get("ionice_level"),
+                nice=entry.get("nice"),
+            )
+            self._validate(window)
+            if window.ionice and not ionice_found:
+                logger.warning("ionice is not installed, ignoring it for throttling")
+                window = replace(window, ionice=None)
+            self.windows.append(window)
+        # false keeps a running rsync at the limits it started with
+        self.restart = throttle_config.get("restart", True)
+
+    @staticmethod
+    def _validate(window: ThrottleWindow):
+        if window.bwlimit and not BWLIMIT_PATTERN.match(window.bwlimit):
+            raise ValueError(f"Invalid throttle bwlimit {window.bwlimit!r}")
+        if window.ionice is not None and window.ionice not in IONICE_CLASSES:
+            raise ValueError(
+                f"Invalid throttle ionice {window.ionice!r}, expected one of "
+                f"{', '.join(IONICE_CLASSES)}"
+            )
+        if window.ionice_level is not None and not 0 <= window.ionice_level <= 7:
+            raise ValueError("Throttle ionice_level must be between 0 and 7")
+        if window.nice is not None and not 0 <= window.nice <= 19:
+            raise ValueError("Throttle nice must be between 0 and 19")
+
+    def window_at(self, now: datetime) -> Optional[ThrottleWindow]:
+        t = now.time()
+        return next((w for w in self.windows if w.contains(t)), None)
+
+    def next_change(self, now: datetime) -> Optional[datetime]:
+        """The next time the applicable window changes; None if it never does."""
+        current = self.window_at(now)
+        boundaries = sorted(
+            {
+                datetime.combine(now.date() + timedelta(days=day), t)
+                for w in self.windows
+                for t in (w.start, w.end)
+                for day in (0, 1)
+            }
+        )
+        for boundary in boundaries:
+            if boundary > now and self.window_at(boundary) != current:
+                return boundary
+        return None
+
+    def apply(self, cmd: List[str], now: datetime):
+        """The rsync command with the limits of now, and when to restart it.
+
+        ``cmd`` ends with rsync's source and destination. The restart time is
+        a time.monotonic() deadline, or None to let rsync run to the end.
+        """
+        window = self.window_at(now)
+        if window is not None:
+            cmd = [*window.command_prefix(), *cmd[:-2], *window.rsync_args(), *cmd[-2:]]
+        deadline = None
+        change = self.next_change(now) if self.restart else None
+        if change is not None:
+            deadline = time_module.monotonic() + (change - now).total_seconds()
+        return cmd, deadline
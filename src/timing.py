@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PhaseTiming:
+    name: str
+    duration_seconds: float
+    started: str
+    parent: Optional[str] = None
+    depth: int = 0
+
+
+_active_tracer: ContextVar[Optional["Tracer"]] = ContextVar(
+    "active_tracer", default=None
+)
+_current_span: ContextVar[Optional[PhaseTiming]] = ContextVar(
+    "current_span", default=None
+)
+
+
+class Tracer:
+    """Collect timed spans for the phases of one backup job.
+
+    Spans nest through context variables, so work submitted to thread pools
+    with a copied context is attributed to the span that submitted it.
+    """
+
+    def __init__(self):
+        self._spans: List[PhaseTiming] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Make this tracer the target of module-level span() calls."""
+        token = _active_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _active_tracer.reset(token)
+
+    @contextmanager
+    def span(self, name: str):
+        parent = _current_span.get()
+        timing = PhaseTiming(
+            name=name,
+            duration_seconds=0.0,
+            started=datetime.now().isoformat(),
+            parent=parent.name if parent else None,
+            depth=parent.depth + 1 if parent else 0,
+        )
+        with self._lock:
+            self._spans.append(timing)
+
+        token = _current_span.set(timing)
+        started = time.monotonic()
+        try:
+            yield timing
+        finally:
+            timing.duration_seconds = time.monotonic() - started
+            _current_span.reset(token)
+            logger.debug("%s took %.3fs", name, timing.duration_seconds)
+
+    @property
+    def spans(self) -> List[PhaseTiming]:
+        """Spans in start order."""
+        with self._lock:
+            return list(self._spans)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block against the active tracer; a no-op when none is active."""
+    tracer = _active_tracer.get()
+    if tracer is None:
+        yield None
+        return
+    with tracer.span(name) as timing:
+        yield timing
@@ -0,0 +1,113 @@
+import logging
+import os
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+TRANSPORT_TYPES = ("mount", "ssh", "rsync_daemon")
+# Ports that must accept connections before a share of this type can be mounted
+MOUNT_PORTS = {"cifs": 445, "nfs": 2049}
+RSYNC_DAEMON_PORT = 873
+
+
+class Transport:
+    """How rsync reaches the NAS.
+
+    mount: rsync to the locally mounted share (the NAS is mounted first)
+    ssh: rsync to user@nas:path over SSH, the NAS runs its own rsync
+    rsync_daemon: rsync to rsync://user@nas/module/path
+
+    Directory destinations are always written as paths below
+    ``nas.mount.local_path``; remote transports map them onto the NAS.
+    """
+
+    def __init__(self, nas_config=None):
+        nas_config = nas_config or {}
+        self.nas_config = nas_config
+        self.transport_config = nas_config.get("transport") or {}
+        self.type = self.transport_config.get("type", "mount")
+        if self.type not in TRANSPORT_TYPES:
+            raise ValueError(f"Unsupported transport type: {self.type}")
+
+    @classmethod
+    def from_config(cls, config) -> "Transport":
+        return cls(config.get("nas"))
+
+    @property
+    def remote(self) -> bool:
+        return self.type != "mount"
+
+    @property
+    def requires_mount(self) -> bool:
+        return self.type == "mount"
+
+    @property
+    def ports(self) -> List[int]:
+        """Ports of the NAS that rsync (or the mount) connects to."""
+        if self.type == "ssh":
+            return [(self.nas_config.get("ssh") or {}).get("port", 22)]
+        if self.type == "rsync_daemon":
+            return [self.transport_config.get("port", RSYNC_DAEMON_PORT)]
+        port = MOUNT_PORTS.get(self.nas_config["mount"]["type"])
+        return [port] if port else []
+
+    @property
+    def log_dir(self) -> str:
+        """Where rsync error logs go when the destination isn't local."""
+        return self.transport_config.get("log_dir", "/var/log/nas-backup")
+
+    @property
+    def remote_root(self) -> str:
+        """Path of ``nas.mount.remote_path`` on the NAS's own filesystem."""
+        remote_path = self.nas_config["mount"]["remote_path"].strip("/")
+        return self.transport_config.get("remote_root", f"/{remote_path}")
+
+    def _relative_destination(self, destination: str) -> str:
+        local_root = self.nas_config["mount"]["local_path"]
+        rel = os.path.relpath(os.path.abspath(destination), os.path.abspath(local_root))
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            raise ValueError(
+                f"Destination {destination} is not below the NAS mount point "
+                f"{local_root}, it can't be mapped to the {self.type} transport"
+            )
+        return "" if rel == "." else rel
+
+    def destination(self, destination: str) -> str:
+        """Return the rsync target for a configured destination."""
+        if not self.remote:
+            return destination
+
+        rel = self._relative_destination(destination)
+        user, host = self.nas_config["username"], self.nas_config["ip"]
+        remote_path = self.nas_config["mount"]["remote_path"].strip("/")
+
+        if self.type == "ssh":
+            return f"{user}@{host}:{os.path.join(self.remote_root, rel)}"
+
+        module = self.transport_config.get("module", remote_path)
+        port = self.transport_config.get("port")
+        address = f"{host}:{port}" if port else host
+        return f"rsync://{user}@{address}/{os.path.join(module, rel)}"
+
+    def rsync_args(self) -> List[str]:
+        args = []
+        if self.type == "ssh":
+            ssh_config = self.nas_config.get("ssh") or {}
+            ssh_cmd = ["ssh", "-p", str(ssh_config.get("port", 22))]
+            ssh_cmd += ["-o", "BatchMode=yes"]  # never hang on a password prompt
+            ssh_cmd += self.transport_config.get("ssh_options", [])
+            args.append("--rsh=" + " ".join(ssh_cmd))
+        if self.type == "rsync_daemon" and "password_file" in self.transport_config:
+            args.append(f"--password-file={self.transport_config['password_file']}")
+        if self.remote and self.transport_config.get("mkpath", False):
+            # Create missing parents of the destination (rsync >= 3.2.3)
+            args.append("--mkpath")
+        return args
+
+    def env(self) -> Dict[str, str]:
+        """Extra environment for rsync, e.g. the daemon password."""
+        if self.type == "rsync_daemon" and "password_file" not in self.transport_config:
+            password = self.nas_config.get("password")
+            if password:
+                return {"RSYNC_PASSWORD": password}
+        return {}
@@ -1,6 +1,12 @@
 import logging
+import os
 import subprocess
-from typing import List, Optional, Tuple
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .timing import span
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +20,21 @@ def format_size(size_in_bytes: int) -> str:
     return f"{size_in_bytes:.2f}PB"
 
 
+# Commands that run another one, with their options that take a value
+WRAPPERS = {"ionice": ("-c", "-n"), "nice": ("-n",)}
+
+
+def command_name(cmd: List[str]) -> str:
+    """The program a command runs, looking through ionice/nice wrappers."""
+    i = 0
+    while i < len(cmd) - 1 and os.path.basename(cmd[i]) in WRAPPERS:
+        takes_value = WRAPPERS[os.path.basename(cmd[i])]
+        i += 1
+        while i < len(cmd) - 1 and cmd[i].startswith("-"):
+            i += 2 if cmd[i] in takes_value else 1
+    return os.path.basename(cmd[min(i, len(cmd) - 1)])
+
+
 class CommandError(Exception):
     def __init__(self, message: str, returncode: int, stdout: str, stderr: str):
         self.returncode = returncode
@@ -22,6 +43,10 @@ class CommandError(Exception):
         super().__init__(message)
 
 
+class DeadlineReached(CommandError):
+    """The command was stopped because it ran past its deadline."""
+
+
 def run_command(
     cmd: List[str],
     error_msg: str,
@@ -49,7 +74,8 @@ def run_command(
         return "", ""
 
     logger.info("Executing: %s", " ".join(display_cmd))
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    with span(f"command:{command_name(cmd)}"):
+        result = subprocess.run(cmd, capture_output=True, text=True)
 
     if result.returncode != 0:
         raise CommandError(
@@ -60,3 +86,92 @@ def run_command(
         )
 
     return result.stdout, result.stderr
+
+
+def stream_command(
+    cmd: List[str],
+    error_msg: str,
+    on_line: Callable[[str], None],
+    dry_run: bool = False,
+    log_cmd: Optional[List[str]] = None,
+    env: Optional[Dict[str, str]] = None,
+    deadline: Optional[float] = None,
+) -> str:
+    """Run a shell command, handing each stdout line to a callback as it arrives.
+
+    Unlike run_command, stdout is never buffered as a whole, so commands with
+    huge outputs (e.g. rsync -v over millions of files) run in bounded memory.
+
+    Args:
+        cmd: Command and arguments as list
+        error_msg: Error message prefix for exceptions
+        on_line: Called with every stdout line, without the trailing newline
+        dry_run: If True, only log the command without executing
+        log_cmd: Alternative command to log (e.g., to hide sensitive info)
+        env: Extra environment variables for the command
+        deadline: time.monotonic() value at which the command is terminated
+
+    Returns:
+        The command's stderr
+
+    Raises:
+        DeadlineReached: If the command was terminated at its deadline
+        CommandError: If command fails. Its stdout is always empty since the
+            output has already been handed to on_line.
+    """
+    display_cmd = log_cmd if log_cmd is not None else cmd
+
+    if dry_run:
+        logger.info("[DRY RUN] Would execute: %s", " ".join(display_cmd))
+        return ""
+
+    logger.info("Executing: %s", " ".join(display_cmd))
+
+    # stderr goes to a temporary file so a chatty stderr can't fill its pipe and
+    # deadlock the process while we are busy reading stdout
+    with (
+        span(f"command:{command_name(cmd)}"),
+        tempfile.TemporaryFile(mode="w+") as stderr_file,
+    ):
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            text=True,
+            env={**os.environ, **env} if env else None,
+        )
+        timer, stopped = None, threading.Event()
+        if deadline is not None:
+
+            def stop():
+                stopped.set()
+                process.terminate()
+
+            timer = threading.Timer(max(deadline - time.monotonic(), 0), stop)
+            timer.daemon = True
+            timer.start()
+        try:
+            for line in process.stdout:
+                on_line(line.rstrip("\n"))
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            process.stdout.close()
+            if timer is not None:
+                timer.cancel()
+        returncode = process.wait()
+
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+
+    # A command that finished just as the deadline passed still counts
+    if stopped.is_set() and returncode != 0:
+        raise DeadlineReached(
+            f"{error_msg}: stopped at its deadline", returncode, "", stderr
+        )
+    if returncode != 0:
+        raise CommandError(f"{error_msg}: {stderr}", returncode, "", stderr)
+
+    return stderr
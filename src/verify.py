@@ -0,0 +1,258 @@
+import hashlib
+import heapq
+import logging
+import os
+import random
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+VERIFY_MODES = ("sample", "full", "off")
+SAMPLE_BY = ("random", "size")
+WEEKDAYS = (
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+)
+# Large unbuffered reads into one reused buffer per file
+BUFFER_SIZE = 1024 * 1024
+# rsync -a preserves mtimes, but some NAS filesystems round them
+MTIME_TOLERANCE = 2.0
+
+
+@dataclass
+class VerifyResult:
+    """Outcome of comparing backed-up files against their source."""
+
+    mode: str
+    files_checked: int = 0
+    bytes_checked: int = 0
+    mismatches: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    # Changed at the source since the backup, or unreadable; not compared
+    skipped: int = 0
+    # False when the time budget ran out before every file was checked
+    complete: bool = True
+    duration_seconds: float = 0.0
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.mismatches or self.missing)
+
+    def format(self) -> str:
+        text = f"{self.files_checked} files checked ({self.mode})"
+        if self.mismatches:
+            text += f", {len(self.mismatches)} mismatched"
+        if self.missing:
+            text += f", {len(self.missing)} missing"
+        if self.skipped:
+            text += f", {self.skipped} skipped"
+        if not self.complete:
+            text += ", stopped at the time limit"
+        return text
+
+
+class _Throttle:
+    """Caps the combined read rate of all hashing threads."""
+
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size: int):
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + size / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+def list_files(source: str) -> List[Tuple[str, int]]:
+    """Regular files below source as (relative path, size)."""
+    files = []
+    for root, _, names in os.walk(source):
+        rel_root = os.path.relpath(root, source)
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                rel = name if rel_root == "." else os.path.join(rel_root, name)
+                files.append((rel, st.st_size))
+    return files
+
+
+def sample_files(
+    files: List[Tuple[str, int]], count: int, by: str = "random", rng=None
+) -> List[Tuple[str, int]]:
+    """Pick count files, uniformly or with probability proportional to size."""
+    rng = rng or random.Random()
+    if count >= len(files):
+        return list(files)
+    if by == "size":
+        # Weighted sampling without replacement (Efraimidis-Spirakis)
+        return heapq.nlargest(
+            count, files, key=lambda f: rng.random() ** (1 / max(f[1], 1))
+        )
+    return rng.sample(files, count)
+
+
+def synced_path(source: str, destination: str) -> str:
+    """Where rsync puts source below destination."""
+    # Without a trailing slash rsync copies the directory itself
+    if source.endswith("/"):
+        return destination
+    return os.path.join(destination, os.path.basename(source))
+
+
+def verifier_for(verify_config, dir_config) -> Optional["Verifier"]:
+    """Verification of a directory; its verify settings override the global ones."""
+    override = dir_config.get("verify")
+    if override is False:
+        return None
+    merged = {**(verify_config or {}), **(override or {})}
+    if not merged:
+        return None
+    return Verifier(merged)
+
+
+class Verifier:
+    """Checksums backed-up files against the source after a transfer.
+
+    ``sample`` mode hashes a subset of the files, ``full`` mode every file;
+    ``full_on`` switches to full mode on the given weekdays. Files are hashed
+    by a small thread pool whose combined read rate can be capped, and a time
+    budget stops verification early so it never doubles the backup window.
+    """
+
+    def __init__(self, verify_config=None):
+        self.config = verify_config or {}
+        self.mode = self.config.get("mode", "sample")
+        if self.mode not in VERIFY_MODES:
+            raise ValueError(f"Unsupported verify mode: {self.mode}")
+        self.sample_by = self.config.get("sample_by", "random")
+        if self.sample_by not in SAMPLE_BY:
+            raise ValueError(f"Unsupported verify sample_by: {self.sample_by}")
+        self.full_on = [day.lower() for day in self.config.get("full_on", [])]
+        unknown = set(self.full_on) - set(WEEKDAYS)
+        if unknown:
+            raise ValueError(f"Unknown verify full_on days: {', '.join(unknown)}")
+        self.algorithm = self.config.get("algorithm", "blake2b")
+        hashlib.new(self.algorithm)  # fail early on an unknown algorithm
+        self.sample_size = self.config.get("sample_files", 100)
+        self.workers = self.config.get("workers", 4)
+        self.max_seconds = self.config.get("max_seconds")
+        rate = self.config.get("max_mb_per_second")
+        self.throttle = _Throttle(rate * 1024 * 1024) if rate else None
+
+    def mode_for(self, now: Optional[datetime] = None) -> str:
+        now = now or datetime.now()
+        if self.mode == "sample" and WEEKDAYS[now.weekday()] in self.full_on:
+            return "full"
+        return self.mode
+
+    def verify(
+        self,
+        source: str,
+        destination: str,
+        files: Optional[Iterable[Tuple[str, int]]] = None,
+        now: Optional[datetime] = None,
+    ) -> Optional[VerifyResult]:
+        """Compare files below source with their copies below destination.
+
+        ``files`` (relative path, size) saves walking the source again when
+        a scan is at hand. Returns None when verification is off.
+        """
+        mode = self.mode_for(now)
+        if mode == "off":
+            return None
+        started = time.monotonic()
+        files = list(files) if files is not None else list_files(source)
+        if mode == "sample":
+            files = sample_files(files, self.sample_size, self.sample_by)
+        logger.info("Verifying %d files of %s (%s)", len(files), source, mode)
+
+        result = VerifyResult(mode=mode)
+        deadline = started + self.max_seconds if self.max_seconds else None
+        lock = threading.Lock()
+
+        def check(entry):
+            if deadline is not None and time.monotonic() > deadline:
+                with lock:
+                    result.complete = False
+                return
+            rel = entry[0]
+            outcome, size = self._check_file(
+                os.path.join(source, rel), os.path.join(destination, rel)
+            )
+            with lock:
+                if outcome == "skipped":
+                    result.skipped += 1
+                    return
+                if outcome == "missing":
+                    result.missing.append(rel)
+                elif outcome == "mismatch":
+                    result.mismatches.append(rel)
+                result.files_checked += 1
+                result.bytes_checked += size
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            list(executor.map(check, files))
+
+        result.mismatches.sort()
+        result.missing.sort()
+        result.duration_seconds = time.monotonic() - started
+        log = logger.warning if result.failed else logger.info
+        log("Verification of %s: %s", source, result.format())
+        return result
+
+    def _check_file(self, source_path: str, dest_path: str) -> Tuple[str, int]:
+        try:
+            source_stat = os.lstat(source_path)
+        except OSError:
+            return "skipped", 0
+        if not stat.S_ISREG(source_stat.st_mode):
+            # Symlinks are copied as links (or dropped by --safe-links)
+            return "skipped", 0
+        try:
+            dest_stat = os.lstat(dest_path)
+        except FileNotFoundError:
+            return "missing", 0
+        if abs(source_stat.st_mtime - dest_stat.st_mtime) > MTIME_TOLERANCE:
+            # Modified since the backup (or rsync couldn't transfer it, which
+            # the error log already reports)
+            return "skipped", 0
+        if source_stat.st_size != dest_stat.st_size:
+            return "mismatch", source_stat.st_size
+        try:
+            source_hash = self._hash_file(source_path)
+        except OSError:
+            return "skipped", 0
+        if source_hash != self._hash_file(dest_path):
+            return "mismatch", source_stat.st_size
+        return "ok", source_stat.st_size
+
+    def _hash_file(self, path: str) -> str:
+        digest = hashlib.new(self.algorithm)
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        with open(path, "rb", buffering=0) as f:
+            while size := f.readinto(buffer):
+                if self.throttle is not None:
+                    self.throttle.consume(size)
+                digest.update(view[:size])
+        return digest.hexdigest()
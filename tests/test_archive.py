@@ -0,0 +1,149 @@
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+from datetime import datetime
+
+import pytest
+
+from src.archive import ArchiveWriter
+from src.backup_manager import BackupManager
+from src.utils import CommandError
+
+needs_zstd = pytest.mark.skipif(
+    not shutil.which("zstd"), reason="zstd is not installed"
+)
+
+
+def extract(archive, target):
+    tar_file = target.parent / f"{archive.name}.tar"
+    with open(tar_file, "wb") as out:
+        subprocess.run(["zstd", "-d", "-c", str(archive)], stdout=out, check=True)
+    with tarfile.open(tar_file) as tar:
+        return sorted(tar.getnames())
+
+
+def make_source(tmp_path):
+    source = tmp_path / "scans"
+    (source / "2024").mkdir(parents=True)
+    for i in range(20):
+        (source / "2024" / f"page{i}.txt").write_text(f"page {i}\n" * 100)
+    return source
+
+
+def test_commands_encrypt_with_age(tmp_path):
+    writer = ArchiveWriter(
+        tmp_path, {"level": 9, "threads": 4, "encrypt": {"recipients": ["age1abc"]}}
+    )
+
+    commands = writer.commands("/data/scans", "/tmp/index")
+
+    assert commands[0][-2:] == ["--directory=/data", "scans"]
+    assert commands[1] == ["zstd", "-9", "-T4", "-q", "-c"]
+    assert commands[2] == ["age", "--encrypt", "-r", "age1abc"]
+    assert writer.archive_name(datetime(2024, 1, 1, 2), False) == (
+        "2024-01-01_020000-full.tar.zst.age"
+    )
+
+
+@pytest.mark.parametrize(
+    "config", [{"level": 0}, {"encrypt": {"armor": True}}], ids=["level", "encrypt"]
+)
+def test_invalid_config_is_rejected(tmp_path, config):
+    with pytest.raises(ValueError):
+        ArchiveWriter(tmp_path, config)
+
+
+@needs_zstd
+def test_full_and_incremental_archives(tmp_path):
+    source = make_source(tmp_path)
+    writer = ArchiveWriter(tmp_path / "nas")
+
+    full = writer.write(str(source), now=datetime(2024, 1, 1, 2))
+    incremental = writer.write(
+        str(source), paths=["2024/page3.txt"], now=datetime(2024, 1, 2, 2)
+    )
+
+    assert full.files == 20
+    assert 0 < full.archive_bytes < full.source_bytes
+    assert writer.archives() == [full.name, incremental.name]
+    assert incremental.name == "2024-01-02_020000-incremental.tar.zst"
+    assert extract(tmp_path / "nas" / incremental.name, tmp_path) == [
+        "scans/2024/page3.txt"
+    ]
+    assert len(extract(tmp_path / "nas" / full.name, tmp_path)) == 22
+
+
+@needs_zstd
+def test_failed_pipeline_leaves_no_archive(tmp_path):
+    writer = ArchiveWriter(tmp_path / "nas")
+
+    with pytest.raises(Exception, match="stage tar failed"):
+        writer.write(str(tmp_path / "missing"))
+
+    assert list((tmp_path / "nas").iterdir()) == []
+
+
+def test_failing_stage_is_named_not_the_stages_writing_into_it(tmp_path):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "big").write_bytes(os.urandom(4 * 1024 * 1024))
+    commands = [
+        ["tar", "--create", "--file=-", f"--directory={tmp_path}", "data"],
+        [sys.executable, "-c", "import sys; sys.stderr.write('bad key'); sys.exit(3)"],
+    ]
+
+    with pytest.raises(
+        CommandError, match=r"stage python[\d.]* failed with exit status 3: bad key"
+    ) as exc_info:
+        ArchiveWriter._run_pipeline(commands, tmp_path / "out")
+
+    assert exc_info.value.returncode == 3
+
+
+@needs_zstd
+def test_backup_manager_archives_changes_incrementally(tmp_path):
+    source = make_source(tmp_path)
+    config = {
+        "backup": {
+            "change_index": {"path": str(tmp_path / "index")},
+            "directories": [
+                {
+                    "source": str(source),
+                    "destination": str(tmp_path / "nas"),
+                    "archive": True,
+                }
+            ],
+        }
+    }
+
+    first = BackupManager(config).run_backup().directories[str(source)]
+    (source / "2024" / "page3.txt").write_text("edited")
+    second = BackupManager(config).run_backup().directories[str(source)]
+    third = BackupManager(config).run_backup().directories[str(source)]
+
+    assert first.files_transferred == 20
+    assert first.archive.endswith("-full.tar.zst")
+    assert second.details.startswith("incremental archive of 1 files")
+    assert second.size_bytes > 0
+    assert third.status == "unchanged"
+
+
+def test_restore_command_explains_archive_restores(tmp_path, capsys):
+    from src import main
+
+    config = {
+        "backup": {
+            "directories": [
+                {
+                    "source": "/scans",
+                    "destination": str(tmp_path / "nas"),
+                    "archive": True,
+                }
+            ]
+        }
+    }
+
+    assert not main.run_restore(config, "/scans", str(tmp_path / "out"))
+    assert "deleted since the full archive come back" in capsys.readouterr().out
@@ -1,3 +1,4 @@
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -5,6 +6,7 @@ import pytest
 
 from src.backup_manager import BackupManager
 from src.models import BackupStats, DirectoryStats
+from src.utils import CommandError
 
 
 @pytest.fixture
@@ -93,3 +95,129 @@ Total transferred file size: 123,456 bytes",
     assert dir_stats.error_log == error_log
     assert dir_stats.error_log.name.startswith("rsync_errors_")
     assert dir_stats.error_log.name.endswith(".log")
+
+
+def _fake_backup_directory(delay):
+    def backup_directory(source, destination, dir_config=None, prepared=None):
+        time.sleep(delay)
+        return DirectoryStats(source=source, files_transferred=1, size_bytes=10)
+
+    return backup_directory
+
+
+def test_parallel_backup_reduces_wall_time(tmp_path):
+    directories = [
+        {"source": str(tmp_path / f"src{i}"), "destination": str(tmp_path / f"d{i}")}
+        for i in range(3)
+    ]
+
+    serial = BackupManager({"backup": {"directories": directories}})
+    serial._backup_directory = _fake_backup_directory(0.3)
+    start = time.monotonic()
+    serial_stats = serial.run_backup()
+    serial_time = time.monotonic() - start
+
+    parallel = BackupManager(
+        {"backup": {"directories": directories, "parallel": {"max_workers": 3}}}
+    )
+    parallel._backup_directory = _fake_backup_directory(0.3)
+    start = time.monotonic()
+    parallel_stats = parallel.run_backup()
+    parallel_time = time.monotonic() - start
+
+    assert parallel_time < serial_time * 0.6
+    assert list(parallel_stats.directories) == list(serial_stats.directories)
+    assert parallel_stats.total_files == serial_stats.total_files == 3
+    assert parallel_stats.total_size == serial_stats.total_size == 30
+
+
+def test_parallel_backup_groups_by_device_and_destination(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    directories = [
+        {"source": str(tmp_path / "a"), "destination": "/dest/one"},
+        {"source": str(tmp_path / "b"), "destination": "/dest/two"},
+        {"source": "/missing/c", "destination": "/dest/three"},
+        {"source": "/missing/d", "destination": "/dest/three/"},
+    ]
+    manager = BackupManager({"backup": {"directories": directories}})
+
+    assert manager._group_directories(directories, []) == [[0], [1], [2], [3]]
+    assert manager._group_directories(directories, ["device"]) == [[0, 1], [2], [3]]
+    assert manager._group_directories(directories, ["device", "destination"]) == [
+        [0, 1],
+        [2, 3],
+    ]
+
+
+def test_parallel_backup_propagates_errors(config):
+    config["backup"]["parallel"] = {"max_workers": 2}
+    manager = BackupManager(config)
+
+    def failing_backup(source, destination, dir_config=None, prepared=None):
+        if source.endswith("test_src2"):
+            raise CommandError("Rsync failed", 1, "", "")
+        return DirectoryStats(source=source, files_transferred=0, size_bytes=0)
+
+    manager._backup_directory = failing_backup
+    with pytest.raises(CommandError):
+        manager.run_backup()
+
+
+def _make_tree(root, sizes):
+    for name, size in sizes.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+
+
+def test_plan_shards_balances_entries(tmp_path):
+    _make_tree(
+        tmp_path,
+        {"big/a": 100, "mid/a": 60, "mid/b": 10, "small/a": 30, "tiny": 5},
+    )
+    manager = BackupManager({"backup": {"directories": []}})
+
+    by_size = manager._plan_shards(str(tmp_path), {"shards": 2})
+    assert by_size == [["big", "tiny"], ["mid", "small"]]
+
+    by_count = manager._plan_shards(str(tmp_path), {"shards": 2, "balance_by": "count"})
+    assert by_count == [["big", "mid"], ["small", "tiny"]]
+    assert manager._plan_shards(str(tmp_path), {"shards": 1}) == []
+    with pytest.raises(ValueError):
+        manager._plan_shards(str(tmp_path), {"shards": 2, "balance_by": "mtime"})
+
+
+def test_sharded_backup_combines_stats(monkeypatch, tmp_path):
+    source = tmp_path / "photos"
+    _make_tree(source, {"2023/a.jpg": 50, "2024/a.jpg": 40, "2024/b.jpg": 20})
+    dest = tmp_path / "dest"
+    file_lists = []
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        files_from = next(c for c in cmd if c.startswith("--files-from="))
+        entries = Path(files_from.split("=", 1)[1]).read_text().split()
+        file_lists.append(entries)
+        assert "--recursive" in cmd
+        assert cmd[-2] == str(tmp_path) + "/"
+
+        log_file = Path(next(c for c in cmd if c.startswith("--log-file="))[11:])
+        if entries == ["photos/2023"]:
+            log_file.write_text("rsync: send_files failed to open: Permission denied\n")
+        on_line(f"Number of regular files transferred: {len(entries)}")
+        on_line("Total transferred file size: 1,000 bytes")
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    manager = BackupManager({"backup": {"directories": []}})
+
+    dir_stats = manager._backup_directory(
+        str(source), str(dest), {"sharding": {"shards": 2}}
+    )
+
+    assert sorted(file_lists) == [["photos/2023"], ["photos/2024"]]
+    assert dir_stats.files_transferred == 2
+    assert dir_stats.size_bytes == 2000
+    assert dir_stats.status == "completed_with_errors"
+    assert "Permission denied" in dir_stats.error_log.read_text()
+    assert [p.name for p in dest.iterdir()] == [dir_stats.error_log.name]
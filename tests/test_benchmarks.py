@@ -0,0 +1,54 @@
+from benchmarks import trees
+from benchmarks.compare import compare
+from src.backup_manager import BackupManager
+
+
+def test_synthetic_trees_are_reproducible(tmp_path):
+    first = trees.many_tiny_files(tmp_path / "a", count=50, per_dir=10)
+    second = trees.many_tiny_files(tmp_path / "b", count=50, per_dir=10)
+
+    assert first == second == trees.tree_size(tmp_path / "a")
+    assert len(list((tmp_path / "a").iterdir())) == 5
+    assert (tmp_path / "a" / "dir0000" / "doc000000.txt").read_bytes() == (
+        tmp_path / "b" / "dir0000" / "doc000000.txt"
+    ).read_bytes()
+
+
+def test_deep_nesting_and_modify(tmp_path):
+    trees.deep_nesting(tmp_path, depth=3, branching=2, files_per_dir=1)
+    assert (tmp_path / "n1" / "n0" / "n1" / "file0.dat").exists()
+
+    assert trees.modify_files(tmp_path, fraction=0.5) == 7
+    assert (tmp_path / "new" / "added00000.txt").exists()
+
+
+def test_generated_rsync_output_is_parseable(tmp_path):
+    output = tmp_path / "rsync.out"
+    log = tmp_path / "rsync.log"
+    lines = trees.write_rsync_output(output, 10_000)
+    trees.write_rsync_log(log, 10_000, errors=1)
+    manager = BackupManager({"backup": {"directories": []}})
+
+    stats = manager._parse_rsync_stats(output.read_text(), "/src")
+
+    assert output.stat().st_size >= 10_000
+    assert stats.files_transferred == lines
+    assert stats.size_bytes == lines * 4096
+    assert manager._has_errors_in_log(log)
+
+
+def test_compare_flags_regressions():
+    baseline = {"e2e": {"tiny": {"wall_seconds": 10.0, "peak_rss_bytes": 100}}}
+    current = {
+        "e2e": {
+            "tiny": {"wall_seconds": 12.0, "peak_rss_bytes": 100},
+            "new_scenario": {"wall_seconds": 1.0},
+        }
+    }
+
+    rows = compare(baseline, current, threshold=0.1)
+
+    assert [(name, metric, regressed) for _, name, metric, *_, regressed in rows] == [
+        ("tiny", "wall_seconds", True),
+        ("tiny", "peak_rss_bytes", False),
+    ]
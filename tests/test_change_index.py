@@ -0,0 +1,131 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from src.backup_manager import BackupManager
+from src.change_index import ChangeIndex, scan_tree
+
+KEY = "source->destination"
+
+
+@pytest.fixture
+def tree(tmp_path):
+    source = tmp_path / "src"
+    for path in ("a/one.txt", "a/deep/two.txt", "b/three.txt", "top.txt"):
+        (source / path).parent.mkdir(parents=True, exist_ok=True)
+        (source / path).write_text(path)
+    return source
+
+
+def _touch(path, content):
+    path.write_text(content)
+    # Make sure the mtime differs even on coarse-grained filesystems
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_first_scan_requires_full_backup(tree, tmp_path):
+    index = ChangeIndex(tmp_path / "index")
+    changes = index.diff(KEY, scan_tree(str(tree)))
+
+    assert changes.full
+    assert changes.reason == "no previous index"
+
+
+def test_unchanged_tree_is_skipped(tree, tmp_path):
+    index = ChangeIndex(tmp_path / "index")
+    index.commit(KEY, scan_tree(str(tree)), full=True)
+
+    changes = index.diff(KEY, scan_tree(str(tree)))
+
+    assert changes.unchanged
+    assert not index.diff("other-destination", scan_tree(str(tree))).unchanged
+
+
+def test_changed_files_and_new_directories_are_listed(tree, tmp_path):
+    index = ChangeIndex(tmp_path / "index")
+    index.commit(KEY, scan_tree(str(tree)), full=True)
+
+    _touch(tree / "a" / "deep" / "two.txt", "changed")
+    (tree / "c" / "sub").mkdir(parents=True)
+    (tree / "c" / "sub" / "new.txt").write_text("new")
+    (tree / "b" / "four.txt").write_text("new file")
+
+    changes = index.diff(KEY, scan_tree(str(tree)))
+
+    assert changes.paths == ["a/deep/two.txt", "b/four.txt", "c"]
+
+
+def test_full_scan_is_forced_after_interval(tree, tmp_path):
+    index = ChangeIndex(tmp_path / "index", full_scan_days=7)
+    scan = scan_tree(str(tree))
+    scan.scanned_at = time.time() - 8 * 86400
+    index.commit(KEY, scan, full=True)
+
+    # Incremental commits keep the time of the last full scan
+    index.commit(KEY, scan_tree(str(tree)), full=False)
+    changes = index.diff(KEY, scan_tree(str(tree)))
+
+    assert changes.full
+    assert "days ago" in changes.reason
+
+
+def test_invalidate(tree, tmp_path):
+    index = ChangeIndex(tmp_path / "index")
+    index.commit(KEY, scan_tree(str(tree)), full=True)
+    index.invalidate(KEY)
+
+    assert index.diff(KEY, scan_tree(str(tree))).full
+
+
+def test_scan_missing_source(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        scan_tree(str(tmp_path / "missing"))
+
+
+def test_backup_directory_uses_change_index(monkeypatch, tree, tmp_path):
+    commands = []
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        files_from = [c for c in cmd if c.startswith("--files-from=")]
+        listed = Path(files_from[0][13:]).read_text().split() if files_from else None
+        commands.append((cmd[-2], listed))
+        on_line("Number of regular files transferred: 1")
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    config = {
+        "backup": {
+            "directories": [],
+            "change_index": {"path": str(tmp_path / "index")},
+        }
+    }
+    manager = BackupManager(config)
+    dest = str(tmp_path / "dest")
+
+    first = manager._backup_directory(str(tree), dest)
+    second = manager._backup_directory(str(tree), dest)
+    _touch(tree / "b" / "three.txt", "changed")
+    third = manager._backup_directory(str(tree), dest)
+
+    assert first.status == "success"
+    assert second.status == "unchanged"
+    assert third.files_transferred == 1
+    assert commands == [
+        (str(tree), None),
+        (str(tmp_path) + "/", ["src/b/three.txt"]),
+    ]
+
+
+def test_scan_size_of_paths(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "top").write_bytes(b"x" * 10)
+    (tmp_path / "a" / "one").write_bytes(b"x" * 100)
+    (tmp_path / "a" / "b" / "two").write_bytes(b"x" * 1000)
+    scan = scan_tree(str(tmp_path))
+
+    assert scan.size() == 1110
+    assert scan.size(["a"]) == 1100
+    assert scan.size(["top", "a/b", "gone"]) == 1010
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from src.backup_manager import BackupManager
+from src.checkpoint import STATE_FILE, Checkpoint
+from src.error_log import ErrorSummary
+from src.models import DirectoryStats
+from src.rsync_output import RsyncOutputParser
+from src.utils import CommandError
+
+
+def test_checkpoint_round_trip(tmp_path):
+    checkpoint = Checkpoint.open(tmp_path)
+    checkpoint.directory_done(
+        "/docs",
+        "key1",
+        DirectoryStats(
+            source="/docs",
+            files_transferred=3,
+            size_bytes=30,
+            status="completed_with_errors",
+            error_log=Path("/logs/rsync_errors.log"),
+            error_summary=ErrorSummary(
+                total=1, categories={"vanished": 1}, top_paths=[("a", 1)]
+            ),
+        ),
+    )
+    checkpoint.start_directory("/photos", "key2", [["2023"], ["2024"]])
+    parser = RsyncOutputParser()
+    parser.feed("Number of regular files transferred: 5")
+    checkpoint.shard_done("/photos", 1, parser)
+
+    reopened = Checkpoint.open(tmp_path)
+
+    done = reopened.completed("/docs", "key1")
+    assert done.error_log == Path("/logs/rsync_errors.log")
+    assert done.error_summary.top_paths == [("a", 1)]
+    assert reopened.completed("/docs", "changed-key") is None
+    file_lists, shards_done = reopened.pending("/photos", "key2")
+    assert file_lists == [["2023"], ["2024"]]
+    assert list(shards_done) == [1]
+    assert shards_done[1].files_transferred == 5
+
+
+def test_stale_checkpoint_needs_resume(tmp_path):
+    Checkpoint.open(tmp_path).start_directory("/photos", "key", [["a"], ["b"]])
+    state_file = tmp_path / STATE_FILE
+    state = json.loads(state_file.read_text())
+    state["updated"] = time.time() - 72 * 3600
+    state_file.write_text(json.dumps(state))
+
+    assert Checkpoint.open(tmp_path, resume=True).pending("/photos", "key")
+    assert Checkpoint.open(tmp_path).pending("/photos", "key") is None
+    assert not state_file.exists()
+
+
+def test_last_nights_checkpoint_is_not_resumed(tmp_path):
+    config = {
+        "backup": {
+            "directories": [{"source": "/docs", "destination": "/nas/docs"}],
+            "checkpoint": {"path": str(tmp_path)},
+        }
+    }
+    Checkpoint.open(tmp_path).directory_done(
+        "/docs",
+        "key",
+        DirectoryStats(source="/docs", files_transferred=3, size_bytes=30),
+    )
+    state_file = tmp_path / STATE_FILE
+    state = json.loads(state_file.read_text())
+    # Interrupted during the last daily run
+    state["updated"] = time.time() - 24 * 3600
+    state_file.write_text(json.dumps(state))
+
+    checkpoint = BackupManager(config)._open_checkpoint()
+
+    assert checkpoint.completed("/docs", "key") is None
+
+
+def test_clear_keeps_unrelated_files(tmp_path):
+    (tmp_path / "history.db").write_text("keep")
+    checkpoint = Checkpoint.open(tmp_path)
+    checkpoint.start_directory("/photos", "key", [["a"]])
+
+    checkpoint.clear()
+
+    assert os.listdir(tmp_path) == ["history.db"]
+
+
+def test_interrupted_backup_resumes(monkeypatch, tmp_path):
+    docs, photos = tmp_path / "docs", tmp_path / "photos"
+    for path in (docs / "a.txt", photos / "2023" / "a.jpg", photos / "2024" / "b.jpg"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x")
+    (photos / "2023" / "a.jpg").write_text("larger, runs first")
+    config = {
+        "backup": {
+            "directories": [
+                {"source": str(docs), "destination": str(tmp_path / "dest" / "docs")},
+                {
+                    "source": str(photos),
+                    "destination": str(tmp_path / "dest" / "photos"),
+                    "sharding": {"shards": 2, "max_workers": 1},
+                },
+            ],
+            "checkpoint": {"path": str(tmp_path / "checkpoint")},
+        }
+    }
+    runs = []
+    nas_drops = True
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        files_from = [c for c in cmd if c.startswith("--files-from=")]
+        listed = Path(files_from[0][13:]).read_text().split() if files_from else None
+        runs.append(listed or cmd[-2])
+        if nas_drops and listed == ["photos/2024"]:
+            raise CommandError("Rsync failed", 12, "", "connection closed")
+        on_line("Number of regular files transferred: 1")
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+
+    with pytest.raises(CommandError):
+        BackupManager(config).run_backup()
+    assert runs == [str(docs), ["photos/2023"], ["photos/2024"]]
+
+    runs.clear()
+    nas_drops = False
+    stats = BackupManager(config).run_backup()
+
+    assert runs == [["photos/2024"]]
+    assert stats.directories[str(docs)].files_transferred == 1
+    assert stats.directories[str(photos)].files_transferred == 2
+    assert not (tmp_path / "checkpoint" / STATE_FILE).exists()
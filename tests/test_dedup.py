@@ -0,0 +1,227 @@
+import io
+import os
+import random
+from datetime import datetime
+
+import pytest
+
+from src.backup_manager import BackupManager
+from src.dedup import ANCHOR, DedupStore, chunk_path, iter_chunks, store_for
+
+
+def random_bytes(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+def chunk_list(data, **kwargs):
+    return [bytes(c) for c in iter_chunks(io.BytesIO(data), **kwargs)]
+
+
+def test_chunks_cover_the_file_and_respect_sizes():
+    data = random_bytes(300_000, 1)
+
+    chunks = chunk_list(data, min_size=4096, max_size=32768)
+
+    assert b"".join(chunks) == data
+    assert all(4096 <= len(c) <= 32768 for c in chunks[:-1])
+    assert all(c.endswith(ANCHOR) for c in chunks[:-1] if len(c) < 32768)
+
+
+def test_boundaries_realign_after_an_insertion():
+    data = random_bytes(300_000, 2)
+
+    before = chunk_list(data, min_size=4096, max_size=65536)
+    after = chunk_list(b"inserted" + data, min_size=4096, max_size=65536)
+
+    # Only the chunk holding the insertion differs
+    assert len(set(before) - set(after)) == 1
+    assert after[1:] == before[1:]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DedupStore(tmp_path / "nas", tmp_path / "index.db", workers=1)
+
+
+def make_source(tmp_path):
+    source = tmp_path / "photos"
+    (source / "2024").mkdir(parents=True)
+    (source / "2024" / "a.jpg").write_bytes(random_bytes(3_000_000, 3))
+    (source / "notes.txt").write_text("hello")
+    return source
+
+
+def test_backup_stores_only_unseen_chunks(store, tmp_path):
+    source = make_source(tmp_path)
+
+    first = store.backup(str(source), now=datetime(2024, 1, 1, 2))
+    assert first.files == first.files_chunked == 2
+    assert first.new_bytes == first.total_bytes == 3_000_005
+
+    # A renamed copy adds no data; the untouched files aren't even read
+    (source / "copy.jpg").write_bytes((source / "2024" / "a.jpg").read_bytes())
+    second = store.backup(str(source), now=datetime(2024, 1, 2, 2))
+
+    assert second.files == 3
+    assert second.files_chunked == 1
+    assert second.new_bytes == 0
+    assert second.deduplicated_bytes == second.total_bytes
+    assert [m.name for m in store.manifests(str(source))] == [
+        "2024-01-01_020000.json.gz",
+        "2024-01-02_020000.json.gz",
+    ]
+
+
+def test_restore_rebuilds_the_tree(store, tmp_path):
+    source = make_source(tmp_path)
+    os.utime(source / "notes.txt", ns=(1_000_000_000, 1_000_000_000))
+    store.backup(str(source))
+
+    manifest = store.manifests(str(source))[-1]
+    assert store.restore(manifest, tmp_path / "restored") == 2
+
+    restored = tmp_path / "restored"
+    for rel in ("2024/a.jpg", "notes.txt"):
+        assert (restored / rel).read_bytes() == (source / rel).read_bytes()
+    assert (restored / "notes.txt").stat().st_mtime_ns == 1_000_000_000
+
+    assert store.restore(manifest, tmp_path / "partial", prefix="2024") == 1
+
+
+def test_restore_rejects_corrupt_chunks(store, tmp_path):
+    source = make_source(tmp_path)
+    store.backup(str(source))
+    manifest = store.manifests(str(source))[-1]
+    for chunk in (store.root / "chunks").rglob("*"):
+        if chunk.is_file():
+            chunk.write_bytes(b"garbage")
+
+    with pytest.raises(ValueError, match="corrupt"):
+        store.restore(manifest, tmp_path / "restored")
+
+
+def test_replaced_store_resets_the_index(store, tmp_path):
+    source = make_source(tmp_path)
+    store.backup(str(source))
+    digest = next(iter((store.root / "chunks").rglob("*"))).name
+    # The NAS was wiped: the index must not claim the old chunks are stored
+    (store.root / "store_id").unlink()
+    for chunk in (store.root / "chunks").rglob("*"):
+        if chunk.is_file():
+            chunk.unlink()
+
+    result = store.backup(str(source))
+
+    assert result.files_chunked == 2
+    assert result.new_bytes == result.total_bytes
+    assert chunk_path(store.root, digest).parent.is_dir()
+
+
+def test_dry_run_writes_nothing_to_the_store(store, tmp_path):
+    source = make_source(tmp_path)
+
+    result = store.backup(str(source), dry_run=True)
+
+    assert result.new_bytes == result.total_bytes
+    assert result.manifest is None
+    assert not store.root.exists()
+    assert not store.index_path.exists()
+
+    # Once there is an index, a dry run reads it without changing it
+    store.backup(str(source))
+    index_mtime = store.index_path.stat().st_mtime_ns
+    (source / "new.txt").write_text("new")
+
+    result = store.backup(str(source), dry_run=True)
+
+    assert result.files_chunked == 1
+    assert result.new_bytes == 3
+    assert store.index_path.stat().st_mtime_ns == index_mtime
+
+
+def test_symlinks_are_stored_and_special_files_counted(store, tmp_path):
+    source = make_source(tmp_path)
+    (source / "latest").symlink_to("2024")
+    (source / "readme").symlink_to("notes.txt")
+    os.mkfifo(source / "pipe")
+
+    result = store.backup(str(source))
+
+    assert result.files == 4
+    assert result.skipped == ["pipe"]
+    assert store.restore(store.manifests(str(source))[-1], tmp_path / "out") == 4
+    assert os.readlink(tmp_path / "out" / "latest") == "2024"
+    assert (tmp_path / "out" / "readme").read_text() == "hello"
+
+
+def test_process_pool_matches_inline_chunking(tmp_path):
+    source = make_source(tmp_path)
+    for i in range(4):
+        (source / f"video{i}.mp4").write_bytes(random_bytes(70_000_000 // 4, i))
+    pooled = DedupStore(tmp_path / "pooled", tmp_path / "pooled.db", workers=2)
+    inline = DedupStore(tmp_path / "inline", tmp_path / "inline.db", workers=1)
+
+    assert pooled.backup(str(source)).new_bytes == inline.backup(str(source)).new_bytes
+
+
+def test_backup_manager_runs_dedup_directories(tmp_path):
+    source = make_source(tmp_path)
+    destination = tmp_path / "nas"
+    dedup = {"path": str(tmp_path / "index"), "workers": 1}
+    config = {
+        "backup": {
+            "dedup": dedup,
+            "directories": [
+                {"source": str(source), "destination": str(destination), "dedup": True}
+            ],
+        }
+    }
+
+    stats = BackupManager(config).run_backup()
+
+    dir_stats = stats.directories[str(source)]
+    assert dir_stats.status == "success"
+    assert dir_stats.size_bytes == 3_000_005
+    assert dir_stats.manifest.endswith(".json.gz")
+    store = store_for(dedup, config["backup"]["directories"][0])
+    assert store.root == destination
+    assert len(store.manifests(str(source))) == 1
+
+
+def test_dedup_needs_an_index_path(tmp_path):
+    config = {
+        "backup": {
+            "directories": [
+                {"source": str(tmp_path), "destination": "/mnt/nas", "dedup": True}
+            ]
+        }
+    }
+
+    with pytest.raises(ValueError, match="backup.dedup.path"):
+        BackupManager(config)
+
+
+def test_restore_command(tmp_path, capsys):
+    from src import main
+
+    source = make_source(tmp_path)
+    config = {
+        "backup": {
+            "dedup": {"path": str(tmp_path / "index"), "workers": 1},
+            "directories": [
+                {
+                    "source": str(source),
+                    "destination": str(tmp_path / "nas"),
+                    "dedup": True,
+                }
+            ],
+        }
+    }
+    BackupManager(config).run_backup()
+
+    assert main.run_restore(
+        config, str(source), str(tmp_path / "out"), path="notes.txt"
+    )
+    assert (tmp_path / "out" / "notes.txt").read_text() == "hello"
+    assert "Restored 1 files" in capsys.readouterr().out
+    assert not main.run_restore(config, "/elsewhere", str(tmp_path / "out"))
@@ -0,0 +1,31 @@
+from src.email_sender import EmailSender
+from src.models import BackupStats, DirectoryStats
+from src.timing import PhaseTiming
+
+
+def test_report_body_includes_phase_timings():
+    stats = BackupStats(total_files=1, total_size=10)
+    stats.directories["/src"] = DirectoryStats(
+        source="/src", files_transferred=1, size_bytes=10
+    )
+    stats.timings = [
+        PhaseTiming("start_nas", 62.0, "t0"),
+        PhaseTiming("boot_wait", 55.25, "t1", parent="start_nas", depth=1),
+        PhaseTiming("backup", 300.0, "t2"),
+    ]
+
+    body = EmailSender({}, dry_run=True)._generate_report_body(stats)
+
+    assert (
+        "Phase Timings:\nstart_nas: 62.0s\n  boot_wait: 55.2s\nbackup: 300.0s" in body
+    )
+
+
+def test_failed_report_body_includes_phase_timings():
+    stats = BackupStats(status="failed", error="NAS offline")
+    stats.timings = [PhaseTiming("start_nas", 300.0, "t0")]
+
+    body = EmailSender({}, dry_run=True)._generate_report_body(stats)
+
+    assert "Error: NAS offline" in body
+    assert "start_nas: 300.0s" in body
@@ -0,0 +1,150 @@
+import gzip
+import os
+import time
+
+import pytest
+
+from src import error_log
+from src.backup_manager import BackupManager
+from src.email_sender import EmailSender
+from src.error_log import ErrorLogAnalyzer, ErrorSummary, classify, rotate_logs
+from src.models import BackupStats, DirectoryStats
+
+LOG = """\
+2024/01/01 02:00:00 [42] building file list
+2024/01/01 02:00:01 [42] >f+++++++++ photos/a.jpg
+2024/01/01 02:00:02 [42] rsync: [sender] send_files failed to open "photos/locked.jpg": Permission denied (13)
+2024/01/01 02:00:02 [42] rsync: [sender] send_files failed to open "photos/locked.jpg": Permission denied (13)
+2024/01/01 02:00:03 [42] rsync: opendir "photos/private" failed: Permission denied (13)
+2024/01/01 02:00:04 [42] file has vanished: "photos/tmp.part"
+2024/01/01 02:00:05 [42] rsync: read errors mapping "photos/bad.raw": Input/output error (5)
+2024/01/01 02:00:06 [42] >f+++++++++ photos/b.jpg
+2024/01/01 02:00:07 [42] rsync error: some files/attrs were not transferred (code 23)
+"""  # noqa: E501
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "rsync_errors_20240101_020000.log"
+    path.write_text(LOG)
+    return path
+
+
+def test_classify():
+    assert classify("Permission denied (13)") == "permission"
+    assert classify('file has vanished: "x"') == "vanished"
+    assert classify("write failed: No space left on device (28)") == "no_space"
+    assert classify("rsync: connection unexpectedly closed") == "connection"
+    assert classify("something else failed") == "other"
+
+
+def test_analyze_counts_categories_and_paths(log_file):
+    summary = ErrorLogAnalyzer(top_paths=2).analyze(log_file)
+
+    assert summary.total == 6
+    assert summary.categories == {
+        "permission": 3,
+        "vanished": 1,
+        "io": 1,
+        "rsync_exit": 1,
+    }
+    assert summary.top_paths == [("photos/locked.jpg", 2), ("photos/private", 1)]
+    assert summary.examples["vanished"] == 'file has vanished: "photos/tmp.part"'
+    assert summary.format() == "permission 3, io 1, rsync_exit 1, vanished 1"
+
+
+def test_analyze_across_block_boundaries(monkeypatch, log_file):
+    expected = ErrorLogAnalyzer().analyze(log_file)
+    monkeypatch.setattr(error_log, "BLOCK_SIZE", 7)
+
+    assert ErrorLogAnalyzer().analyze(log_file) == expected
+
+
+def test_analyze_clean_log(tmp_path):
+    clean = tmp_path / "clean.log"
+    clean.write_text("2024/01/01 02:00:01 [42] >f+++++++++ photos/a.jpg")
+
+    assert ErrorLogAnalyzer().analyze(clean) == ErrorSummary()
+
+
+def test_path_table_is_bounded(tmp_path):
+    log = tmp_path / "many.log"
+    lines = ['file has vanished: "hot"\n'] * 50
+    lines += [f'file has vanished: "cold{i}"\n' for i in range(100)]
+    log.write_text("".join(lines))
+
+    summary = ErrorLogAnalyzer(top_paths=1, max_paths=10).analyze(log)
+
+    assert summary.total == 150
+    assert summary.top_paths == [("hot", 50)]
+
+
+def test_rotate_logs(tmp_path):
+    now = time.time()
+
+    def make_log(name, age_days):
+        path = tmp_path / name
+        path.write_text("log")
+        mtime = now - age_days * 86400
+        os.utime(path, (mtime, mtime))
+        return path
+
+    current = make_log("rsync_errors_current.log", 5)
+    old = make_log("rsync_errors_old.log", 2)
+    expired = make_log("rsync_errors_expired.log", 40)
+    expired_gz = make_log("rsync_errors_expired2.log.gz", 40)
+    unrelated = make_log("other.log", 40)
+
+    rotate_logs(tmp_path, keep_days=30, compress_after_days=1, exclude=[current])
+
+    assert current.exists()
+    assert not old.exists()
+    with gzip.open(tmp_path / "rsync_errors_old.log.gz", "rt") as f:
+        assert f.read() == "log"
+    assert not expired.exists()
+    assert not expired_gz.exists()
+    assert unrelated.exists()
+
+
+def test_errors_only_compacts_log(log_file):
+    manager = BackupManager(
+        {"backup": {"directories": [], "error_logs": {"errors_only": True}}}
+    )
+
+    summary = manager._analyze_log(log_file)
+
+    assert summary.total == 6
+    assert ">f+++" not in log_file.read_text()
+    assert len(log_file.read_text().splitlines()) == 6
+
+
+def test_backup_directory_attaches_error_summary(monkeypatch, tmp_path):
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        log = next(c for c in cmd if c.startswith("--log-file="))[11:]
+        with open(log, "w") as f:
+            f.write(LOG)
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    manager = BackupManager({"backup": {"directories": []}})
+
+    dir_stats = manager._backup_directory(str(tmp_path / "src"), str(tmp_path))
+
+    assert dir_stats.status == "completed_with_errors"
+    assert dir_stats.error_summary.categories["permission"] == 3
+
+    stats = BackupStats(directories={dir_stats.source: dir_stats})
+    body = EmailSender({}, dry_run=True)._generate_report_body(stats)
+    assert "Errors: 6 (permission 3, io 1, rsync_exit 1, vanished 1)" in body
+    assert "  2x photos/locked.jpg" in body
+
+
+def test_has_errors_in_log(log_file, tmp_path):
+    manager = BackupManager({"backup": {"directories": []}})
+    clean = tmp_path / "clean.log"
+    clean.write_text(">f+++++++++ photos/a.jpg\n")
+
+    assert manager._has_errors_in_log(log_file)
+    assert not manager._has_errors_in_log(clean)
+    assert not manager._has_errors_in_log(tmp_path / "missing.log")
+    assert DirectoryStats("/src", 0, 0).error_summary is None
@@ -0,0 +1,72 @@
+from pathlib import Path
+
+from src.history import HistoryStore
+from src.main import print_history
+from src.models import BackupStats, DirectoryStats
+from src.report import build_report
+
+
+def _stats(size, duration, status="success"):
+    stats = BackupStats(total_files=2, total_size=size * 2, duration_seconds=duration)
+    for source in ("/docs", "/photos"):
+        stats.directories[source] = DirectoryStats(
+            source=source,
+            files_transferred=1,
+            size_bytes=size,
+            status=status,
+            duration_seconds=duration / 2,
+            error_log=Path("/nas/rsync_errors.log") if status != "success" else None,
+        )
+    return stats
+
+
+def test_record_and_query_runs(tmp_path):
+    store = HistoryStore(tmp_path / "state" / "history.db")
+    first = store.record_run(build_report(_stats(1000, 10)))
+    second = store.record_run(
+        build_report(_stats(4000, 20, status="completed_with_errors"))
+    )
+
+    runs = store.recent_runs()
+    assert [r["id"] for r in runs] == [second, first]
+    assert runs[0]["total_size"] == 8000
+    assert runs[0]["bytes_per_second"] == 400
+    assert store.recent_runs(limit=1)[0]["id"] == second
+
+    trend = store.directory_trend()
+    assert [(d["source"], d["run_id"]) for d in trend] == [
+        ("/docs", second),
+        ("/docs", first),
+        ("/photos", second),
+        ("/photos", first),
+    ]
+    assert trend[0]["bytes_per_second"] == 400
+    assert trend[0]["error_log"] == "/nas/rsync_errors.log"
+
+    photos = store.directory_trend(source="/photos", limit=1)
+    assert len(photos) == 1
+    assert photos[0]["status"] == "completed_with_errors"
+
+
+def test_history_survives_reopen(tmp_path):
+    path = tmp_path / "history.db"
+    failed = BackupStats(status="failed", error="NAS offline")
+    HistoryStore(path).record_run(build_report(failed))
+
+    runs = HistoryStore(path).recent_runs()
+    assert runs[0]["status"] == "failed"
+    assert runs[0]["error"] == "NAS offline"
+    assert runs[0]["bytes_per_second"] == 0
+
+
+def test_print_history(tmp_path, capsys):
+    config = {"history": {"path": str(tmp_path / "history.db")}}
+    HistoryStore(config["history"]["path"]).record_run(build_report(_stats(2048, 2)))
+
+    assert print_history(config, 5) is True
+    output = capsys.readouterr().out
+    assert "Recent runs:" in output
+    assert "Directory: /photos" in output
+    assert "2.00KB/s" in output
+
+    assert print_history({}, 5) is False
@@ -0,0 +1,62 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src import main
+
+ROOT = Path(__file__).parent.parent
+# Only the commands doing a backup may load these
+HEAVY_MODULES = ("asyncssh", "wakeonlan", "smtplib", "src.backup_manager")
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(
+        "backup:\n"
+        f"  directories: [{{source: {tmp_path}, destination: {tmp_path}/dest}}]\n"
+        f"  schedule: {{lock_file: {tmp_path}/lock}}\n"
+    )
+    return path
+
+
+@pytest.mark.parametrize("command", [[], ["status"], ["history"], ["verify", "--full"]])
+def test_commands_skip_heavy_imports(config_file, command):
+    code = (
+        "import sys\n"
+        "from src import main\n"
+        f"sys.argv = ['main', *{command!r}, '--config', {str(config_file)!r}]\n"
+        "try:\n"
+        f"    main.main() if {command!r} else None\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT
+    )
+
+    assert result.stdout.strip().splitlines()[-1] == "[]", result.stderr
+
+
+def test_commandless_invocation_runs_backups(monkeypatch, config_file):
+    calls = []
+    monkeypatch.setattr(main, "run_backups", lambda config, args: calls.append(args))
+
+    with pytest.raises(SystemExit):
+        main.main(["--config", str(config_file), "--once", "--dry-run"])
+
+    assert calls[0].command == "run"
+    assert calls[0].once and calls[0].dry_run
+
+
+def test_status(config_file, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main.main(["status", "--config", str(config_file)])
+
+    assert exit_info.value.code == 0
+    output = capsys.readouterr().out
+    assert "Job running: no" in output
+    assert "now (never ran)" in output
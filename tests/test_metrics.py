@@ -0,0 +1,60 @@
+from src.error_log import ErrorSummary
+from src.metrics import render_prometheus, write_prometheus_textfile
+from src.models import BackupStats, DirectoryStats
+from src.report import build_report
+from src.timing import PhaseTiming
+
+
+def _stats():
+    stats = BackupStats(
+        timestamp="2024-01-01T02:00:00", duration_seconds=12.5, total_size=100
+    )
+    stats.directories['/home/"quoted"'] = DirectoryStats(
+        source='/home/"quoted"',
+        files_transferred=3,
+        size_bytes=100,
+        duration_seconds=12.0,
+    )
+    return stats
+
+
+def test_render_prometheus_sums_repeated_phases():
+    timings = [
+        PhaseTiming("boot_wait", 40.0, "t0"),
+        PhaseTiming("command:rsync", 5.0, "t1", parent="backup", depth=1),
+        PhaseTiming("command:rsync", 7.0, "t2", parent="backup", depth=1),
+    ]
+
+    text = render_prometheus(build_report(_stats()), timings)
+
+    assert "# TYPE nas_backup_phase_duration_seconds gauge" in text
+    assert 'nas_backup_phase_duration_seconds{phase="boot_wait"} 40.000' in text
+    assert 'nas_backup_phase_duration_seconds{phase="command:rsync"} 12.000' in text
+    assert "nas_backup_last_run_success 1" in text
+    assert "nas_backup_last_run_duration_seconds 12.500" in text
+    assert (
+        'nas_backup_directory_transferred_bytes{source="/home/\\"quoted\\""} 100'
+        in text
+    )
+
+
+def test_write_prometheus_textfile(tmp_path):
+    path = tmp_path / "textfile" / "nas_backup.prom"
+    failed = BackupStats(status="failed", timestamp="2024-01-01T02:00:00")
+
+    write_prometheus_textfile(path, build_report(failed), [])
+
+    assert "nas_backup_last_run_success 0" in path.read_text()
+    assert [p.name for p in path.parent.iterdir()] == ["nas_backup.prom"]
+
+
+def test_render_prometheus_error_categories():
+    stats = _stats()
+    stats.directories['/home/"quoted"'].error_summary = ErrorSummary(
+        total=3, categories={"permission": 2, "vanished": 1}
+    )
+
+    text = render_prometheus(build_report(stats), [])
+
+    labels = 'source="/home/\\"quoted\\"",category="permission"'
+    assert f"nas_backup_directory_errors{{{labels}}} 2" in text
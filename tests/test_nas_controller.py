@@ -0,0 +1,254 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import asyncssh
+import pytest
+
+from src.nas_controller import NASController, SSHSessionManager
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {
+        "nas": {
+            "ip": "192.168.1.100",
+            "username": "admin",
+            "mac_address": "00:11:22:33:44:55",
+            "mount": {"type": "cifs", "local_path": str(tmp_path / "mnt")},
+            "boot": {"jitter": 0, "state_file": str(tmp_path / "boot.json")},
+        }
+    }
+
+
+class FakeClock:
+    """Replaces time.sleep/time.monotonic; the NAS is up after boot_time."""
+
+    def __init__(self, boot_time):
+        self.now = 0.0
+        self.boot_time = boot_time
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 2))
+        self.now += seconds
+
+    def monotonic(self):
+        return self.now
+
+    def ready(self):
+        return self.now >= self.boot_time
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock(boot_time=40)
+    monkeypatch.setattr("src.nas_controller.time.sleep", fake.sleep)
+    monkeypatch.setattr("src.nas_controller.time.monotonic", fake.monotonic)
+    return fake
+
+
+def test_verify_nas_online_backs_off(config, clock):
+    controller = NASController(config)
+    controller._check_nas_connection = clock.ready
+
+    assert controller._verify_nas_online() is True
+
+    assert clock.sleeps == [2, 3, 4.5, 6.75, 10.12, 15.19]
+    assert clock.now == pytest.approx(41.5625)
+    state = json.loads(open(config["nas"]["boot"]["state_file"]).read())
+    assert state == {"boot_times": [41.6]}
+
+
+def test_verify_nas_online_starts_near_learned_boot_time(config, clock):
+    with open(config["nas"]["boot"]["state_file"], "w") as f:
+        json.dump({"boot_times": [30, 50, 45]}, f)
+    controller = NASController(config)
+    controller._check_nas_connection = clock.ready
+
+    controller._verify_nas_online()
+
+    assert clock.sleeps == [36, 2, 3]
+    state = json.loads(open(config["nas"]["boot"]["state_file"]).read())
+    assert state["boot_times"] == [30, 50, 45, 41.0]
+
+
+def test_verify_nas_online_times_out(config, clock):
+    config["nas"]["boot"]["timeout"] = 20
+    controller = NASController(config)
+    controller._check_nas_connection = lambda: False
+
+    with pytest.raises(Exception, match="within 20 seconds"):
+        controller._verify_nas_online()
+    assert clock.now == 20
+
+
+class FakeSocket:
+    def __init__(self, banner):
+        self.banner = banner
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def recv(self, size):
+        return self.banner
+
+
+def test_check_nas_connection_requires_banner_and_mount_port(config, monkeypatch):
+    open_ports = {22: b"SSH-2.0-OpenSSH_9.6\r\n"}
+    attempted = []
+
+    def create_connection(address, timeout):
+        attempted.append(address[1])
+        if address[1] not in open_ports:
+            raise ConnectionRefusedError()
+        return FakeSocket(open_ports[address[1]])
+
+    monkeypatch.setattr(
+        "src.nas_controller.socket.create_connection", create_connection
+    )
+    controller = NASController(config)
+
+    assert controller._check_nas_connection() is False
+    assert attempted == [22, 445]
+
+    open_ports[445] = b""
+    assert controller._check_nas_connection() is True
+
+    open_ports[22] = b""  # port open but sshd not answering yet
+    assert controller._check_nas_connection() is False
+
+
+@pytest.mark.parametrize(
+    "transport, ssh_port, expected",
+    [
+        ({"type": "mount"}, 22, [22, 445]),
+        ({"type": "ssh"}, 22, [22]),
+        ({"type": "ssh"}, 2222, [2222]),
+        ({"type": "rsync_daemon"}, 22, [22, 873]),
+        ({"type": "rsync_daemon", "port": 8873}, 22, [22, 8873]),
+    ],
+)
+def test_readiness_probes_the_transport_ports(
+    config, monkeypatch, transport, ssh_port, expected
+):
+    attempted = []
+
+    def create_connection(address, timeout):
+        attempted.append(address[1])
+        return FakeSocket(b"SSH-2.0-OpenSSH_9.6\r\n")
+
+    monkeypatch.setattr(
+        "src.nas_controller.socket.create_connection", create_connection
+    )
+    config["nas"]["transport"] = transport
+    config["nas"]["ssh"] = {"port": ssh_port}
+    controller = NASController(config)
+
+    assert controller._check_nas_connection() is True
+    assert attempted == expected
+
+
+class FakeConnection:
+    def __init__(self, log):
+        self.log = log
+        self.closed = False
+        self.running = 0
+        self.max_running = 0
+        self.fail_next_open = False
+
+    async def run(self, command, check=False, timeout=None):
+        if self.fail_next_open:
+            self.fail_next_open = False
+            raise asyncssh.ChannelOpenError(2, "Connection closed")
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.05)
+        self.running -= 1
+        self.log.append(command)
+        return SimpleNamespace(stdout=f"out:{command}")
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+@pytest.fixture
+def fake_ssh(monkeypatch):
+    connections = []
+    commands = []
+
+    async def connect(host, **kwargs):
+        conn = FakeConnection(commands)
+        conn.kwargs = kwargs
+        connections.append(conn)
+        return conn
+
+    monkeypatch.setattr("asyncssh.connect", connect)
+    return SimpleNamespace(connections=connections, commands=commands)
+
+
+def test_ssh_session_reuses_one_connection(fake_ssh):
+    manager = SSHSessionManager("nas", "admin", max_sessions=3)
+    try:
+        assert manager.run("uptime") == "out:uptime"
+        outputs = manager.run_many([f"cmd{i}" for i in range(6)])
+    finally:
+        manager.close()
+
+    assert outputs == [f"out:cmd{i}" for i in range(6)]
+    assert len(fake_ssh.connections) == 1
+    assert fake_ssh.connections[0].max_running == 3
+    assert fake_ssh.connections[0].kwargs["keepalive_interval"] == 15
+    assert fake_ssh.connections[0].closed
+
+
+def test_ssh_session_reconnects(fake_ssh):
+    manager = SSHSessionManager("nas", "admin")
+    try:
+        manager.run("first")
+        fake_ssh.connections[0].closed = True  # dropped, e.g. keepalive timeout
+        manager.run("second")
+        fake_ssh.connections[1].fail_next_open = True
+        manager.run("third")
+    finally:
+        manager.close()
+
+    assert len(fake_ssh.connections) == 3
+    assert fake_ssh.commands == ["first", "second", "third"]
+
+
+def test_remote_commands_and_free_space(config, fake_ssh):
+    config["nas"]["hooks"] = {"pre_backup": ["echo pre", "echo other"]}
+    controller = NASController(config)
+    submitted = []
+
+    def run_many(commands):
+        submitted.extend(commands)
+        return [
+            "Filesystem 1024-blocks Used Available Capacity Mounted on\n"
+            "/dev/md0 1000 400 600 40% /volume1\n"
+            for _ in commands
+        ]
+
+    controller.ssh.run_many = run_many
+
+    assert controller.remote_free_space(["/volume1", "/it's; rm -rf /"]) == [
+        600 * 1024,
+        600 * 1024,
+    ]
+    assert submitted == ["df -Pk /volume1", "df -Pk '/it'\"'\"'s; rm -rf /'"]
+
+    controller = NASController(config)
+    controller.run_hooks("pre_backup")
+    controller.run_hooks("post_backup")
+    controller.ssh.close()
+    assert fake_ssh.commands == ["echo pre", "echo other"]
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from src.backup_manager import BackupManager
+from src.change_index import scan_tree
+from src.pipeline import Pipeline
+from src.timing import Tracer
+
+
+def test_independent_stages_overlap():
+    both_running = threading.Barrier(2, timeout=5)
+
+    def boot():
+        both_running.wait()
+        return "nas up"
+
+    def scan():
+        both_running.wait()
+        return ["a", "b"]
+
+    def backup(files, nas):
+        return f"{len(files)} files, {nas}"
+
+    results = (
+        Pipeline()
+        .add("start_nas", boot)
+        .add("prepare", scan)
+        .add("backup", backup, after=["prepare", "start_nas"])
+        .run()
+    )
+
+    assert results["backup"] == "2 files, nas up"
+
+
+def test_stage_waits_for_its_dependencies():
+    order = []
+
+    def step(name, delay=0.0):
+        def run(*_):
+            time.sleep(delay)
+            order.append(name)
+
+        return run
+
+    (
+        Pipeline()
+        .add("slow", step("slow", 0.1))
+        .add("fast", step("fast"))
+        .add("after_slow", step("after_slow"), after=["slow"])
+        .run()
+    )
+
+    assert order == ["fast", "slow", "after_slow"]
+
+
+def test_failure_skips_dependents_but_finishes_other_stages():
+    ran = []
+
+    def fail():
+        raise RuntimeError("NAS did not wake up")
+
+    pipeline = (
+        Pipeline()
+        .add("start_nas", fail)
+        .add("prepare", lambda: ran.append("prepare"))
+        .add("backup", lambda _: ran.append("backup"), after=["start_nas"])
+    )
+
+    with pytest.raises(RuntimeError, match="did not wake up"):
+        pipeline.run()
+    assert ran == ["prepare"]
+    assert pipeline.skipped == ["backup"]
+
+
+def test_always_stage_collects_failed_branches():
+    def fail():
+        raise RuntimeError("offsite NAS did not wake up")
+
+    pipeline = (
+        Pipeline()
+        .add("primary", lambda: "done")
+        .add("offsite", fail)
+        .add(
+            "report",
+            lambda *results: results,
+            after=["primary", "offsite"],
+            always=True,
+        )
+    )
+
+    with pytest.raises(RuntimeError):
+        pipeline.run()
+    assert pipeline.results["report"] == ("done", None)
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError):
+        Pipeline().add("backup", lambda _: None, after=["start_nas"])
+
+
+def test_stages_are_timed():
+    tracer = Tracer()
+    with tracer.activate():
+        Pipeline().add("start_nas", lambda: None).add(
+            "backup", lambda _: None, after=["start_nas"]
+        ).run()
+
+    assert [t.name for t in tracer.spans] == ["start_nas", "backup"]
+
+
+def test_prepared_directories_are_reused(monkeypatch, tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "file.txt").write_text("data")
+    config = {
+        "backup": {
+            "directories": [
+                {"source": str(source), "destination": str(tmp_path / "dest")}
+            ],
+            "change_index": {"path": str(tmp_path / "index")},
+        }
+    }
+    scans = []
+
+    def counting_scan_tree(path):
+        scans.append(path)
+        return scan_tree(path)
+
+    monkeypatch.setattr("src.backup_manager.scan_tree", counting_scan_tree)
+    monkeypatch.setattr("src.backup_manager.stream_command", lambda *args, **kwargs: "")
+    manager = BackupManager(config)
+
+    prepared = manager.prepare()
+    stats = manager.run_backup(prepared)
+
+    assert scans == [str(source)]
+    assert prepared[str(source)].changes.full
+    assert stats.directories[str(source)].status == "success"
@@ -0,0 +1,205 @@
+import os
+import shutil
+
+import pytest
+
+from src.backup_manager import BackupManager, PreparedDirectory
+from src.change_index import ChangeSet, scan_tree
+from src.models import DirectoryStats
+from src.preflight import PreflightCheck, PreflightError
+
+
+@pytest.fixture
+def sources(tmp_path):
+    for name, size in (("docs", 1000), ("photos", 5000), ("music", 2000)):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "file").write_bytes(b"x" * size)
+    return tmp_path
+
+
+def _config(sources, **preflight):
+    return {
+        "backup": {
+            "directories": [
+                {"source": str(sources / name), "destination": f"/nas/{name}"}
+                for name in ("docs", "photos", "music")
+            ],
+            "preflight": {"estimator": "source_size", "margin": 0, **preflight},
+        }
+    }
+
+
+def _with_free_space(check, free):
+    check._free_space = lambda destination: (1, free)
+    return check
+
+
+def test_preflight_passes_when_everything_fits(sources):
+    config = _config(sources)
+    check = _with_free_space(PreflightCheck(config), 10000)
+
+    to_run, skipped, estimates = check.run(config["backup"]["directories"])
+
+    assert to_run == config["backup"]["directories"]
+    assert skipped == {}
+    assert estimates[str(sources / "photos")] == 5000
+
+
+def test_preflight_aborts_with_report(sources):
+    config = _config(sources, reserve_bytes=1000)
+    check = _with_free_space(PreflightCheck(config), 8000)
+
+    with pytest.raises(PreflightError) as exc_info:
+        check.run(config["backup"]["directories"])
+
+    assert str(exc_info.value) == (
+        "Not enough space on destination:\n"
+        f"{sources / 'music'}: needs ~1.95KB but only 1000.00B is free on /nas/music"
+    )
+
+
+def test_preflight_skips_directories_that_do_not_fit(sources):
+    config = _config(sources, on_insufficient="skip")
+    check = _with_free_space(PreflightCheck(config), 6500)
+
+    to_run, skipped, _ = check.run(config["backup"]["directories"])
+
+    assert [d["source"] for d in to_run] == [
+        str(sources / "docs"),
+        str(sources / "photos"),
+    ]
+    music = skipped[str(sources / "music")]
+    assert music.status == "skipped"
+    assert music.estimated_bytes == 2000
+    assert "Skipped by preflight check" in music.details
+
+
+def test_rsync_estimator(monkeypatch, sources):
+    commands = []
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        commands.append(cmd)
+        on_line("Total transferred file size: 1,234 bytes")
+        return ""
+
+    monkeypatch.setattr("src.preflight.stream_command", fake_stream_command)
+    check = PreflightCheck(_config(sources))
+
+    estimate = check.estimate({"source": "/src", "destination": "/dst"}, "rsync")
+
+    assert estimate == 1234
+    assert "--dry-run" in commands[0] and "--stats" in commands[0]
+    with pytest.raises(ValueError):
+        check.estimate({"source": "/src", "destination": "/dst"}, "guess")
+
+
+def test_run_backup_reports_skipped_directories(monkeypatch, sources):
+    config = _config(sources, on_insufficient="skip")
+    monkeypatch.setattr(
+        PreflightCheck, "_free_space", lambda self, destination: (1, 3500)
+    )
+    manager = BackupManager(config)
+    manager._backup_directory = (
+        lambda source, destination, dir_config=None, prepared=None: DirectoryStats(
+            source=source, files_transferred=1, size_bytes=10
+        )
+    )
+
+    stats = manager.run_backup()
+
+    assert [d.status for d in stats.directories.values()] == [
+        "success",
+        "skipped",
+        "success",
+    ]
+    assert stats.directories[str(sources / "music")].estimated_bytes == 2000
+    assert stats.total_files == 2
+
+
+def test_change_index_and_dedup_skip_the_estimator(monkeypatch, sources):
+    monkeypatch.setattr(
+        "src.preflight.stream_command",
+        lambda *args, **kwargs: pytest.fail("rsync estimate ran"),
+    )
+    (sources / "photos" / "new").write_bytes(b"x" * 300)
+    config = _config(sources, estimator="rsync")
+    config["backup"]["dedup"] = {"path": str(sources / "chunk-index")}
+    docs, photos, music = config["backup"]["directories"]
+    music["dedup"] = True
+    music["destination"] = str(sources / "store")
+    prepared = {
+        docs["source"]: PreparedDirectory(
+            [], scan=scan_tree(docs["source"]), changes=ChangeSet([], "unchanged")
+        ),
+        photos["source"]: PreparedDirectory(
+            [], scan=scan_tree(photos["source"]), changes=ChangeSet(["new"], "1")
+        ),
+    }
+    check = _with_free_space(PreflightCheck(config), 10000)
+
+    _, _, estimates = check.run(config["backup"]["directories"], prepared)
+
+    assert estimates == {
+        docs["source"]: 0,
+        photos["source"]: 300,
+        music["source"]: 2000,
+    }
+
+
+def test_source_size_skips_files_already_on_the_destination(sources):
+    config = _config(sources)
+    docs = config["backup"]["directories"][0]
+    docs["destination"] = str(sources / "nas")
+    (sources / "docs" / "new").write_bytes(b"x" * 300)
+    os.makedirs(sources / "nas" / "docs")
+    shutil.copy2(sources / "docs" / "file", sources / "nas" / "docs" / "file")
+
+    assert PreflightCheck(config).estimate(docs, "source_size") == 300
+
+
+def test_dedup_estimate_counts_files_the_index_does_not_know(sources):
+    from src.dedup import store_for
+
+    config = _config(sources)
+    config["backup"]["dedup"] = {"path": str(sources / "chunk-index")}
+    music = config["backup"]["directories"][2]
+    music.update(dedup=True, destination=str(sources / "store"))
+    check = PreflightCheck(config)
+    assert check.estimate(music, "source_size") == 2000
+
+    store_for(config["backup"]["dedup"], music).backup(music["source"])
+    (sources / "music" / "new").write_bytes(b"x" * 300)
+
+    assert check.estimate(music, "source_size") == 300
+
+
+def test_dry_run_does_not_check_free_space(sources):
+    config = _config(sources)
+    check = PreflightCheck(config, dry_run=True)
+    check._free_space = lambda destination: pytest.fail("free space checked")
+
+    to_run, skipped, estimates = check.run(config["backup"]["directories"])
+
+    assert to_run == config["backup"]["directories"]
+    assert estimates[str(sources / "photos")] == 5000
+
+
+def test_remote_transport_checks_nas_free_space(sources):
+    config = _config(sources)
+    config["nas"] = {
+        "ip": "nas",
+        "username": "backup",
+        "mount": {"remote_path": "volume1", "local_path": "/nas"},
+        "transport": {"type": "ssh"},
+    }
+    asked = []
+
+    def remote_free_space(paths):
+        asked.extend(paths)
+        return [6500]
+
+    check = PreflightCheck(config, remote_free_space=remote_free_space)
+
+    with pytest.raises(PreflightError, match="music"):
+        check.run(config["backup"]["directories"])
+    assert asked == ["/volume1"]
@@ -0,0 +1,108 @@
+import pytest
+
+from src.backup_manager import BackupManager
+from src.profiles import PRESETS, RsyncProfile, load_profiles, resolve_profile
+
+
+def test_preset_rsync_args():
+    assert PRESETS["default"].rsync_args() == []
+    assert PRESETS["photos-large-files"].rsync_args() == ["--whole-file", "--inplace"]
+    assert PRESETS["hardlinked-trees"].rsync_args() == [
+        "--no-inc-recursive",
+        "--hard-links",
+    ]
+
+
+def test_custom_profile_extends_base():
+    profiles = load_profiles(
+        {
+            "profiles": {
+                "slow-photos": {"base": "photos-large-files", "bwlimit": "20M"},
+                "slower-photos": {"base": "slow-photos", "bwlimit": "5M"},
+            }
+        }
+    )
+
+    assert profiles["slow-photos"].rsync_args() == [
+        "--whole-file",
+        "--inplace",
+        "--bwlimit=20M",
+    ]
+    assert profiles["slower-photos"].bwlimit == "5M"
+
+
+def test_resolve_inline_profile():
+    profile = resolve_profile(
+        {"base": "many-small-docs", "compress": True, "extra_args": ["--numeric-ids"]},
+        PRESETS,
+    )
+
+    assert profile == RsyncProfile(
+        whole_file=True,
+        compress=True,
+        checksum_choice="xxh3",
+        extra_args=["--numeric-ids"],
+    )
+    assert resolve_profile(None, PRESETS) == PRESETS["default"]
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        "no-such-profile",
+        {"base": "no-such-profile"},
+        {"compresion": True},
+        {"bwlimit": "fast"},
+        {"checksum_choice": "crc32"},
+        {"inplace": True, "whole_file": False},
+        {"extra_args": "--numeric-ids"},
+        ["--whole-file"],
+    ],
+)
+def test_invalid_profiles_are_rejected(spec):
+    with pytest.raises(ValueError):
+        resolve_profile(spec, PRESETS)
+
+
+def test_backup_manager_validates_profiles_up_front():
+    config = {
+        "backup": {
+            "directories": [{"source": "/src", "destination": "/dest", "profile": "x"}]
+        }
+    }
+    with pytest.raises(ValueError, match="Unknown rsync profile"):
+        BackupManager(config)
+
+
+def test_backup_directory_applies_profile(monkeypatch, tmp_path):
+    commands = []
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        commands.append(cmd)
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    manager = BackupManager({"backup": {"directories": []}})
+
+    manager._backup_directory(
+        str(tmp_path / "src"),
+        str(tmp_path / "dest"),
+        {"profile": {"base": "wan", "bwlimit": "1M"}},
+    )
+
+    assert commands[0][-4:] == [
+        "--compress",
+        "--bwlimit=1M",
+        str(tmp_path / "src"),
+        str(tmp_path / "dest"),
+    ]
+    assert "--no-whole-file" in commands[0]
+
+
+def test_profile_is_part_of_change_index_key():
+    manager = BackupManager({"backup": {"directories": []}})
+
+    plain = manager._index_key("/src", "/dest")
+    tuned = manager._index_key("/src", "/dest", ["--whole-file"])
+
+    assert plain != tuned
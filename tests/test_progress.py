@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from src.backup_manager import BackupManager
+from src.progress import (
+    CallbackProgressSink,
+    JsonLinesProgressSink,
+    LogProgressSink,
+    ProgressTracker,
+    TransferProgress,
+    create_progress_sink,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_tracker_reports_rates_and_eta():
+    events = []
+    clock = FakeClock()
+    tracker = ProgressTracker("/src", events.append, interval=5, clock=clock)
+
+    tracker.feed("photos/a.jpg")
+    clock.now += 10
+    tracker.feed("     10,000,000  25%    1.00MB/s    0:00:10 (xfr#4, to-chk=6/10)")
+    clock.now += 1
+    tracker.feed("     11,000,000  27%    1.00MB/s    0:00:11")  # throttled
+    clock.now += 9
+    tracker.feed("photos/b.jpg")
+    tracker.feed("     20,000,000  50%    1.00MB/s    0:00:20 (xfr#8, to-chk=2/10)")
+
+    assert len(events) == 2
+    first, second = events
+    assert first.current_file == "photos/a.jpg"
+    assert first.bytes_per_second == 1_000_000
+    assert first.files_per_second == 0.4
+    assert first.eta_seconds == 30
+    assert second.current_file == "photos/b.jpg"
+    assert second.files_transferred == 8
+    assert second.eta_seconds == 20
+
+
+def test_tracker_finish_and_stats_section():
+    events = []
+    tracker = ProgressTracker("/src", events.append, clock=FakeClock())
+    tracker.feed("Number of files: 10")
+    tracker.feed("Total file size: 10 bytes")
+    tracker.finish()
+
+    assert events[-1].finished is True
+    assert events[-1].eta_seconds == 0
+    assert events[-1].current_file is None
+
+
+def test_sinks(tmp_path, caplog):
+    progress = TransferProgress("/src", 2048, 2, 50, 2.0, 1024.0, 1.0, eta_seconds=2)
+
+    received = []
+    CallbackProgressSink(received.append)(progress)
+    assert received == [progress]
+
+    path = tmp_path / "progress.jsonl"
+    sink = JsonLinesProgressSink(path)
+    sink(progress)
+    sink(progress)
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["bytes_per_second"] == 1024.0
+
+    with caplog.at_level("INFO"):
+        LogProgressSink()(progress)
+    assert "/src: 50% 2.00KB at 1.00KB/s" in caplog.text
+
+
+def test_create_progress_sink(tmp_path):
+    assert create_progress_sink({}) is None
+    assert isinstance(create_progress_sink({"sink": "log"}), LogProgressSink)
+    sink = create_progress_sink({"sink": "jsonl", "path": str(tmp_path / "p")})
+    assert isinstance(sink, JsonLinesProgressSink)
+    with pytest.raises(ValueError):
+        create_progress_sink({"sink": "carrier-pigeon"})
+
+
+def test_backup_directory_emits_progress(monkeypatch, tmp_path):
+    commands = []
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        commands.append(cmd)
+        on_line("docs/report.pdf")
+        on_line("      1,000  100%    1.00kB/s    0:00:01 (xfr#1, to-chk=0/2)")
+        on_line("Number of regular files transferred: 1")
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    events = []
+    manager = BackupManager(
+        {"backup": {"directories": []}}, progress_sink=events.append
+    )
+
+    dir_stats = manager._backup_directory("/test/source", str(tmp_path / "dest"))
+
+    assert "--info=progress2" in commands[0]
+    assert dir_stats.files_transferred == 1
+    assert events[0].current_file == "docs/report.pdf"
+    assert events[-1].finished is True
@@ -0,0 +1,218 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import Mock
+
+import pytest
+
+from src.email_sender import EmailSender
+from src.error_log import ErrorSummary
+from src.history import HistoryStore
+from src.models import BackupStats, DirectoryStats
+from src.report import SCHEMA_VERSION, ReportExporter, build_report
+from src.timing import PhaseTiming
+
+
+def _stats(size, duration):
+    stats = BackupStats(
+        timestamp="2024-01-02T02:00:00",
+        total_files=3,
+        total_size=size,
+        duration_seconds=duration,
+        timings=[PhaseTiming("backup", duration, "t0")],
+    )
+    stats.directories["/docs"] = DirectoryStats(
+        source="/docs",
+        files_transferred=3,
+        size_bytes=size,
+        duration_seconds=duration,
+        status="completed_with_errors",
+        error_summary=ErrorSummary(total=2, categories={"permission": 2}),
+    )
+    return stats
+
+
+def test_report_is_json_with_rates_and_error_categories():
+    report = json.loads(json.dumps(build_report(_stats(1000, 10))))
+
+    assert report["schema_version"] == SCHEMA_VERSION
+    assert report["bytes_per_second"] == 100
+    assert report["trend"] is None
+    directory = report["directories"][0]
+    assert directory["key"] == "/docs"
+    assert directory["bytes_per_second"] == 100
+    assert directory["errors"]["categories"] == {"permission": 2}
+    assert report["timings"][0]["name"] == "backup"
+
+
+def test_trend_against_the_previous_run(tmp_path):
+    history = HistoryStore(tmp_path / "history.db")
+    history.record_run(build_report(_stats(1000, 10)))
+    previous_directories = {d["source"]: d for d in history.directory_trend(limit=1)}
+
+    report = build_report(
+        _stats(3000, 20), history.recent_runs(1)[0], previous_directories
+    )
+
+    assert report["trend"]["total_size"] == 2000
+    assert report["trend"]["duration_seconds"] == 10
+    assert report["trend"]["bytes_per_second"] == 50
+    assert report["directories"][0]["trend"]["size_bytes"] == 2000
+
+    body = EmailSender({}, dry_run=True)._generate_report_body(None, report)
+    assert "Change: +1.95KB, +10.0s, +50.00B/s" in body
+    html = EmailSender({}, dry_run=True)._generate_html_body(report)
+    assert "<td>/docs</td><td>completed_with_errors</td>" in html
+    assert "<td>+1.95KB, +10.0s, +50.00B/s</td>" in html
+    assert "permission 2" in html
+
+
+def test_html_is_escaped():
+    stats = _stats(1, 1)
+    stats.directories["/docs"].source = "/<b>docs"
+
+    html = EmailSender({}, dry_run=True)._generate_html_body(build_report(stats))
+
+    assert "&lt;b&gt;" in html and "<b>" not in html
+
+
+def test_export_to_file_and_jsonl(tmp_path):
+    report = build_report(_stats(1000, 10))
+
+    ReportExporter({"reports": {"path": str(tmp_path / "last.json")}}).export(report)
+    for _ in range(2):
+        ReportExporter({"reports": {"path": str(tmp_path / "runs.jsonl")}}).export(
+            report
+        )
+
+    assert json.loads((tmp_path / "last.json").read_text()) == report
+    lines = (tmp_path / "runs.jsonl").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [report, report]
+
+
+def test_export_posts_to_the_webhook():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append((self.headers["Authorization"], json.loads(body)))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.handle_request)
+    thread.start()
+    webhook = {
+        "url": f"http://127.0.0.1:{server.server_port}/hook",
+        "headers": {"Authorization": "Bearer token"},
+    }
+    report = build_report(_stats(1000, 10))
+
+    ReportExporter({"reports": {"webhook": webhook}}).export(report)
+    thread.join(5)
+    server.server_close()
+
+    assert received == [("Bearer token", report)]
+
+
+def test_export_failures_are_logged(tmp_path, caplog):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    config = {
+        "reports": {
+            "path": str(blocker / "last.json"),
+            "webhook": {"url": "http://127.0.0.1:1/hook", "timeout": 1},
+        }
+    }
+
+    ReportExporter(config).export(build_report(_stats(1, 1)))
+
+    assert "Failed to write the run report" in caplog.text
+    assert "Failed to post the run report" in caplog.text
+
+
+def _job_config(tmp_path):
+    source = tmp_path / "docs"
+    source.mkdir()
+    return {
+        "nas": {
+            "ip": "10.0.0.1",
+            "username": "admin",
+            "mac_address": "00:11:22:33:44:55",
+            "mount": {"type": "cifs", "local_path": str(tmp_path / "nas")},
+        },
+        "backup": {
+            "directories": [
+                {"source": str(source), "destination": str(tmp_path / "nas")}
+            ],
+            "schedule": {"lock_file": str(tmp_path / "lock")},
+        },
+        "history": {"path": str(tmp_path / "history.db")},
+        "reports": {"path": str(tmp_path / "runs.jsonl")},
+    }
+
+
+@pytest.fixture
+def offline_nas(monkeypatch):
+    from src.nas_controller import NASController
+
+    monkeypatch.setattr(NASController, "start_nas", lambda self: None)
+    monkeypatch.setattr(NASController, "run_hooks", lambda self, stage: None)
+    monkeypatch.setattr(NASController, "shutdown_nas", lambda self: None)
+
+
+def test_job_reports_trends_against_the_previous_job(
+    monkeypatch, tmp_path, offline_nas
+):
+    from src.orchestrator import BackupOrchestrator
+
+    config = _job_config(tmp_path)
+    sizes = iter([1000, 4000])
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        on_line(f"Total transferred file size: {next(sizes)} bytes")
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    emailed = []
+    for _ in range(2):
+        orchestrator = BackupOrchestrator(config)
+        monkeypatch.setattr(
+            orchestrator.email_sender,
+            "send_report",
+            lambda stats, report=None: emailed.append(report),
+        )
+        assert orchestrator.run_backup_job()
+
+    first, second = [
+        json.loads(line) for line in (tmp_path / "runs.jsonl").read_text().splitlines()
+    ]
+    assert first["trend"] is None
+    assert second["trend"]["total_size"] == 3000
+    assert second["directories"][0]["trend"]["size_bytes"] == 3000
+    assert emailed == [first, second]
+
+
+def test_failed_email_does_not_publish_the_run_again(
+    monkeypatch, tmp_path, offline_nas
+):
+    from src.orchestrator import BackupOrchestrator
+
+    config = _job_config(tmp_path)
+    monkeypatch.setattr("src.backup_manager.stream_command", lambda *a, **kw: "")
+    orchestrator = BackupOrchestrator(config)
+    monkeypatch.setattr(
+        orchestrator.email_sender, "send_report", Mock(side_effect=OSError("smtp down"))
+    )
+
+    assert orchestrator.run_backup_job() is False
+
+    reports = (tmp_path / "runs.jsonl").read_text().splitlines()
+    assert [json.loads(r)["status"] for r in reports] == ["success"]
+    assert [r["status"] for r in orchestrator.history.recent_runs(5)] == ["success"]
+    orchestrator.email_sender.send_report.assert_called_once()
+    assert orchestrator.backed_up == [config["backup"]["directories"][0]["source"]]
@@ -0,0 +1,87 @@
+import sys
+
+from src.backup_manager import BackupManager
+from src.rsync_output import RsyncOutputParser
+from src.utils import CommandError, stream_command
+
+RSYNC_OUTPUT = """sending incremental file list
+photos/
+photos/created_at_beach.jpg
+photos/notes.txt
+
+Number of files: 1,234 (reg: 1,200, dir: 34)
+Number of created files: 2
+Number of deleted files: 0
+Number of regular files transferred: 123
+Total file size: 1,234,567 bytes
+Total transferred file size: 123,456 bytes
+Literal data: 123,456 bytes
+Matched data: 0 bytes
+File list size: 123
+Total bytes sent: 123,456
+Total bytes received: 1,234
+
+sent 123,456 bytes  received 1,234 bytes  2,000.00 bytes/sec
+total size is 1,234,567  speedup is 10.00 (DRY RUN)
+"""
+
+
+def test_parser_extracts_stats():
+    parser = RsyncOutputParser()
+    parser.feed_output(RSYNC_OUTPUT)
+
+    assert parser.files_transferred == 123
+    assert parser.size_bytes == 123456
+    assert parser.total_size_bytes == 1234567
+    assert parser.dry_run is True
+    assert parser.summary == (
+        "Number of created files: 2 | "
+        "Number of deleted files: 0 | Number of regular files transferred: 123 | "
+        "Total transferred file size: 123,456 bytes"
+    )
+
+
+def test_streamed_output_matches_buffered_parsing():
+    manager = BackupManager({"backup": {"directories": []}})
+    buffered = manager._parse_rsync_stats(RSYNC_OUTPUT, "/test/source")
+
+    parser = RsyncOutputParser()
+    cmd = [sys.executable, "-c", f"print({RSYNC_OUTPUT!r}, end='')"]
+    stream_command(cmd, "Echo failed", parser.feed)
+    streamed = manager._build_directory_stats(parser, "/test/source")
+
+    assert streamed.files_transferred == buffered.files_transferred
+    assert streamed.size_bytes == buffered.size_bytes
+    assert streamed.status == buffered.status == "dry-run"
+    assert streamed.details == buffered.details
+    assert manager._extract_summary(RSYNC_OUTPUT) == buffered.details
+
+
+def test_backup_directory_accepts_partial_transfer(monkeypatch, tmp_path):
+    commands = []
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        commands.append(cmd)
+        for line in RSYNC_OUTPUT.splitlines():
+            on_line(line)
+        raise CommandError(error_msg, 23, "", "some files vanished")
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    config = {"backup": {"directories": [], "file_listing": False}}
+    manager = BackupManager(config)
+
+    dir_stats = manager._backup_directory("/test/source", str(tmp_path / "dest"))
+
+    assert commands[0][1] == "-a"
+    assert dir_stats.files_transferred == 123
+    assert dir_stats.size_bytes == 123456
+    assert dir_stats.error_log is None
+
+
+def test_summary_ignores_per_file_lines():
+    parser = RsyncOutputParser()
+    for i in range(1000):
+        parser.feed(f"changed/transferred_{i}.txt")
+    parser.feed_output(RSYNC_OUTPUT)
+
+    assert len(parser.summary_lines) == 4
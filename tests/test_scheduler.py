@@ -0,0 +1,219 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models import BackupStats, DirectoryStats
+from src.scheduler import CronSchedule, JobLock, JobLocked, Scheduler
+
+
+def test_cron_next_after():
+    nightly = CronSchedule("30 2 * * *")
+    assert nightly.next_after(datetime(2024, 1, 1, 2, 30)) == datetime(
+        2024, 1, 2, 2, 30
+    )
+    assert nightly.next_after(datetime(2024, 1, 1, 1, 0)) == datetime(2024, 1, 1, 2, 30)
+
+    weekdays = CronSchedule("*/15 9-17 * * mon-fri")
+    # Saturday evening -> Monday morning
+    assert weekdays.next_after(datetime(2024, 1, 6, 18, 0)) == datetime(
+        2024, 1, 8, 9, 0
+    )
+
+    leap = CronSchedule("0 0 29 feb *")
+    assert leap.next_after(datetime(2024, 3, 1)) == datetime(2028, 2, 29)
+
+
+def test_cron_day_and_weekday_match_either():
+    schedule = CronSchedule("0 3 1 * sun")
+
+    # 2024-01-07 is a Sunday, 2024-02-01 a Thursday
+    assert schedule.next_after(datetime(2024, 1, 2)) == datetime(2024, 1, 7, 3)
+    assert schedule.next_after(datetime(2024, 1, 29)) == datetime(2024, 2, 1, 3)
+
+
+@pytest.mark.parametrize(
+    "expression", ["* * * *", "60 * * * *", "0 0 30 2 *", "0 0 * * */0"]
+)
+def test_invalid_cron_is_rejected(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+def make_scheduler(tmp_path, clock, jobs, failing=(), **schedule):
+    config = {
+        "backup": {
+            "directories": [
+                {"source": "/docs"},
+                {"source": "/photos", "schedule": "0 3 * * sun"},
+            ],
+            "schedule": {
+                "cron": "0 2 * * *",
+                "state_file": str(tmp_path / "schedule.json"),
+                **schedule,
+            },
+        }
+    }
+
+    def run_job(sources):
+        jobs.append(sources)
+        return [source for source in sources if source not in failing]
+
+    return Scheduler(config, run_job, clock=clock, sleep=clock.sleep)
+
+
+def test_per_directory_schedules(tmp_path):
+    # Monday 2024-01-01
+    clock = FakeClock(datetime(2024, 1, 1, 12, 0))
+    jobs = []
+    scheduler = make_scheduler(tmp_path, clock, jobs)
+
+    # Nothing recorded yet: everything runs on the first start
+    assert scheduler.run_pending() == ["/docs", "/photos"]
+    assert scheduler.run_pending() == []
+    assert scheduler.seconds_until_next() == 14 * 3600
+
+    for _ in range(7):
+        clock.sleep(scheduler.seconds_until_next())
+        scheduler.run_pending()
+
+    assert jobs[1:] == [["/docs"]] * 6 + [["/photos"]]
+
+
+def test_missed_runs_catch_up_once_on_startup(tmp_path):
+    clock = FakeClock(datetime(2024, 1, 1, 2, 0))
+    jobs = []
+    make_scheduler(tmp_path, clock, jobs).run_pending()
+
+    # The host slept through three nightly runs
+    clock.now = datetime(2024, 1, 4, 9, 0)
+    scheduler = make_scheduler(tmp_path, clock, jobs)
+
+    assert scheduler.run_pending() == ["/docs"]
+    assert scheduler.run_pending() == []
+    state = json.loads((tmp_path / "schedule.json").read_text())
+    assert state["last_runs"]["/docs"] == "2024-01-04T09:00:00"
+
+
+def test_catch_up_can_be_disabled(tmp_path):
+    clock = FakeClock(datetime(2024, 1, 1, 2, 0))
+    jobs = []
+    make_scheduler(tmp_path, clock, jobs).run_pending()
+
+    clock.now = datetime(2024, 1, 4, 9, 0)
+    scheduler = make_scheduler(tmp_path, clock, jobs, catch_up=False)
+
+    assert scheduler.run_pending() == []
+
+
+def test_failed_directories_are_retried(tmp_path):
+    clock = FakeClock(datetime(2024, 1, 1, 2, 0))
+    jobs = []
+    scheduler = make_scheduler(
+        tmp_path, clock, jobs, failing=["/photos"], retry_minutes=30
+    )
+
+    assert scheduler.run_pending() == ["/docs", "/photos"]
+    assert scheduler.run_pending() == []
+    assert scheduler.seconds_until_next() == 30 * 60
+    state = json.loads((tmp_path / "schedule.json").read_text())
+    assert list(state["last_runs"]) == ["/docs"]
+
+    # Still not recorded, so a restart catches up on it right away
+    restarted = make_scheduler(tmp_path, clock, jobs)
+    assert restarted.run_pending() == ["/photos"]
+
+
+def test_retries_stop_until_the_next_scheduled_run(tmp_path):
+    clock = FakeClock(datetime(2024, 1, 1, 2, 0))
+    jobs = []
+    scheduler = make_scheduler(
+        tmp_path, clock, jobs, failing=["/docs"], retry_minutes=60, max_retries=3
+    )
+
+    while clock.now < datetime(2024, 1, 1, 14, 0):
+        if not scheduler.run_pending():
+            clock.sleep(scheduler.seconds_until_next())
+
+    # The first run and three retries, then nothing until the next night
+    assert [job for job in jobs if "/docs" in job] == [["/docs", "/photos"]] + [
+        ["/docs"]
+    ] * 3
+    assert scheduler.retry_at["/docs"] == datetime(2024, 1, 2, 2, 0)
+
+
+def test_directories_completed_with_errors_are_not_retried(tmp_path):
+    from src.orchestrator import BackupOrchestrator
+
+    config = {
+        "nas": {
+            "ip": "10.0.0.1",
+            "username": "admin",
+            "mac_address": "00:11:22:33:44:55",
+            "mount": {"type": "cifs", "local_path": str(tmp_path / "nas")},
+        },
+        "backup": {
+            "directories": [
+                {"source": "/docs", "destination": str(tmp_path / "nas")},
+                {"source": "/photos", "destination": str(tmp_path / "nas")},
+            ]
+        },
+    }
+    orchestrator = BackupOrchestrator(config)
+    stats = BackupStats()
+    for source, status in (("/docs", "completed_with_errors"), ("/photos", "skipped")):
+        stats.directories[source] = DirectoryStats(
+            source=source, files_transferred=0, size_bytes=0, status=status
+        )
+    clock = FakeClock(datetime(2024, 1, 1, 2, 0))
+    jobs = []
+
+    def run_job(sources):
+        jobs.append(sources)
+        return orchestrator._backed_up(stats, sources)
+
+    scheduler = Scheduler(
+        {"backup": {**config["backup"], "schedule": "0 2 * * *"}},
+        run_job,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+    scheduler.run_pending()
+    clock.sleep(scheduler.seconds_until_next())
+
+    assert clock.now == datetime(2024, 1, 2, 2, 0)
+    assert scheduler.retry_at == {}
+    assert jobs == [["/docs", "/photos"]]
+
+
+def test_jitter_delays_the_job(tmp_path):
+    clock = FakeClock(datetime(2024, 1, 1, 2, 0))
+    jobs = []
+    scheduler = make_scheduler(tmp_path, clock, jobs, jitter_minutes=10)
+
+    scheduler.run_pending()
+
+    assert datetime(2024, 1, 1, 2, 0) <= clock.now <= datetime(2024, 1, 1, 2, 10)
+    assert scheduler.last_runs["/docs"] == clock.now
+
+
+def test_job_lock_prevents_overlap(tmp_path):
+    lock_file = tmp_path / "backup.lock"
+    with JobLock(lock_file):
+        with pytest.raises(JobLocked):
+            with JobLock(lock_file):
+                pass
+    # Released again
+    with JobLock(lock_file):
+        pass
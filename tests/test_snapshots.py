@@ -0,0 +1,118 @@
+from datetime import datetime
+
+import pytest
+
+from src.backup_manager import BackupManager
+from src.snapshots import INCOMPLETE, SnapshotSet, snapshots_to_keep
+
+
+def test_retention_keeps_newest_per_period():
+    names = [
+        "2024-01-01_020000",
+        "2024-01-31_020000",
+        "2024-02-14_020000",
+        "2024-02-28_020000",
+        "2024-02-29_020000",
+        "2024-02-29_140000",
+    ]
+
+    keep = snapshots_to_keep(names, {"last": 1, "daily": 2, "monthly": 2})
+
+    assert keep == {"2024-02-29_140000", "2024-02-28_020000", "2024-01-31_020000"}
+
+
+def test_unknown_retention_rule_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="hourly"):
+        SnapshotSet(tmp_path, {"retention": {"hourly": 24}})
+
+
+def test_finish_and_prune(tmp_path):
+    snapshots = SnapshotSet(tmp_path, {"retention": {"last": 2}})
+    for day in (1, 2, 3):
+        snapshots.incomplete.mkdir()
+        (snapshots.incomplete / "file.txt").write_text(str(day))
+        snapshots.finish(datetime(2024, 1, day, 2))
+
+    assert snapshots.prune(dry_run=True) == ["2024-01-01_020000"]
+    assert snapshots.prune() == ["2024-01-01_020000"]
+    assert snapshots.names() == ["2024-01-02_020000", "2024-01-03_020000"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == snapshots.names()
+
+
+def test_backup_creates_linked_snapshots(monkeypatch, tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    destination = tmp_path / "dest"
+    config = {
+        "backup": {
+            "directories": [
+                {
+                    "source": str(source),
+                    "destination": str(destination),
+                    "snapshots": {"retention": {"last": 5}},
+                }
+            ]
+        }
+    }
+    commands = []
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        commands.append(cmd)
+        on_line("Total file size: 1,000 bytes")
+        on_line("Total transferred file size: 100 bytes")
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    manager = BackupManager(config)
+
+    # The fake rsync doesn't create the target, so stand in for it
+    (destination / INCOMPLETE).mkdir(parents=True)
+    first = manager.run_backup().directories[str(source)]
+    (destination / INCOMPLETE).mkdir()
+    second = manager.run_backup().directories[str(source)]
+
+    assert commands[0][-1] == str(destination / INCOMPLETE)
+    assert not any(arg.startswith("--link-dest") for arg in commands[0])
+    assert f"--link-dest=../{first.snapshot}" in commands[1]
+    assert second.snapshot != first.snapshot
+    assert second.linked_bytes == 900
+    assert SnapshotSet(destination).names() == sorted([first.snapshot, second.snapshot])
+
+
+def test_snapshots_need_the_mount_transport(tmp_path):
+    config = {
+        "nas": {"transport": {"type": "ssh"}},
+        "backup": {
+            "directories": [
+                {
+                    "source": str(tmp_path),
+                    "destination": str(tmp_path / "dest"),
+                    "snapshots": True,
+                }
+            ]
+        },
+    }
+
+    with pytest.raises(ValueError, match="mount transport"):
+        BackupManager(config)
+
+
+@pytest.mark.parametrize(
+    "profile", ["photos-large-files", {"extra_args": ["--inplace"]}]
+)
+def test_snapshots_reject_inplace_profiles(tmp_path, profile):
+    config = {
+        "backup": {
+            "directories": [
+                {
+                    "source": str(tmp_path),
+                    "destination": str(tmp_path / "dest"),
+                    "snapshots": True,
+                    "profile": profile,
+                }
+            ]
+        },
+    }
+
+    with pytest.raises(ValueError, match="inplace"):
+        BackupManager(config)
@@ -0,0 +1,206 @@
+import threading
+from pathlib import Path
+
+import pytest
+import yaml
+
+from src.change_index import scan_tree
+from src.dedup import store_for
+from src.email_sender import EmailSender
+from src.nas_controller import NASController
+from src.orchestrator import BackupOrchestrator
+from src.targets import load_targets
+
+
+def make_config(tmp_path):
+    source = tmp_path / "docs"
+    source.mkdir()
+    (source / "a.txt").write_text("data")
+    return {
+        "nas": {
+            "ip": "192.168.1.100",
+            "username": "admin",
+            "mac_address": "00:11:22:33:44:55",
+            "mount": {"type": "cifs", "local_path": str(tmp_path / "primary")},
+        },
+        "targets": [
+            {"name": "primary"},
+            {
+                "name": "offsite",
+                "nas": {
+                    "ip": "10.0.0.2",
+                    "mac_address": "66:77:88:99:aa:bb",
+                    "mount": {"type": "nfs", "local_path": str(tmp_path / "offsite")},
+                },
+            },
+        ],
+        "backup": {
+            "directories": [
+                {
+                    "source": str(source),
+                    "destination": str(tmp_path / "primary" / "docs"),
+                }
+            ],
+            "change_index": {"path": str(tmp_path / "index")},
+            "schedule": {"lock_file": str(tmp_path / "lock")},
+        },
+        "email": {},
+    }
+
+
+def test_load_targets(tmp_path):
+    config = make_config(tmp_path)
+
+    primary, offsite = load_targets(config)
+
+    assert primary.config["nas"]["ip"] == "192.168.1.100"
+    assert offsite.config["nas"]["ip"] == "10.0.0.2"
+    assert offsite.config["nas"]["username"] == "admin"
+    assert offsite.config["backup"]["directories"][0]["destination"] == str(
+        tmp_path / "offsite" / "docs"
+    )
+    assert offsite.config["backup"]["change_index"]["path"] == str(
+        tmp_path / "index" / "offsite"
+    )
+    # The original config is left alone
+    assert config["backup"]["change_index"]["path"] == str(tmp_path / "index")
+    assert load_targets({"nas": config["nas"], "backup": config["backup"]}) == []
+
+
+def test_dedup_stores_move_to_each_target(tmp_path):
+    config = make_config(tmp_path)
+    config["backup"]["dedup"] = {"path": str(tmp_path / "idx")}
+    config["backup"]["directories"][0]["dedup"] = {
+        "store": str(tmp_path / "primary" / "chunks")
+    }
+
+    stores = [
+        store_for(t.config["backup"]["dedup"], t.config["backup"]["directories"][0])
+        for t in load_targets(config)
+    ]
+
+    assert [store.root for store in stores] == [
+        tmp_path / "primary" / "chunks",
+        tmp_path / "offsite" / "chunks",
+    ]
+    assert stores[1].index_path.parent == tmp_path / "idx" / "offsite"
+
+    config["backup"]["directories"][0]["dedup"]["store"] = "/elsewhere/chunks"
+    with pytest.raises(ValueError, match="Dedup store /elsewhere/chunks"):
+        load_targets(config)
+
+
+def test_documented_targets_mount_with_the_shared_settings(monkeypatch, tmp_path):
+    sample = Path(__file__).parent.parent / "config" / "backup_config.yaml"
+    lines = sample.read_text().splitlines()
+    start = lines.index(
+        "# targets:                   # back up to several NAS, see README"
+    )
+    example = []
+    for line in lines[start:]:
+        if not line.startswith("#"):
+            break
+        example.append(line[2:])
+    config = yaml.safe_load(sample.read_text())
+    config.update(yaml.safe_load("\n".join(example)))
+    commands = []
+    monkeypatch.setattr(
+        "src.nas_controller.run_command", lambda cmd, *a, **kw: commands.append(cmd)
+    )
+
+    primary, offsite = load_targets(config)
+    for target in (primary, offsite):
+        controller = NASController(target.config, dry_run=True)
+        controller.mount_point = tmp_path / target.name
+        controller._mount_nas()
+
+    assert commands[1] == [
+        "mount",
+        "-t",
+        "nfs",
+        "-o",
+        "vers=3",
+        "10.8.0.20:/volume1",
+        str(tmp_path / "offsite"),
+    ]
+    assert offsite.config["nas"]["ssh"] == config["nas"]["ssh"]
+    assert offsite.config["nas"]["boot"]["timeout"] == 300
+
+
+def test_targets_learn_their_own_boot_times(tmp_path):
+    config = make_config(tmp_path)
+    config["nas"]["boot"] = {"state_file": str(tmp_path / "state" / "boot.json")}
+
+    controllers = [NASController(t.config) for t in load_targets(config)]
+    controllers[0]._record_boot_time(40.0)
+    controllers[1]._record_boot_time(90.0)
+
+    assert [c._boot_config()["state_file"] for c in controllers] == [
+        str(tmp_path / "state" / "primary" / "boot.json"),
+        str(tmp_path / "state" / "offsite" / "boot.json"),
+    ]
+    assert [c._load_boot_times() for c in controllers] == [[40.0], [90.0]]
+    assert [p.name for p in (tmp_path / "state" / "offsite").iterdir()] == ["boot.json"]
+
+    config["targets"][1]["nas"]["boot"] = {"state_file": str(tmp_path / "own.json")}
+    offsite = load_targets(config)[1]
+    assert offsite.config["nas"]["boot"]["state_file"] == str(tmp_path / "own.json")
+
+
+def test_target_names_must_be_unique(tmp_path):
+    config = make_config(tmp_path)
+    config["targets"][1]["name"] = "primary"
+
+    with pytest.raises(ValueError, match="unique name"):
+        load_targets(config)
+
+
+def test_fanout_scans_once_and_isolates_failing_targets(monkeypatch, tmp_path):
+    config = make_config(tmp_path)
+    primary_done = threading.Event()
+    scans, rsync_targets, reports = [], [], []
+
+    def start_nas(controller):
+        if controller.config["nas"]["ip"] == "10.0.0.2":
+            # The offsite NAS is slow and then fails; the primary mustn't wait
+            assert primary_done.wait(timeout=5)
+            raise RuntimeError("offsite NAS did not wake up")
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        rsync_targets.append(cmd[-1])
+        on_line("Number of regular files transferred: 1")
+        return ""
+
+    def counting_scan_tree(path):
+        scans.append(path)
+        return scan_tree(path)
+
+    monkeypatch.setattr(NASController, "start_nas", start_nas)
+    monkeypatch.setattr(NASController, "run_hooks", lambda self, stage: None)
+    monkeypatch.setattr(NASController, "shutdown_nas", lambda self: primary_done.set())
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    monkeypatch.setattr("src.backup_manager.scan_tree", counting_scan_tree)
+    orchestrator = BackupOrchestrator(config)
+    monkeypatch.setattr(
+        orchestrator.email_sender,
+        "send_report",
+        lambda stats, report=None: reports.append(stats),
+    )
+
+    assert orchestrator.run_backup_job() is False
+
+    stats = reports[0]
+    assert len(reports) == 1
+    assert len(scans) == 1
+    assert rsync_targets == [str(tmp_path / "primary" / "docs")]
+    assert stats.status == "partial"
+    assert stats.targets["primary"].status == "success"
+    assert stats.targets["offsite"].status == "failed"
+    assert "did not wake up" in stats.error
+    source = config["backup"]["directories"][0]["source"]
+    assert stats.directories[f"primary:{source}"].files_transferred == 1
+    # Not on every target yet, so the scheduler doesn't record it as done
+    assert orchestrator.backed_up == []
+    body = EmailSender({}, dry_run=True)._generate_report_body(stats)
+    assert "offsite: failed, 0 files" in body
+    assert f"Directory: {source} -> primary" in body
@@ -0,0 +1,117 @@
+import sys
+import time
+from datetime import datetime
+
+import pytest
+import yaml
+
+from src import backup_manager
+from src.backup_manager import BackupManager
+from src.throttle import Throttle
+from src.utils import DeadlineReached, stream_command
+
+WINDOWS = {
+    "windows": [
+        {"start": "06:00", "end": "22:00", "bwlimit": "20M", "nice": 10},
+        {"start": "22:00", "end": "01:00", "bwlimit": "50M"},
+    ]
+}
+
+
+def test_window_at_handles_windows_across_midnight():
+    throttle = Throttle(WINDOWS)
+
+    assert throttle.window_at(datetime(2024, 1, 1, 3)) is None
+    assert throttle.window_at(datetime(2024, 1, 1, 12)).bwlimit == "20M"
+    assert throttle.window_at(datetime(2024, 1, 1, 23)).bwlimit == "50M"
+    assert throttle.window_at(datetime(2024, 1, 1, 0, 30)).bwlimit == "50M"
+
+
+def test_next_change():
+    throttle = Throttle(WINDOWS)
+
+    assert throttle.next_change(datetime(2024, 1, 1, 3)) == datetime(2024, 1, 1, 6)
+    assert throttle.next_change(datetime(2024, 1, 1, 23)) == datetime(2024, 1, 2, 1)
+    assert (
+        Throttle({"windows": [{"bwlimit": "1M"}]}).next_change(datetime.now()) is None
+    )
+
+
+def test_unquoted_yaml_times():
+    config = yaml.safe_load("windows: [{start: 06:00, end: 22:30, bwlimit: 5M}]")
+
+    window = Throttle(config).windows[0]
+
+    assert (window.start.hour, window.end.hour, window.end.minute) == (6, 22, 30)
+
+
+def test_apply_wraps_the_command():
+    throttle = Throttle(WINDOWS)
+    cmd = ["rsync", "-a", "--bwlimit=100M", "/src", "/dest"]
+
+    limited, deadline = throttle.apply(cmd, datetime(2024, 1, 1, 12))
+
+    assert limited == [
+        "nice",
+        "-n",
+        "10",
+        "rsync",
+        "-a",
+        "--bwlimit=100M",
+        "--bwlimit=20M",
+        "/src",
+        "/dest",
+    ]
+    assert deadline == pytest.approx(time.monotonic() + 10 * 3600, abs=5)
+    assert throttle.apply(cmd, datetime(2024, 1, 1, 3))[0] == cmd
+
+
+@pytest.mark.parametrize(
+    "window",
+    [{"bwlimit": "fast"}, {"ionice": "low"}, {"nice": 20}, {"start": "25:00"}],
+)
+def test_invalid_windows_are_rejected(window):
+    with pytest.raises(ValueError):
+        Throttle({"windows": [window]})
+
+
+def test_stream_command_stops_at_the_deadline():
+    cmd = [
+        sys.executable,
+        "-c",
+        "import time; print('started', flush=True); time.sleep(30)",
+    ]
+    lines = []
+    started = time.monotonic()
+
+    with pytest.raises(DeadlineReached):
+        stream_command(cmd, "failed", lines.append, deadline=time.monotonic() + 0.5)
+
+    assert lines == ["started"]
+    assert time.monotonic() - started < 10
+
+
+def test_rsync_restarts_when_the_window_changes(monkeypatch, tmp_path):
+    config = {
+        "backup": {
+            "throttle": {"windows": [{"bwlimit": "20M"}]},
+            "directories": [
+                {"source": str(tmp_path / "src"), "destination": str(tmp_path / "dest")}
+            ],
+        }
+    }
+    calls = []
+
+    def fake_stream_command(cmd, error_msg, on_line, **kwargs):
+        calls.append(cmd)
+        if len(calls) == 1:
+            raise DeadlineReached("stopped", -15, "", "")
+        on_line("Number of regular files transferred: 2")
+
+    monkeypatch.setattr(backup_manager, "stream_command", fake_stream_command)
+
+    stats = BackupManager(config).run_backup()
+
+    assert len(calls) == 2
+    assert all("--bwlimit=20M" in cmd for cmd in calls)
+    assert stats.directories[str(tmp_path / "src")].files_transferred == 2
@@ -0,0 +1,56 @@
+import sys
+
+from src.backup_manager import BackupManager
+from src.models import DirectoryStats
+from src.timing import Tracer, span
+from src.utils import run_command
+
+
+def test_span_without_tracer_is_noop():
+    with span("orphan") as timing:
+        assert timing is None
+
+
+def test_spans_nest_and_time_commands():
+    tracer = Tracer()
+    with tracer.activate():
+        with span("backup"):
+            with span("directory:/src"):
+                run_command([sys.executable, "-c", "pass"], "Failed")
+        with span("email"):
+            pass
+
+    names = [(t.name, t.parent, t.depth) for t in tracer.spans]
+    assert names == [
+        ("backup", None, 0),
+        ("directory:/src", "backup", 1),
+        (f"command:{sys.executable.rsplit('/', 1)[-1]}", "directory:/src", 2),
+        ("email", None, 0),
+    ]
+    assert all(t.duration_seconds >= 0 for t in tracer.spans)
+    assert tracer.spans[0].duration_seconds >= tracer.spans[1].duration_seconds
+
+
+def test_spans_follow_worker_threads(tmp_path):
+    directories = [
+        {"source": f"/src{i}", "destination": str(tmp_path / f"d{i}")} for i in range(2)
+    ]
+    manager = BackupManager(
+        {"backup": {"directories": directories, "parallel": {"max_workers": 2}}}
+    )
+    manager._backup_directory = (
+        lambda source, destination, dir_config=None, prepared=None: DirectoryStats(
+            source=source, files_transferred=0, size_bytes=0
+        )
+    )
+
+    tracer = Tracer()
+    with tracer.activate(), span("backup"):
+        manager.run_backup()
+
+    directory_spans = [t for t in tracer.spans if t.name.startswith("directory:")]
+    assert sorted(t.name for t in directory_spans) == [
+        "directory:/src0",
+        "directory:/src1",
+    ]
+    assert all(t.parent == "backup" for t in directory_spans)
@@ -0,0 +1,113 @@
+import pytest
+
+from src.backup_manager import BackupManager
+from src.nas_controller import NASController
+from src.transport import Transport
+
+
+def _nas(transport=None):
+    nas = {
+        "ip": "192.168.1.100",
+        "username": "backup",
+        "password": "secret",
+        "mac_address": "00:11:22:33:44:55",
+        "mount": {"remote_path": "volume1", "local_path": "/mnt/nas-backup"},
+    }
+    if transport:
+        nas["transport"] = transport
+    return nas
+
+
+def test_mount_transport_keeps_local_destination():
+    transport = Transport(_nas())
+
+    assert not transport.remote
+    assert transport.requires_mount
+    assert transport.destination("/mnt/nas-backup/docs") == "/mnt/nas-backup/docs"
+    assert transport.rsync_args() == []
+    assert transport.env() == {}
+
+
+def test_ssh_transport():
+    transport = Transport(
+        _nas({"type": "ssh", "ssh_options": ["-i", "/keys/nas"], "mkpath": True})
+    )
+
+    assert transport.remote
+    assert (
+        transport.destination("/mnt/nas-backup/docs/")
+        == "backup@192.168.1.100:/volume1/docs"
+    )
+    assert transport.rsync_args() == [
+        "--rsh=ssh -p 22 -o BatchMode=yes -i /keys/nas",
+        "--mkpath",
+    ]
+    assert transport.env() == {}
+
+
+def test_rsync_daemon_transport():
+    transport = Transport(_nas({"type": "rsync_daemon", "module": "backups"}))
+
+    assert (
+        transport.destination("/mnt/nas-backup/photos/2024")
+        == "rsync://backup@192.168.1.100/backups/photos/2024"
+    )
+    assert transport.env() == {"RSYNC_PASSWORD": "secret"}
+
+    transport = Transport(
+        _nas({"type": "rsync_daemon", "port": 8730, "password_file": "/etc/pw"})
+    )
+    assert transport.destination("/mnt/nas-backup") == (
+        "rsync://backup@192.168.1.100:8730/volume1/"
+    )
+    assert transport.rsync_args() == ["--password-file=/etc/pw"]
+    assert transport.env() == {}
+
+
+def test_transport_rejects_unmapped_destinations():
+    with pytest.raises(ValueError, match="not below the NAS mount point"):
+        Transport(_nas({"type": "ssh"})).destination("/srv/elsewhere")
+    with pytest.raises(ValueError, match="Unsupported transport"):
+        Transport(_nas({"type": "ftp"}))
+
+
+def test_backup_directory_over_ssh(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_stream_command(cmd, error_msg, on_line, env=None, **kwargs):
+        calls.append((cmd, env))
+        on_line("Number of regular files transferred: 2")
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_stream_command)
+    log_dir = tmp_path / "logs"
+    config = {
+        "nas": _nas({"type": "ssh", "log_dir": str(log_dir)}),
+        "backup": {"directories": []},
+    }
+
+    dir_stats = BackupManager(config)._backup_directory(
+        "/home/user/docs", "/mnt/nas-backup/docs"
+    )
+
+    cmd, env = calls[0]
+    assert cmd[-2:] == ["/home/user/docs", "backup@192.168.1.100:/volume1/docs"]
+    assert "--rsh=ssh -p 22 -o BatchMode=yes" in cmd
+    log_arg = next(c for c in cmd if c.startswith("--log-file="))
+    assert log_arg.startswith(f"--log-file={log_dir}/rsync_errors_mnt_nas-backup_docs_")
+    assert env == {}
+    assert dir_stats.files_transferred == 2
+    assert not (tmp_path / "mnt").exists()
+
+
+def test_nas_controller_skips_mount_for_remote_transport(tmp_path):
+    nas = _nas({"type": "rsync_daemon"})
+    nas["mount"]["local_path"] = str(tmp_path / "mnt")
+    controller = NASController({"nas": nas})
+    controller._check_nas_connection = lambda: True
+
+    def fail():
+        raise AssertionError("NAS must not be mounted")
+
+    controller._mount_nas = fail
+    controller.start_nas()
@@ -1,6 +1,8 @@
+import sys
+
 import pytest
 
-from src.utils import format_size
+from src.utils import CommandError, command_name, format_size, stream_command
 
 
 @pytest.mark.parametrize(
@@ -18,3 +20,49 @@ from src.utils import format_size
 )
 def test_format_size(bytes_value, expected):
     assert format_size(bytes_value) == expected
+
+
+def test_stream_command_hands_over_lines():
+    lines = []
+    cmd = [sys.executable, "-c", "print('first'); print('second')"]
+
+    stderr = stream_command(cmd, "Echo failed", lines.append)
+
+    assert lines == ["first", "second"]
+    assert stderr == ""
+
+
+def test_stream_command_raises_on_failure():
+    lines = []
+    cmd = [
+        sys.executable,
+        "-c",
+        "import sys; print('partial'); sys.stderr.write('boom'); sys.exit(23)",
+    ]
+
+    with pytest.raises(CommandError) as exc_info:
+        stream_command(cmd, "Command failed", lines.append)
+
+    assert lines == ["partial"]
+    assert exc_info.value.returncode == 23
+    assert exc_info.value.stderr == "boom"
+    assert str(exc_info.value) == "Command failed: boom"
+
+
+def test_stream_command_dry_run():
+    lines = []
+    assert stream_command(["false"], "Failed", lines.append, dry_run=True) == ""
+    assert lines == []
+
+
+@pytest.mark.parametrize(
+    "cmd",
+    [
+        ["/usr/bin/rsync", "-a", "src", "dst"],
+        ["ionice", "-c", "3", "rsync", "-a", "src", "dst"],
+        ["ionice", "-c", "2", "-n", "7", "nice", "-n", "19", "rsync", "-a"],
+        ["nice", "-n", "10", "/usr/bin/rsync"],
+    ],
+)
+def test_command_name_looks_through_wrappers(cmd):
+    assert command_name(cmd) == "rsync"
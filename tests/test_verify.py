@@ -0,0 +1,141 @@
+import os
+import shutil
+import time
+from datetime import datetime
+
+import pytest
+
+from src.backup_manager import BackupManager
+from src.email_sender import EmailSender
+from src.models import BackupStats, DirectoryStats
+from src.verify import Verifier, VerifyResult, list_files, sample_files
+
+
+@pytest.fixture
+def synced(tmp_path):
+    source = tmp_path / "src"
+    for rel, data in (("a.txt", "a"), ("sub/b.txt", "bb"), ("sub/c.txt", "ccc")):
+        (source / rel).parent.mkdir(parents=True, exist_ok=True)
+        (source / rel).write_text(data)
+    destination = tmp_path / "dest"
+    shutil.copytree(source, destination)
+    return source, destination
+
+
+def test_full_verification_finds_mismatches(synced):
+    source, destination = synced
+    (destination / "a.txt").write_text("x")
+    os.utime(destination / "a.txt", ns=(0, os.stat(source / "a.txt").st_mtime_ns))
+    (destination / "sub" / "b.txt").unlink()
+    (source / "sub" / "c.txt").write_text("changed after the backup")
+    os.utime(source / "sub" / "c.txt", (time.time() + 60, time.time() + 60))
+
+    result = Verifier({"mode": "full"}).verify(str(source), str(destination))
+
+    assert result.mismatches == ["a.txt"]
+    assert result.missing == [os.path.join("sub", "b.txt")]
+    assert result.skipped == 1
+    assert result.files_checked == 2
+    assert result.failed
+
+
+def test_sample_mode_checks_a_subset(synced):
+    source, destination = synced
+
+    result = Verifier({"sample_files": 2}).verify(str(source), str(destination))
+
+    assert result.mode == "sample"
+    assert result.files_checked == 2
+    assert not result.failed
+
+
+def test_full_mode_on_scheduled_days():
+    verifier = Verifier({"mode": "sample", "full_on": ["Sunday"]})
+
+    assert verifier.mode_for(datetime(2024, 1, 7)) == "full"
+    assert verifier.mode_for(datetime(2024, 1, 8)) == "sample"
+
+
+def test_size_weighted_sampling_prefers_large_files():
+    files = [(f"small{i}", 1) for i in range(100)] + [("huge", 10**9)]
+
+    assert ("huge", 10**9) in sample_files(files, 1, by="size")
+    assert sorted(sample_files(files, 200)) == sorted(files)
+
+
+def test_throttle_and_time_budget(synced):
+    source, destination = synced
+    (source / "big.bin").write_bytes(b"x" * 200_000)
+    shutil.copy2(source / "big.bin", destination / "big.bin")
+    files = [("big.bin", 200_000)] + list_files(str(source))
+
+    started = time.monotonic()
+    result = Verifier(
+        {"mode": "full", "workers": 1, "max_mb_per_second": 0.5, "max_seconds": 0.1}
+    ).verify(str(source), str(destination), files=files)
+
+    # Reading 400 kB at 0.5 MiB/s takes ~0.4s, after which the budget is spent
+    assert time.monotonic() - started >= 0.3
+    assert result.files_checked == 1
+    assert not result.complete
+
+
+def test_backup_verifies_directories(monkeypatch, tmp_path):
+    source = tmp_path / "docs"
+    source.mkdir()
+    (source / "a.txt").write_text("data")
+    config = {
+        "backup": {
+            "directories": [
+                {"source": str(source), "destination": str(tmp_path / "dest")}
+            ],
+            "verify": {"mode": "full"},
+        }
+    }
+
+    def fake_rsync(cmd, error_msg, on_line, **kwargs):
+        shutil.copytree(cmd[-2], os.path.join(cmd[-1], "docs"))
+        # Corrupt the copy, as a failing disk might
+        with open(os.path.join(cmd[-1], "docs", "a.txt"), "r+") as f:
+            f.write("D")
+        return ""
+
+    monkeypatch.setattr("src.backup_manager.stream_command", fake_rsync)
+
+    dir_stats = BackupManager(config).run_backup().directories[str(source)]
+
+    assert dir_stats.verification.mismatches == ["a.txt"]
+    assert dir_stats.status == "completed_with_errors"
+
+
+def test_verify_can_be_disabled_per_directory(tmp_path):
+    config = {
+        "backup": {
+            "directories": [{"source": str(tmp_path), "destination": "/x"}],
+            "verify": {"mode": "full"},
+        }
+    }
+    manager = BackupManager(config)
+
+    assert manager._verifier({"verify": False}) is None
+    assert manager._verifier({"verify": {"sample_files": 5}}).mode == "full"
+
+
+def test_report_lists_verification_failures():
+    stats = BackupStats(
+        directories={
+            "/docs": DirectoryStats(
+                source="/docs",
+                files_transferred=1,
+                size_bytes=1,
+                verification=VerifyResult(
+                    mode="sample", files_checked=10, mismatches=["a.txt"]
+                ),
+            )
+        }
+    )
+
+    report = EmailSender({}, dry_run=True)._generate_report_body(stats)
+
+    assert "Verification: 10 files checked (sample), 1 mismatched" in report
+    assert "  Mismatch: a.txt" in report